@@ -0,0 +1,57 @@
+"""Benchmark for STON.create_map: compares the default CREATE path with the
+batched UNWIND path (bulk=True), in nodes per second.
+
+Usage:
+
+    python benchmarks/bench_create_map.py -a <uri> -u <user> -p <password> <sbgn_file>...
+
+WARNING: the maps are created and deleted in the target database.
+"""
+
+import argparse
+import time
+
+import stonpy
+import stonpy.utils as utils
+import stonpy.conversion as conversion
+
+MAP_ID = "__stonpy_bench_create_map__"
+
+
+def bench_create_map(ston, sbgn_map, bulk, repeat):
+    n_nodes = len(conversion.map_to_subgraph(sbgn_map, MAP_ID).nodes)
+    timings = []
+    for _ in range(repeat):
+        ston.delete_map(MAP_ID)
+        start = time.perf_counter()
+        ston.create_map(sbgn_map, MAP_ID, bulk=bulk)
+        timings.append(time.perf_counter() - start)
+    ston.delete_map(MAP_ID)
+    best = min(timings)
+    return n_nodes, best, n_nodes / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("-a", "--uri", default=None)
+    parser.add_argument("-u", "--user", default=None)
+    parser.add_argument("-p", "--password", default=None)
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("sbgn_files", nargs="+")
+    args = parser.parse_args()
+    ston = stonpy.STON(args.uri, args.user, args.password)
+    print(f"{'file':<40} {'nodes':>8} {'path':>8} {'time (s)':>10} {'nodes/s':>10}")
+    for sbgn_file in args.sbgn_files:
+        sbgn_map = utils.sbgn_file_to_map(sbgn_file)
+        for bulk in [False, True]:
+            n_nodes, best, rate = bench_create_map(
+                ston, sbgn_map, bulk, args.repeat
+            )
+            path = "unwind" if bulk else "create"
+            print(
+                f"{sbgn_file[-40:]:<40} {n_nodes:>8} {path:>8} {best:>10.3f} {rate:>10.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Benchmark for STON.get_map: retrieval latency against map size, with APOC
+(if installed) and without APOC (layered retrieval).
+
+Usage:
+
+    python benchmarks/bench_get_map.py -a <uri> -u <user> -p <password> <sbgn_file>...
+
+WARNING: the maps are created and deleted in the target database.
+"""
+
+import argparse
+import time
+
+import stonpy
+import stonpy.utils as utils
+import stonpy.conversion as conversion
+import stonpy.queries as queries
+
+MAP_ID = "__stonpy_bench_get_map__"
+
+
+def has_apoc(ston):
+    try:
+        queries.run(ston.graph, "get_map_apoc", {"map_id": MAP_ID})
+    except Exception:
+        return False
+    return True
+
+
+def bench_get_map(ston, use_apoc, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ston.get_map(MAP_ID, use_apoc=use_apoc)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("-a", "--uri", default=None)
+    parser.add_argument("-u", "--user", default=None)
+    parser.add_argument("-p", "--password", default=None)
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("sbgn_files", nargs="+")
+    args = parser.parse_args()
+    ston = stonpy.STON(args.uri, args.user, args.password)
+    apoc = has_apoc(ston)
+    print(f"{'file':<40} {'nodes':>8} {'apoc (s)':>10} {'layers (s)':>10}")
+    for sbgn_file in args.sbgn_files:
+        sbgn_map = utils.sbgn_file_to_map(sbgn_file)
+        n_nodes = len(conversion.map_to_subgraph(sbgn_map, MAP_ID).nodes)
+        ston.delete_map(MAP_ID)
+        ston.create_map(sbgn_map, MAP_ID)
+        if apoc:
+            apoc_time = f"{bench_get_map(ston, True, args.repeat):>10.3f}"
+        else:
+            apoc_time = f"{'n/a':>10}"
+        layers_time = bench_get_map(ston, False, args.repeat)
+        ston.delete_map(MAP_ID)
+        print(
+            f"{sbgn_file[-40:]:<40} {n_nodes:>8} {apoc_time} {layers_time:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
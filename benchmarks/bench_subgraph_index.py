@@ -0,0 +1,74 @@
+"""Microbenchmark for the lookups of relationships in a growing subgraph, as
+done by completion: scanning with utils.match_one against indexing with
+utils.SubgraphIndex.
+
+A subgraph of n relationships is built one relationship at a time, and each
+relationship is looked up by start node and type right after being added.
+The time of the scans grows quadratically with n, and that of the index
+linearly.
+
+Usage:
+
+    python benchmarks/bench_subgraph_index.py [-r <repeat>] [<n>...]
+"""
+
+import argparse
+import time
+
+from py2neo import Node, Relationship
+
+import stonpy.utils as utils
+
+SIZES = [250, 500, 1000, 2000]
+
+
+def make_relationships(n):
+    nodes = [Node("Glyph", id=str(i)) for i in range(n + 1)]
+    return [
+        Relationship(nodes[i], "HAS_STATE_VARIABLE", nodes[i + 1])
+        for i in range(n)
+    ]
+
+
+def bench_scan(relationships):
+    subgraph = None
+    for relationship in relationships:
+        subgraph = utils.subgraph_union(subgraph, relationship)
+        utils.match_one(
+            subgraph, (relationship.start_node, None), "HAS_STATE_VARIABLE"
+        )
+
+
+def bench_index(relationships):
+    index = utils.SubgraphIndex()
+    for relationship in relationships:
+        index.add(relationship)
+        index.match_one((relationship.start_node, None), "HAS_STATE_VARIABLE")
+
+
+def timeit(func, relationships, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(relationships)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("sizes", nargs="*", type=int, default=SIZES)
+    args = parser.parse_args()
+    print(f"{'n':>8} {'scan (s)':>10} {'index (s)':>10} {'speedup':>8}")
+    for n in args.sizes:
+        relationships = make_relationships(n)
+        scan_time = timeit(bench_scan, relationships, args.repeat)
+        index_time = timeit(bench_index, relationships, args.repeat)
+        print(
+            f"{n:>8} {scan_time:>10.4f} {index_time:>10.4f} {scan_time / index_time:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""Benchmark suite for stonpy: times the main operations of stonpy on the
+given SBGN-ML files and writes the results to a JSON file.
+
+The following benchmarks are run on each file:
+
+- sbgn_file_to_map: parsing the SBGN-ML file
+- map_to_subgraph: converting the map to a subgraph
+- subgraph_to_map: converting the subgraph back to a map
+- map_to_sbgn_file: serializing the map to an SBGN-ML file
+- create_map: creating the map in the database (CREATE and UNWIND paths)
+- get_map: retrieving the map from the database (with and without APOC)
+- query_to_map: querying and completing the stoichiometric processes of the map
+
+The benchmarks that use the database are skipped with --no-db, and are run
+against an in-memory graph (see stonpy.memory) instead of Neo4j with --memory.
+
+Usage:
+
+    python benchmarks/run.py -a <uri> -u <user> -p <password> -o results.json <sbgn_file>...
+    python benchmarks/run.py --memory -o results.json <sbgn_file>...
+    python benchmarks/run.py --no-db -o results.json <sbgn_file>...
+
+WARNING: the maps are created and deleted in the target database.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+
+import stonpy
+import stonpy.utils as utils
+import stonpy.conversion as conversion
+import stonpy.queries as queries
+from stonpy.memory import MemoryGraph
+
+MAP_ID = "__stonpy_bench__"
+
+QUERY = """MATCH (m:Map {id: $map_id})-[:HAS_GLYPH]->(p:StoichiometricProcess)
+RETURN p"""
+
+
+def run_query_in_memory(graph, parameters):
+    # implementation of QUERY for the in-memory graph
+    rows = []
+    for m in graph.match_nodes("Map", id=parameters["map_id"]):
+        for relationship in graph.match((m, None), "HAS_GLYPH"):
+            if relationship.end_node.has_label("StoichiometricProcess"):
+                rows.append([relationship.end_node])
+    return ["p"], rows
+
+
+def timeit(func, repeat, setup=None):
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def summarize(benchmark, sbgn_file, n_nodes, timings):
+    return {
+        "benchmark": benchmark,
+        "file": sbgn_file,
+        "nodes": n_nodes,
+        "repeat": len(timings),
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+    }
+
+
+def has_apoc(ston):
+    try:
+        queries.run(ston.graph, "get_map_apoc", {"map_id": MAP_ID})
+    except Exception:
+        return False
+    return True
+
+
+def bench_conversion(sbgn_file, repeat):
+    sbgn_map = utils.sbgn_file_to_map(sbgn_file)
+    subgraph = conversion.map_to_subgraph(sbgn_map, MAP_ID)
+    n_nodes = len(subgraph.nodes)
+    # subgraph_to_map expects the identities given by the database
+    for identity, node in enumerate(subgraph.nodes):
+        node.identity = identity
+    results = []
+    results.append(
+        (
+            "sbgn_file_to_map",
+            timeit(lambda: utils.sbgn_file_to_map(sbgn_file), repeat),
+        )
+    )
+    results.append(
+        (
+            "map_to_subgraph",
+            timeit(lambda: conversion.map_to_subgraph(sbgn_map, MAP_ID), repeat),
+        )
+    )
+    results.append(
+        (
+            "subgraph_to_map",
+            timeit(lambda: list(conversion.subgraph_to_map(subgraph)), repeat),
+        )
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        output_file = os.path.join(directory, "output.sbgn")
+        results.append(
+            (
+                "map_to_sbgn_file",
+                timeit(
+                    lambda: utils.map_to_sbgn_file(sbgn_map, output_file),
+                    repeat,
+                ),
+            )
+        )
+    return n_nodes, results
+
+
+def bench_database(ston, sbgn_file, repeat, apoc):
+    sbgn_map = utils.sbgn_file_to_map(sbgn_file)
+    results = []
+    for bulk, name in [(False, "create_map[create]"), (True, "create_map[unwind]")]:
+        results.append(
+            (
+                name,
+                timeit(
+                    lambda: ston.create_map(sbgn_map, MAP_ID, bulk=bulk),
+                    repeat,
+                    setup=lambda: ston.delete_map(MAP_ID),
+                ),
+            )
+        )
+    ston.delete_map(MAP_ID)
+    ston.create_map(sbgn_map, MAP_ID, bulk=True)
+    if apoc:
+        results.append(
+            (
+                "get_map[apoc]",
+                timeit(lambda: ston.get_map(MAP_ID, use_apoc=True), repeat),
+            )
+        )
+    results.append(
+        (
+            "get_map[layers]",
+            timeit(lambda: ston.get_map(MAP_ID, use_apoc=False), repeat),
+        )
+    )
+    results.append(
+        (
+            "query_to_map",
+            timeit(
+                lambda: list(
+                    ston.query_to_map(QUERY, parameters={"map_id": MAP_ID})
+                ),
+                repeat,
+            ),
+        )
+    )
+    ston.delete_map(MAP_ID)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("-a", "--uri", default=None)
+    parser.add_argument("-u", "--user", default=None)
+    parser.add_argument("-p", "--password", default=None)
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("-o", "--output", default="benchmark_results.json")
+    parser.add_argument(
+        "--no-db",
+        action="store_true",
+        help="only run the benchmarks that do not use the database",
+    )
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="run the benchmarks that use the database against an in-memory graph",
+    )
+    parser.add_argument("sbgn_files", nargs="+")
+    args = parser.parse_args()
+    ston = None
+    apoc = False
+    database = None
+    if args.memory:
+        ston = stonpy.STON(graph=MemoryGraph())
+        ston.graph.register_query(QUERY, run_query_in_memory)
+        database = "memory"
+    elif not args.no_db:
+        ston = stonpy.STON(args.uri, args.user, args.password)
+        database = "neo4j"
+    if ston is not None:
+        apoc = has_apoc(ston)
+    results = []
+    for sbgn_file in args.sbgn_files:
+        n_nodes, file_results = bench_conversion(sbgn_file, args.repeat)
+        if ston is not None:
+            file_results += bench_database(ston, sbgn_file, args.repeat, apoc)
+        for benchmark, timings in file_results:
+            result = summarize(benchmark, sbgn_file, n_nodes, timings)
+            results.append(result)
+            print(
+                f"{sbgn_file[-30:]:<30} {benchmark:<20} {n_nodes:>8} {result['min']:>10.4f}"
+            )
+    output = {
+        "stonpy_version": stonpy.__version__,
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "database": database,
+        "apoc": apoc,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,8 @@ setup(
     include_package_data=True,
     install_requires=[
         "libsbgnpy",
-        "py2neo",
+        # STON._stream drives the connector of py2neo's final release
+        "py2neo==2021.2.4",
         "rdflib",
         "bs4",
         "python-magic",
@@ -0,0 +1,396 @@
+"""The module for writing subgraphs to the database in batches.
+
+Nodes are grouped by label set and relationships by type, and each group is
+written with parameterized `UNWIND $rows` queries, so that a whole map is
+created with a handful of queries whose plans are reused by Neo4j.
+It also offers the writing of subgraphs to the CSV files used by the
+`neo4j-admin database import` tool, for the initial loading of large
+collections of maps.
+"""
+
+import csv
+import os.path
+import os
+import uuid
+from collections import defaultdict
+
+import stonpy.queries as queries
+
+DEFAULT_BATCH_SIZE = 10000
+
+
+def _escape_name(name):
+    return "`{}`".format(name.replace("`", "``"))
+
+
+def _labels_to_cypher(labels):
+    return "".join(
+        [":{}".format(_escape_name(label)) for label in sorted(labels)]
+    )
+
+
+def _batches(rows, batch_size):
+    for i in range(0, len(rows), batch_size):
+        yield rows[i : i + batch_size]
+
+
+def _subgraph_to_rows(nodes, relationships):
+    node_keys = {}
+    node_identities = {}
+    node_rows = defaultdict(list)
+    for key, node in enumerate(nodes):
+        node_keys[node] = key
+        if node.graph is not None and node.identity is not None:
+            node_identities[key] = node.identity
+        else:
+            node_rows[tuple(sorted(node.labels))].append(
+                {"key": key, "properties": dict(node)}
+            )
+    relationship_rows = defaultdict(list)
+    for key, relationship in enumerate(relationships):
+        if relationship.graph is not None and relationship.identity is not None:
+            continue
+        relationship_rows[type(relationship).__name__].append(
+            {
+                "key": key,
+                "start": node_keys[relationship.start_node],
+                "end": node_keys[relationship.end_node],
+                "properties": dict(relationship),
+            }
+        )
+    return dict(node_rows), dict(relationship_rows), node_identities
+
+
+def subgraph_to_rows(subgraph):
+    """Convert a subgraph to rows that can be written with :func:`create_rows`.
+
+    The rows only contain built-in types, so that they can be sent to other
+    processes.
+    Nodes are grouped by label set and relationships by type.
+    Nodes are identified by keys, which are used as endpoints of the
+    relationships.
+
+    :param subgraph: the subgraph to convert
+    :type subgraph: `py2neo.Subgraph`
+    :return: the node rows, the relationship rows, and the identities of the nodes of the subgraph that are already bound to the database, indexed by node key
+    :rtype: (`dict[tuple[str], list[dict]]`, `dict[str, list[dict]]`, `dict[int, int]`)
+    """
+    return _subgraph_to_rows(
+        list(subgraph.nodes), list(subgraph.relationships)
+    )
+
+
+def create_rows(
+    node_rows,
+    relationship_rows,
+    tx,
+    batch_size=DEFAULT_BATCH_SIZE,
+    node_identities=None,
+):
+    """Create nodes and relationships given as rows in the database.
+
+    :param node_rows: the node rows, as returned by :func:`subgraph_to_rows`
+    :type node_rows: `dict[tuple[str], list[dict]]`
+    :param relationship_rows: the relationship rows, as returned by :func:`subgraph_to_rows`
+    :type relationship_rows: `dict[str, list[dict]]`
+    :param tx: the transaction in which to create the nodes and relationships
+    :type tx: `py2neo.Transaction`
+    :param batch_size: the maximum number of rows sent in a single query, default is `DEFAULT_BATCH_SIZE`
+    :type batch_size: `int`, optional
+    :param node_identities: the identities of the nodes that already exist in the database, indexed by node key, default is `None`
+    :type node_identities: `dict[int, int]`, optional
+    :return: the identities of the nodes and of the created relationships, indexed by key
+    :rtype: (`dict[int, int]`, `dict[int, int]`)
+    """
+    if node_identities is None:
+        node_identities = {}
+    else:
+        node_identities = dict(node_identities)
+    for labels, rows in node_rows.items():
+        for batch in _batches(rows, batch_size):
+            cursor = queries.run(
+                tx,
+                "create_nodes",
+                {"rows": batch},
+                labels=_labels_to_cypher(labels),
+            )
+            for record in cursor:
+                node_identities[record["key"]] = record["identity"]
+    relationship_identities = {}
+    for r_type, rows in relationship_rows.items():
+        rows = [
+            dict(
+                row,
+                start=node_identities[row["start"]],
+                end=node_identities[row["end"]],
+            )
+            for row in rows
+        ]
+        for batch in _batches(rows, batch_size):
+            cursor = queries.run(
+                tx,
+                "create_relationships",
+                {"rows": batch},
+                r_type=_escape_name(r_type),
+            )
+            for record in cursor:
+                relationship_identities[record["key"]] = record["identity"]
+    return node_identities, relationship_identities
+
+
+async def create_rows_async(
+    node_rows,
+    relationship_rows,
+    tx,
+    batch_size=DEFAULT_BATCH_SIZE,
+    node_identities=None,
+):
+    """Create nodes and relationships given as rows in the database, with the asynchronous Neo4j driver.
+
+    See :func:`create_rows`.
+
+    :param node_rows: the node rows, as returned by :func:`subgraph_to_rows`
+    :type node_rows: `dict[tuple[str], list[dict]]`
+    :param relationship_rows: the relationship rows, as returned by :func:`subgraph_to_rows`
+    :type relationship_rows: `dict[str, list[dict]]`
+    :param tx: the transaction in which to create the nodes and relationships
+    :type tx: `neo4j.AsyncTransaction`
+    :param batch_size: the maximum number of rows sent in a single query, default is `DEFAULT_BATCH_SIZE`
+    :type batch_size: `int`, optional
+    :param node_identities: the identities of the nodes that already exist in the database, indexed by node key, default is `None`
+    :type node_identities: `dict[int, int]`, optional
+    :return: the identities of the nodes and of the created relationships, indexed by key
+    :rtype: (`dict[int, int]`, `dict[int, int]`)
+    """
+    if node_identities is None:
+        node_identities = {}
+    else:
+        node_identities = dict(node_identities)
+    for labels, rows in node_rows.items():
+        for batch in _batches(rows, batch_size):
+            records = await queries.run_async(
+                tx,
+                "create_nodes",
+                {"rows": batch},
+                labels=_labels_to_cypher(labels),
+            )
+            for record in records:
+                node_identities[record["key"]] = record["identity"]
+    relationship_identities = {}
+    for r_type, rows in relationship_rows.items():
+        rows = [
+            dict(
+                row,
+                start=node_identities[row["start"]],
+                end=node_identities[row["end"]],
+            )
+            for row in rows
+        ]
+        for batch in _batches(rows, batch_size):
+            records = await queries.run_async(
+                tx,
+                "create_relationships",
+                {"rows": batch},
+                r_type=_escape_name(r_type),
+            )
+            for record in records:
+                relationship_identities[record["key"]] = record["identity"]
+    return node_identities, relationship_identities
+
+
+def create_subgraph(subgraph, tx, batch_size=DEFAULT_BATCH_SIZE):
+    """Create a subgraph in the database using batched `UNWIND` queries.
+
+    The resulting graph is the same as the one created by `tx.create(subgraph)`:
+    nodes and relationships of the subgraph that are not yet bound to the
+    database are created, and are then bound to it.
+    Nodes that are already bound are only used as endpoints of the created
+    relationships.
+
+    :param subgraph: the subgraph to create
+    :type subgraph: `py2neo.Subgraph`
+    :param tx: the transaction in which to create the subgraph
+    :type tx: `py2neo.Transaction`
+    :param batch_size: the maximum number of rows sent in a single query, default is `DEFAULT_BATCH_SIZE`
+    :type batch_size: `int`, optional
+    """
+    if subgraph is None:
+        return
+    nodes = list(subgraph.nodes)
+    relationships = list(subgraph.relationships)
+    node_rows, relationship_rows, node_identities = _subgraph_to_rows(
+        nodes, relationships
+    )
+    node_identities, relationship_identities = create_rows(
+        node_rows,
+        relationship_rows,
+        tx,
+        batch_size=batch_size,
+        node_identities=node_identities,
+    )
+    # entities are bound last, since binding changes their hash
+    for key, identity in relationship_identities.items():
+        relationships[key].graph = tx.graph
+        relationships[key].identity = identity
+    for key, node in enumerate(nodes):
+        if node.identity is None:
+            node.graph = tx.graph
+            node.identity = node_identities[key]
+
+
+def _csv_type(value):
+    if isinstance(value, bool):
+        return "boolean"
+    elif isinstance(value, int):
+        return "long"
+    elif isinstance(value, float):
+        return "double"
+    return "string"
+
+
+def _csv_value(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
+
+
+class ImportCSVWriter(object):
+    """Writer of subgraphs to the CSV files expected by `neo4j-admin database import`.
+
+    Subgraphs are written one at a time, so that memory usage only depends on
+    the size of the largest subgraph.
+    Nodes and relationships are grouped by property names and types, and
+    each group is written to a header file and a data file.
+    Data files are only open while a subgraph is written, so that the number
+    of open files does not grow with the number of groups.
+    Node IDs and file names are prefixed with the ID of the run, so that
+    node IDs are unique across all written subgraphs, and across exports
+    written to the same directory.
+
+    :ivar directory: the directory where the CSV files are written
+    :ivar run_id: the ID of the run, default is a random ID
+
+    Here is an example:
+
+    .. code-block:: python
+
+        writer = ImportCSVWriter("import")
+        for sbgn_file in ["map1.sbgn", "map2.sbgn"]:
+            sbgn_map = utils.sbgn_file_to_map(sbgn_file)
+            writer.write_subgraph(
+                conversion.map_to_subgraph(sbgn_map, sbgn_file)
+            )
+        writer.close()
+        print(writer.import_command())
+    """
+
+    def __init__(self, directory, run_id=None):
+        if run_id is None:
+            run_id = uuid.uuid4().hex[:8]
+        self.directory = directory
+        self.run_id = run_id
+        self._next_id = 0
+        self._node_files = {}
+        self._relationship_files = {}
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def node_files(self):
+        """The (header file, data file) pairs of the written nodes"""
+        return list(self._node_files.values())
+
+    @property
+    def relationship_files(self):
+        """The (header file, data file) pairs of the written relationships"""
+        return list(self._relationship_files.values())
+
+    def _get_data_file(self, kind, group, header):
+        files = getattr(self, f"_{kind}_files")
+        if group not in files:
+            i = len(files)
+            prefix = os.path.join(self.directory, f"{self.run_id}_{kind}s_{i}")
+            header_file = f"{prefix}_header.csv"
+            data_file = f"{prefix}.csv"
+            with open(header_file, "w", newline="") as f:
+                csv.writer(f).writerow(header)
+            open(data_file, "w").close()
+            files[group] = (header_file, data_file)
+        return files[group][1]
+
+    def write_subgraph(self, subgraph):
+        """Write a subgraph to the CSV files.
+
+        :param subgraph: the subgraph to write
+        :type subgraph: `py2neo.Subgraph`
+        """
+        rows = defaultdict(list)
+        node_ids = {}
+        for node in subgraph.nodes:
+            node_ids[node] = f"{self.run_id}-{self._next_id}"
+            self._next_id += 1
+            labels = tuple(sorted(node.labels))
+            properties = tuple(
+                sorted((key, _csv_type(value)) for key, value in node.items())
+            )
+            header = (
+                [":ID"]
+                + [f"{key}:{value_type}" for key, value_type in properties]
+                + [":LABEL"]
+            )
+            data_file = self._get_data_file("node", properties, header)
+            rows[data_file].append(
+                [node_ids[node]]
+                + [_csv_value(node[key]) for key, _ in properties]
+                + [";".join(labels)]
+            )
+        for relationship in subgraph.relationships:
+            r_type = type(relationship).__name__
+            properties = tuple(
+                sorted(
+                    (key, _csv_type(value))
+                    for key, value in relationship.items()
+                )
+            )
+            header = (
+                [":START_ID", ":END_ID"]
+                + [f"{key}:{value_type}" for key, value_type in properties]
+                + [":TYPE"]
+            )
+            data_file = self._get_data_file("relationship", properties, header)
+            rows[data_file].append(
+                [
+                    node_ids[relationship.start_node],
+                    node_ids[relationship.end_node],
+                ]
+                + [_csv_value(relationship[key]) for key, _ in properties]
+                + [r_type]
+            )
+        for data_file, data_file_rows in rows.items():
+            with open(data_file, "a", newline="") as f:
+                csv.writer(f).writerows(data_file_rows)
+
+    def close(self):
+        """Close the data files.
+
+        Data files are closed after each subgraph is written: this method
+        does nothing, and is kept for compatibility.
+        """
+        pass
+
+    def import_command(self, database="neo4j"):
+        """Return the `neo4j-admin` command that imports the written files.
+
+        :param database: the name of the database to import the files into, default is `"neo4j"`
+        :type database: `str`, optional
+        :return: the command
+        :rtype: `str`
+        """
+        args = ["neo4j-admin database import full"]
+        for header_file, data_file in self.node_files:
+            args.append(f"--nodes={header_file},{data_file}")
+        for header_file, data_file in self.relationship_files:
+            args.append(f"--relationships={header_file},{data_file}")
+        args.append("--id-type=string")
+        args.append("--multiline-fields=true")
+        args.append(database)
+        return " ".join(args)
@@ -0,0 +1,153 @@
+"""The module for caching the maps retrieved from the database.
+
+The cache is a size-bounded LRU cache keyed by map ID, whose entries may
+additionally expire after a given time (TTL).
+It is used by :meth:`stonpy.core.STON.get_map` and
+:meth:`stonpy.core.STON.get_maps` when enabled, and is invalidated by
+:meth:`stonpy.core.STON.create_map` and :meth:`stonpy.core.STON.delete_map`.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class MapCache(object):
+    """Thread-safe LRU cache of SBGN maps, keyed by map ID.
+
+    The cache holds the maps themselves, so that a hit costs a dictionary
+    lookup: cached maps are shared between calls, and should hence not be
+    modified in place.
+
+    Each map ID has a generation, that changes every time the entry of the
+    map is invalidated (or the cache cleared). A map read from the database
+    after a miss should be cached with the generation of its ID taken
+    before the read: if the map was invalidated in between, the map read
+    may be stale, and it is not cached.
+
+    :ivar maxsize: the maximum number of maps held by the cache; the cache is disabled if it is `0`
+    :ivar ttl: the time (in seconds) after which an entry expires, or `None` if entries do not expire
+    :ivar hits: the number of lookups that found a map
+    :ivar misses: the number of lookups that did not find a map
+    :ivar evictions: the number of entries removed because the cache was full or because they had expired
+    """
+
+    def __init__(self, maxsize=0, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._clears = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        """Whether the cache is enabled, i.e. whether its maximum size is positive"""
+        return self.maxsize > 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, map_id):
+        """Return the cached map with the given ID.
+
+        :param map_id: the ID of the map
+        :type map_id: `str`
+        :return: the cached map, of the form (map, map ID), or `None` if there is no (unexpired) entry for the ID
+        :rtype: `tuple[libsbgnpy.libsbgn.map, str]` or `None`
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(map_id)
+            if entry is not None:
+                value, expires = entry
+                if expires is not None and expires <= time.monotonic():
+                    del self._entries[map_id]
+                    self.evictions += 1
+                else:
+                    self._entries.move_to_end(map_id)
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    def generation(self, map_id):
+        """Return the current generation of a map ID.
+
+        :param map_id: the ID of the map
+        :type map_id: `str`
+        :return: the generation, to be passed to :meth:`put`
+        """
+        with self._lock:
+            return (self._clears, self._generations.get(map_id, 0))
+
+    def put(self, map_id, value, generation=None):
+        """Cache a map, evicting the least recently used entries if the cache is full.
+
+        :param map_id: the ID of the map
+        :type map_id: `str`
+        :param value: the map, of the form (map, map ID)
+        :type value: `tuple[libsbgnpy.libsbgn.map, str]`
+        :param generation: the generation of the ID (see :meth:`generation`) taken before the map was read; the map is not cached if the ID was invalidated since, default is `None` (the map is always cached)
+        :type generation: `tuple`, optional
+        """
+        if not self.enabled:
+            return
+        if self.ttl is not None:
+            expires = time.monotonic() + self.ttl
+        else:
+            expires = None
+        with self._lock:
+            if generation is not None and generation != (
+                self._clears,
+                self._generations.get(map_id, 0),
+            ):
+                return
+            self._entries[map_id] = (value, expires)
+            self._entries.move_to_end(map_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, map_id):
+        """Remove the entry of a map, if any.
+
+        :param map_id: the ID of the map
+        :type map_id: `str`
+        """
+        with self._lock:
+            self._entries.pop(map_id, None)
+            self._generations[map_id] = self._generations.get(map_id, 0) + 1
+
+    def clear(self):
+        """Remove all entries (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self._clears += 1
+
+    def reset(self):
+        """Reset all counters."""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def as_dict(self):
+        """Return the counters and the size of the cache as a dictionary.
+
+        :rtype: `dict`
+        """
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
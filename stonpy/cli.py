@@ -10,6 +10,9 @@ import urllib.request
 import tempfile
 import magic
 import zipfile
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 import stonpy
 import libsbgnpy.utils
 
@@ -66,13 +69,26 @@ class ConversionError(Exception):
     pass
 
 
+class TargetsError(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(
+            "\n".join(
+                [f"{len(errors)} target(s) could not be made:"]
+                + [f"- {path}: {error!r}" for path, error in errors]
+            )
+        )
+
+
 @dataclass
 class Target(ABC):
     path: str
     name: str
 
     @abstractmethod
-    def make(self, ston: stonpy.core.STON) -> None:
+    def make(
+        self, ston: stonpy.core.STON, make_map_membership: bool = False
+    ) -> None:
         pass
 
 
@@ -87,9 +103,11 @@ class BatchTarget(Target):
     def prepare_subtargets(self) -> list[Target]:
         pass
 
-    def make(self, ston: stonpy.core.STON) -> None:
+    def make(
+        self, ston: stonpy.core.STON, make_map_membership: bool = False
+    ) -> None:
         for target in self.subtargets:
-            make_target(target, ston)
+            make_target(target, ston, make_map_membership)
 
 
 @dataclass
@@ -111,8 +129,8 @@ class CellDesignerFileTarget(LocalFileTarget, BatchTarget):
 
 @dataclass
 class SBGNMLFileTarget(LocalFileTarget):
-    def make(self, ston):
-        create_map(self.path, ston, self.name)
+    def make(self, ston, make_map_membership=False):
+        create_map(self.path, ston, self.name, make_map_membership)
 
 
 @dataclass
@@ -253,14 +271,141 @@ def target_from_path(target_path, parent_target=None):
     return target
 
 
-def make_target(target: Target, ston: stonpy.core.STON) -> None:
+def make_target(
+    target: Target, ston: stonpy.core.STON, make_map_membership: bool = False
+) -> None:
     print(f"* Making target {target}")
-    target.make(ston)
+    target.make(ston, make_map_membership)
 
 
-def create_map(path, ston, map_id):
+def create_map(path, ston, map_id, make_map_membership=False):
     print(f"-> creating map in database with id {map_id}")
-    ston.create_map(path, map_id)
+    ston.create_map(path, map_id, make_map_membership=make_map_membership)
+
+
+def collect_sbgnml_targets(target):
+    if isinstance(target, SBGNMLFileTarget):
+        yield target
+    elif isinstance(target, BatchTarget):
+        for subtarget in target.subtargets:
+            yield from collect_sbgnml_targets(subtarget)
+    else:
+        print(f"-> skipping target {target}: not an SBGN-ML file")
+
+
+def prepare_map_rows(path, map_id, make_map_membership=False):
+    node_rows, relationship_rows = stonpy.core.map_to_rows(
+        path, map_id, make_map_membership=make_map_membership
+    )
+    return path, map_id, node_rows, relationship_rows
+
+
+def report_target_error(path, error, errors):
+    print(f"-> could not make target from path {path}: {error!r}")
+    errors.append((path, error))
+
+
+def write_map_rows(ston, map_rows_queue, errors):
+    while True:
+        map_rows = map_rows_queue.get()
+        if map_rows is None:
+            break
+        path, map_id, node_rows, relationship_rows = map_rows
+        print(f"-> creating map in database with id {map_id}")
+        try:
+            ston.create_map_rows(map_id, node_rows, relationship_rows)
+        except Exception as e:
+            report_target_error(path, e, errors)
+
+
+def make_targets_parallel(
+    targets,
+    uri,
+    user,
+    password,
+    workers,
+    writers=1,
+    queue_size=None,
+    make_map_membership=False,
+):
+    # Maps are parsed and converted by a pool of processes, and written by
+    # writer threads, each with its own connection. At most queue_size
+    # maps are being converted and at most queue_size converted maps wait
+    # to be written, which bounds memory usage. A target that fails to be
+    # converted or written does not stop the others: all failures are
+    # reported, with the paths of their targets, by a TargetsError raised
+    # at the end.
+    if queue_size is None:
+        queue_size = 2 * workers
+    map_rows_queue = queue.Queue(maxsize=queue_size)
+    errors = []
+    pending_paths = {}
+
+    def put_map_rows(done):
+        for future in done:
+            path = pending_paths.pop(future)
+            try:
+                map_rows = future.result()
+            except Exception as e:
+                report_target_error(path, e, errors)
+            else:
+                map_rows_queue.put(map_rows)
+
+    writer_threads = []
+    for _ in range(writers):
+        ston = stonpy.core.STON(uri=uri, user=user, password=password)
+        writer_thread = threading.Thread(
+            target=write_map_rows, args=(ston, map_rows_queue, errors)
+        )
+        writer_thread.start()
+        writer_threads.append(writer_thread)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = set([])
+            for target in targets:
+                for sbgnml_target in collect_sbgnml_targets(target):
+                    if len(pending) >= queue_size:
+                        done, pending = wait(
+                            pending, return_when=FIRST_COMPLETED
+                        )
+                        put_map_rows(done)
+                    print(f"* Making target {sbgnml_target}")
+                    future = executor.submit(
+                        prepare_map_rows,
+                        sbgnml_target.path,
+                        sbgnml_target.name,
+                        make_map_membership,
+                    )
+                    pending.add(future)
+                    pending_paths[future] = sbgnml_target.path
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                put_map_rows(done)
+    finally:
+        for _ in writer_threads:
+            map_rows_queue.put(None)
+        for writer_thread in writer_threads:
+            writer_thread.join()
+    if errors:
+        raise TargetsError(errors)
+
+
+def export_import_csv(target_paths, directory):
+    writer = stonpy.batch.ImportCSVWriter(directory)
+    try:
+        for target_path in target_paths:
+            target = target_from_path(target_path)
+            for sbgnml_target in collect_sbgnml_targets(target):
+                print(f"* Exporting target {sbgnml_target}")
+                sbgn_map = stonpy.utils.sbgn_file_to_map(sbgnml_target.path)
+                subgraph = stonpy.conversion.map_to_subgraph(
+                    sbgn_map, sbgnml_target.name
+                )
+                writer.write_subgraph(subgraph)
+    finally:
+        writer.close()
+    print("Import the files into an empty database with:")
+    print(writer.import_command())
 
 
 def cd2sbgnml(cd_path):
@@ -318,6 +463,20 @@ def query(
         )
 
 
+def init_schema(ston):
+    print(f"Creating indexes of database")
+    for name in ston.ensure_indexes():
+        print(f"-> index {name}")
+    print(f"Checking index usage of internal queries")
+    for name, operators in ston.index_usage().items():
+        if operators is None:
+            print(f"-> {name}: could not be explained")
+        elif operators:
+            print(f"-> {name}: {', '.join(operators)}")
+        else:
+            print(f"-> {name}: no index used")
+
+
 def delete_all(ston):
     print(f"Deleting all data of database")
     ston.graph.delete_all()
@@ -326,12 +485,17 @@ def delete_all(ston):
 def run(args):
     if args.action == "list-repos":
         list_repos()
+    elif args.action == "export-import-csv":
+        print(f"Total of {len(args.target_paths)} targets")
+        export_import_csv(args.target_paths, args.directory)
+        print("Done.")
     elif (
         args.action == "create"
         or args.action == "get"
         or args.action == "query"
         or args.action == "delete"
         or args.action == "delete-all"
+        or args.action == "init-schema"
     ):
         ston = stonpy.core.STON(
             uri=args.uri, user=args.user, password=args.password
@@ -340,9 +504,24 @@ def run(args):
             if args.delete_all:
                 delete_all(ston)
             print(f"Total of {len(args.target_paths)} targets")
-            for target_path in args.target_paths:
-                target = target_from_path(target_path)
-                make_target(target, ston)
+            if args.workers is not None:
+                targets = [
+                    target_from_path(target_path)
+                    for target_path in args.target_paths
+                ]
+                make_targets_parallel(
+                    targets,
+                    uri=args.uri,
+                    user=args.user,
+                    password=args.password,
+                    workers=args.workers,
+                    writers=args.writers,
+                    make_map_membership=args.make_map_membership,
+                )
+            else:
+                for target_path in args.target_paths:
+                    target = target_from_path(target_path)
+                    make_target(target, ston, args.make_map_membership)
             print("Done.")
         elif args.action == "get":
             get_map(ston, args.map_id, args.output)
@@ -362,6 +541,8 @@ def run(args):
             )
         elif args.action == "delete-all":
             delete_all(ston)
+        elif args.action == "init-schema":
+            init_schema(ston)
 
 
 def main():
@@ -372,6 +553,18 @@ def main():
     list_repos_parser = subparsers.add_parser(
         "list-repos", help="list the available map repositories"
     )
+    export_import_csv_parser = subparsers.add_parser(
+        "export-import-csv",
+        help="export one or more maps to CSV files for neo4j-admin import",
+    )
+    export_import_csv_parser.add_argument(
+        "target_paths",
+        nargs="+",
+        help="target paths to export (see the create command)",
+    )
+    export_import_csv_parser.add_argument(
+        "directory", help="the directory where the CSV files are written"
+    )
     with_db_conn_parser = argparse.ArgumentParser(add_help=False)
     with_db_conn_parser.add_argument(
         "-u",
@@ -391,6 +584,11 @@ def main():
     delete_all_parser = subparsers.add_parser(
         "delete-all", parents=[with_db_conn_parser]
     )
+    init_schema_parser = subparsers.add_parser(
+        "init-schema",
+        parents=[with_db_conn_parser],
+        help="create the indexes of the data model in the database",
+    )
     create_parser = subparsers.add_parser(
         "create",
         parents=[with_db_conn_parser],
@@ -403,6 +601,26 @@ def main():
         action="store_true",
         help="delete all data in the database before executing the action",
     )
+    create_parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="number of processes used to convert maps in parallel (maps are converted and written one at a time if not set)",
+    )
+    create_parser.add_argument(
+        "--writers",
+        type=int,
+        default=1,
+        help="number of connections used to write maps to the database (only if --workers is set)",
+    )
+    create_parser.add_argument(
+        "-m",
+        "--make-map-membership",
+        default=False,
+        action="store_true",
+        help="store the id of the map on all its nodes, so that queries can be restricted to maps",
+    )
     create_parser.add_argument(
         "target_paths",
         nargs="+",
@@ -1,248 +1,658 @@
 """The module for completing subgraphs to form complete subgraphs that can be 
 converted to SBGN maps."""
 
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from py2neo import Subgraph
+
 from stonpy.model import STONEnum
 
 import stonpy.utils as utils
+import stonpy.queries as queries
+import stonpy.instrumentation as instrumentation
+
+SOURCE = "Source"
+TARGET = "Target"
+
+CompletionRule = namedtuple(
+    "CompletionRule", ["r_name", "nary", "node_role", "recursive"])
+CompletionRule.__doc__ = """A completion rule: a node is completed with its relationships of type `r_name` (at most one if `nary` is `False`), of which it is the source or the target depending on `node_role`, and the other nodes of these relationships are completed in turn if `recursive` is `True`.
+
+See :ref:`completion` for the list of rules."""
+
 
-def _choose_node_completion_function(node):
+CompletionRuleSet = namedtuple("CompletionRuleSet", ["rules", "r_types"])
+CompletionRuleSet.__doc__ = """The completion rules of a kind of node, i.e. of the nodes with a given set of labels, and the relationship types they use, sorted.
+
+The relationships needed to apply all the rules of a node are retrieved with a single query, matching relationships of any of the `r_types` types."""
+
+
+def node_completion_rules(node, complete_process_modulations=False):
+    """Return the completion rules of a node.
+
+    :param node: the node
+    :type node: `py2neo.Node`
+    :param complete_process_modulations: option to complete processes with the modulations targetting it, default is `False`
+    :type complete_process_modulations: `bool`
+    :return: the completion rules of the node, in the order they are applied
+    :rtype: `list[CompletionRule]`
+    """
     for label in node.labels:
-        name = STONEnum(label).name
-        if name in _node_completion_functions:
-            return _node_completion_functions[name]
-    raise Exception(f"No completion function for node {node}")
+        rules_function = _label_completion_rules.get(label)
+        if rules_function is not None:
+            return rules_function(node, complete_process_modulations)
+    raise Exception(f"No completion rules for node {node}")
+
+
+def node_completion_rule_set(node, complete_process_modulations=False):
+    """Return the completion rule set of a node.
+
+    The rules only depend on the labels of the node: they are computed once
+    for each set of labels, and are then looked up.
+
+    :param node: the node
+    :type node: `py2neo.Node`
+    :param complete_process_modulations: option to complete processes with the modulations targetting it, default is `False`
+    :type complete_process_modulations: `bool`
+    :return: the completion rule set of the node
+    :rtype: `CompletionRuleSet`
+    """
+    key = (frozenset(node.labels), complete_process_modulations)
+    rule_set = _rule_sets.get(key)
+    if rule_set is None:
+        rules = tuple(
+            node_completion_rules(node, complete_process_modulations))
+        r_types = tuple(sorted(set(
+            [STONEnum[rule.r_name].value for rule in rules])))
+        rule_set = CompletionRuleSet(rules, r_types)
+        _rule_sets[key] = rule_set
+    return rule_set
+
+
+class CompletionMemo(object):
+    """Memo of the lookups run against the database during completion.
+
+    The relationships found for a given node, relationship type and
+    direction, and the arcs found for shortcut relationships, are stored by
+    identity, so that subgraphs that overlap (e.g. the records of a same
+    query) are completed without looking up the same neighbourhood again.
+    A memo is thread-safe, and may be shared by several calls to
+    :func:`complete_subgraph`; it is not invalidated when the database is
+    modified, and should hence only be shared as long as the completed maps
+    are not modified.
+
+    :ivar hits: the number of lookups answered by the memo
+    :ivar misses: the number of lookups run against the database
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def lookup(self, key, func, *args):
+        """Return the memoized result of a lookup, running it first if needed.
+
+        :param key: the key of the lookup
+        :type key: `tuple`
+        :param func: the function running the lookup
+        :type func: `callable`
+        :param args: the arguments of `func`
+        :return: the result of the lookup
+        """
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                return self._entries[key]
+        value = func(*args)
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = value
+        return value
+
+    def lookup_many(self, keys, func):
+        """Return the memoized results of several lookups, running the missing ones first.
+
+        :param keys: the keys of the lookups
+        :type keys: `list[tuple]`
+        :param func: the function running the missing lookups, called with the list of their keys and returning their results indexed by key
+        :type func: `callable`
+        :return: the results of the lookups, indexed by key
+        :rtype: `dict`
+        """
+        results = {}
+        missing = []
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                if key in self._entries:
+                    self.hits += 1
+                    results[key] = self._entries[key]
+                else:
+                    missing.append(key)
+        if missing:
+            found = func(missing)
+            with self._lock:
+                self.misses += len(missing)
+                self._entries.update(found)
+            results.update(found)
+        return results
+
+    def as_dict(self):
+        """Return the counters and the size of the memo as a dictionary.
+
+        :rtype: `dict`
+        """
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+CompletionTruncation = namedtuple(
+    "CompletionTruncation",
+    ["reason", "nodes", "round_trips", "time", "uncompleted", "dropped"])
+CompletionTruncation.__doc__ = """The report of a completion truncated by a :class:`CompletionBudget`: the limit that was reached (`"max_nodes"`, `"max_round_trips"` or `"max_time"`), the number of nodes of the truncated subgraph, the number of round trips run and the time (in seconds) spent by the completion, the identities of the nodes that were left to complete, and the number of relationships that were found but not added to stay within `max_nodes`."""
+
+
+class CompletionBudget(object):
+    """Limits of the completion of a subgraph.
+
+    Each completion run with a budget (see :func:`complete_subgraph`) is
+    limited to `max_nodes` nodes, `max_round_trips` database round trips and
+    `max_time` seconds; a limit set to `None` is not enforced.
+    The round trips and the time are checked before each layer of nodes is
+    completed: once one of them is reached, the completion stops.
+    The nodes are checked as they are added: once the subgraph holds
+    `max_nodes` nodes, the relationships leading to new nodes are dropped,
+    and the completion stops before the next layer.
+    A truncated completion returns the subgraph completed so far, which may
+    hence be converted to an incomplete map, and adds a
+    :class:`CompletionTruncation` to :attr:`truncations`.
+    Lookups answered by a memo do not count as round trips.
+    A budget is thread-safe, and may be shared by several completions, each
+    of them being given the whole budget.
+
+    :ivar max_nodes: the maximum number of nodes of a completed subgraph
+    :ivar max_round_trips: the maximum number of round trips of a completion
+    :ivar max_time: the maximum time (in seconds) of a completion
+    :ivar truncations: the reports of the truncated completions
+    """
 
+    def __init__(self, max_nodes=None, max_round_trips=None, max_time=None):
+        self.max_nodes = max_nodes
+        self.max_round_trips = max_round_trips
+        self.max_time = max_time
+        self.truncations = []
+        self._lock = threading.Lock()
+
+    def truncate(self, truncation):
+        """Add the report of a truncated completion.
+
+        :param truncation: the report
+        :type truncation: `CompletionTruncation`
+        """
+        with self._lock:
+            self.truncations.append(truncation)
+
+
+class _BudgetTracker(object):
+    # the spending of a completion run with a budget; queries are run
+    # through the tracker so that they are counted
+
+    def __init__(self, budget, db_graph):
+        self.budget = budget
+        self.db_graph = db_graph
+        self.round_trips = 0
+        self.start = time.perf_counter()
+
+    def run(self, *args, **kwargs):
+        self.round_trips += 1
+        return self.db_graph.run(*args, **kwargs)
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def is_full(self, n_nodes):
+        return self.budget.max_nodes is not None and \
+            n_nodes >= self.budget.max_nodes
+
+    def exceeded(self, n_nodes):
+        if self.is_full(n_nodes):
+            return "max_nodes"
+        if self.budget.max_round_trips is not None and \
+                self.round_trips >= self.budget.max_round_trips:
+            return "max_round_trips"
+        if self.budget.max_time is not None and \
+                self.elapsed() >= self.budget.max_time:
+            return "max_time"
+        return None
+
+
+class CompletionWorklist(object):
+    """The worklist of the completion of a subgraph.
+
+    The nodes to complete are completed layer by layer, without recursion:
+    :meth:`next_lookups` takes the next layer of nodes from the worklist,
+    applies the non n-ary rules that are satisfied by relationships already
+    in the subgraph, and returns the lookups needed to apply the other rules
+    in one queue per kind of node (see :func:`node_completion_rule_set`);
+    :meth:`add_results` then applies these rules to the relationships found
+    by the lookups, and adds the nodes to complete in turn to the worklist.
+    The worklist does not run the lookups itself, so that they may be run
+    and batched as the caller sees fit.
 
-def complete_subgraph(subgraph, db_graph, complete_process_modulations=False):
+    :param subgraph: the subgraph to complete
+    :type subgraph: `py2neo.Subgraph`
+    :param arcs: the arcs of the shortcut relationships of the subgraph
+    :type arcs: `list[py2neo.Node]`
+    :param complete_process_modulations: option to complete the processes of the subgraph with the modulations targetting them, default is `False`
+    :type complete_process_modulations: `bool`
+    :param max_nodes: the maximum number of nodes of the completed subgraph, default is `None` (no limit)
+    :type max_nodes: `int`, optional
+    :ivar result: the subgraph completed so far
+    :ivar dropped: the relationships that were not added to stay within `max_nodes`
+    """
+
+    def __init__(self, subgraph, arcs, complete_process_modulations=False,
+                 max_nodes=None):
+        # the completed subgraph is accumulated in place, and its
+        # relationships are indexed for the lookups of the non n-ary rules
+        self.result = utils.SubgraphAccumulator(subgraph)
+        self.max_nodes = max_nodes
+        self.dropped = set([])
+        self._completed = set(self.result.relationships)
+        for arc in arcs:
+            self.result.add_node(arc)
+        self._completed |= self.result.nodes
+        self._to_complete = [
+            (node, complete_process_modulations)
+            for node in self.result.nodes]
+        self._found = []
+        self._to_apply = []
+
+    def __bool__(self):
+        return len(self._to_complete) > 0
+
+    def pending(self):
+        """Return the identities of the nodes left to complete.
+
+        :rtype: `list[int]`
+        """
+        return [node.identity for node, _ in self._to_complete]
+
+    def next_lookups(self):
+        """Take the next layer of nodes to complete, and return the lookups needed to complete them.
+
+        A lookup retrieves the relationships of a node of any of the types
+        of its rule set; lookups are queued by kind of node, i.e. by these
+        types, so that each queue may be run with one query.
+
+        :return: the identities of the nodes to look up, by tuple of relationship types
+        :rtype: `dict`
+        """
+        queues = defaultdict(list)
+        for node, complete_process_modulations in self._to_complete:
+            rule_set = node_completion_rule_set(
+                node, complete_process_modulations)
+            rules = []
+            for rule in rule_set.rules:
+                if not rule.nary:
+                    r_type = STONEnum[rule.r_name].value
+                    if rule.node_role == SOURCE:
+                        nodes = (node, None)
+                    else:
+                        nodes = (None, node)
+                    relationship = self.result.match_one(nodes, r_type)
+                    if relationship is not None:
+                        self._found.append((
+                            relationship,
+                            _other_node(relationship, rule.node_role),
+                            rule.recursive))
+                        continue
+                rules.append(rule)
+            # entities that are not bound to the database are not looked up
+            if rules and node.identity is not None:
+                self._to_apply.append((node.identity, rule_set.r_types, rules))
+                queues[rule_set.r_types].append(node.identity)
+        self._to_complete = []
+        return dict(queues)
+
+    def add_results(self, results):
+        """Complete the nodes of the current layer with the results of their lookups.
+
+        :param results: the (relationship, other node) pairs found by each lookup, indexed by (identity, relationship types)
+        :type results: `dict`
+        """
+        found = self._found
+        for identity, r_types, rules in self._to_apply:
+            by_rule = defaultdict(list)
+            for relationship, other_node in results[(identity, r_types)]:
+                if relationship.start_node.identity == identity:
+                    node_role = SOURCE
+                else:
+                    node_role = TARGET
+                by_rule[(type(relationship).__name__, node_role)].append(
+                    (relationship, other_node))
+            for rule in rules:
+                relationships = by_rule[(STONEnum[rule.r_name].value,
+                                         rule.node_role)]
+                if not rule.nary:
+                    relationships = relationships[:1]
+                for relationship, other_node in relationships:
+                    found.append((relationship, other_node, rule.recursive))
+        self._found = []
+        self._to_apply = []
+        for relationship, other_node, recursive in found:
+            if relationship in self._completed:
+                continue
+            if self.max_nodes is not None and \
+                    other_node not in self.result.nodes and \
+                    len(self.result.nodes) >= self.max_nodes:
+                self.dropped.add(relationship)
+                continue
+            self.dropped.discard(relationship)
+            self._completed.add(relationship)
+            self.result.add_node(other_node)
+            self.result.add(relationship)
+            if recursive and other_node not in self._completed:
+                self._completed.add(other_node)
+                # modulations are only completed for the nodes of the
+                # subgraph
+                self._to_complete.append((other_node, False))
+
+
+def complete_subgraph(subgraph, db_graph, complete_process_modulations=False,
+                      memo=None, budget=None):
     """Complete a subgraph w.r.t to a graph and returns it.
 
     See :ref:`completion` for more details.
 
+    The subgraph is completed breadth-first: the nodes to complete are
+    completed layer by layer, and the relationships needed to apply the
+    rules of all the nodes of a layer are retrieved with one query per kind
+    of node (see :func:`node_completion_rule_set`), so that the number of
+    queries only depends on the depth of the completion, and not on the size
+    of the subgraph.
+    When `db_graph` is a graph, all queries are run in a single read
+    transaction.
+    When `budget` is set, the completion is truncated once one of its limits
+    is reached (see :class:`CompletionBudget`).
+
     :param subgraph: the subgraph to complete
     :type subgraph: `py2neo.Subgraph`
     :param db_graph: the neo4j graph where to look for the completion
-    :type db_graph: `py2neo.Graph`
+    :type db_graph: `py2neo.Graph` or `py2neo.Transaction`
     :param complete_process_modulations: option to complete processes with the modulations targetting it, default is `False`
     :type complete_process_modulations: `bool`
-    :return: the completed subgraph
+    :param memo: the memo of the lookups, shared with other completions, default is `None` (no memo)
+    :type memo: `CompletionMemo`, optional
+    :param budget: the limits of the completion, default is `None` (no limit)
+    :type budget: `CompletionBudget`, optional
+    :return: the completed subgraph, which may be truncated when `budget` is set
     :rtype: `py2neo.Subgraph`
     """
-    completed = set([])
-    for relationship in subgraph.relationships:
-        if relationship not in completed:
-            subgraph = _complete_subgraph_with_relationship(
-                relationship, subgraph, db_graph, completed)
-    for node in subgraph.nodes:
-        if node not in completed:
-            subgraph = _complete_subgraph_with_node(node, subgraph, db_graph,
-                                                    completed,
-                                                    complete_process_modulations)
+    if not hasattr(db_graph, "begin"):
+        return _complete_subgraph(subgraph, db_graph,
+                                  complete_process_modulations, memo, budget)
+    tx = db_graph.begin(readonly=True)
+    try:
+        subgraph = _complete_subgraph(subgraph, tx,
+                                      complete_process_modulations, memo,
+                                      budget)
+    except BaseException:
+        tx.rollback()
+        raise
+    tx.commit()
     return subgraph
 
-def _complete_subgraph_with_node(node, subgraph, db_graph, completed,
-                                 complete_process_modulations):
-    completion_func = _choose_node_completion_function(node)
-    subgraph = completion_func(node, subgraph, db_graph, completed,
-                               complete_process_modulations)
-    return subgraph
 
+def _complete_subgraph(subgraph, tx, complete_process_modulations, memo,
+                       budget=None):
+    tracker = None
+    max_nodes = None
+    if budget is not None:
+        tracker = _BudgetTracker(budget, tx)
+        tx = tracker
+        max_nodes = budget.max_nodes
+    arcs = _shortcut_arcs(subgraph.relationships, tx, memo)
+    worklist = CompletionWorklist(
+        subgraph, arcs, complete_process_modulations, max_nodes)
+    reason = None
+    while worklist:
+        if tracker is not None:
+            reason = tracker.exceeded(len(worklist.result.nodes))
+            if reason is not None:
+                break
+        queues = worklist.next_lookups()
+        keys = [("match", identity, r_types)
+                for r_types, identities in queues.items()
+                for identity in identities]
+        results = _lookup_many(memo, keys, _match_relationships, tx)
+        worklist.add_results(
+            {key[1:]: relationships for key, relationships in results.items()})
+    if worklist.dropped and reason is None:
+        reason = "max_nodes"
+    if reason is not None:
+        budget.truncate(CompletionTruncation(
+            reason,
+            len(worklist.result.nodes),
+            tracker.round_trips,
+            tracker.elapsed(),
+            worklist.pending(),
+            len(worklist.dropped)))
+    return Subgraph(worklist.result.nodes, worklist.result.relationships)
+
+
+def complete_subgraph_with_descendants(subgraph, db_graph):
+    """Complete a subgraph with all nodes and relationships reachable from its nodes and returns it.
+
+    The subgraph is completed breadth-first, with one query per layer of
+    descendants, so that the number of queries only depends on the depth of
+    the completion.
+    When the subgraph is a Map node, the resulting subgraph is the complete
+    map, i.e. the same subgraph as the one obtained using APOC's
+    `apoc.path.subgraphAll` procedure.
 
-def _complete_subgraph_with_relationship(
-        relationship, subgraph, db_graph, completed):
-    completed.add(relationship)
+    :param subgraph: the subgraph to complete
+    :type subgraph: `py2neo.Subgraph`
+    :param db_graph: the neo4j graph where to look for the completion
+    :type db_graph: `py2neo.Graph` or `py2neo.Transaction`
+    :return: the completed subgraph
+    :rtype: `py2neo.Subgraph`
+    """
+    return complete_subgraphs_with_descendants([subgraph], db_graph)[0]
 
-    shortcut = "_SHORTCUT"
-    r_type = type(relationship).__name__
-    if STONEnum(r_type).name.endswith(shortcut):
-        start_node = relationship.start_node
-        end_node = relationship.end_node
-        arc_label = STONEnum[STONEnum(r_type).name[:-len(shortcut)]].value
-        if r_type == STONEnum["CONSUMPTION_SHORTCUT"].value or \
-                r_type == STONEnum["EQUIVALENCE_ARC_SHORTCUT"].value or \
-                r_type == STONEnum["LOGIC_ARC_SHORTCUT"].value:
-            source_id = end_node.identity
-            target_id = start_node.identity
-        else:
-            source_id = start_node.identity
-            target_id = end_node.identity
-        queries = []
-        queries.append(
-                """OPTIONAL MATCH (arc:{arc_label})-[:{has_source}]->(source),
-                (arc)-[:{has_target}]->(target)
-                WHERE id(source) = {source_id} AND id(target) = {target_id}
-                RETURN arc""".format(
-                    arc_label =  arc_label,
-                    has_source = STONEnum["HAS_SOURCE"].value,
-                    has_target =  STONEnum["HAS_TARGET"].value,
-                    source_id = source_id,
-                    target_id = target_id))
-        queries.append(
-                """OPTIONAL MATCH (arc:{arc_label})-[:{has_source}]->(source_port),
-                (source)-[:{has_port}]->(source_port),
-                (arc)-[:{has_target}]->(target)
-                WHERE id(source) = {source_id} AND id(target) = {target_id}
-                RETURN arc""".format(
-                    arc_label =  arc_label,
-                    has_source = STONEnum["HAS_SOURCE"].value,
-                    has_port = STONEnum["HAS_PORT"].value,
-                    has_target =  STONEnum["HAS_TARGET"].value,
-                    source_id = source_id,
-                    target_id = target_id))
-        queries.append(
-                """OPTIONAL MATCH (arc:{arc_label})-[:{has_source}]->(source),
-                (arc)-[:{has_target}]->(target_port),
-                (target)-[:{has_port}]->(target_port)
-                WHERE id(source) = {source_id} AND id(target) = {target_id}
-                RETURN arc""".format(
-                    arc_label =  arc_label,
-                    has_source = STONEnum["HAS_SOURCE"].value,
-                    has_port = STONEnum["HAS_PORT"].value,
-                    has_target =  STONEnum["HAS_TARGET"].value,
-                    source_id = source_id,
-                    target_id = target_id))
-        queries.append(
-                """OPTIONAL MATCH (arc:{arc_label})-[:{has_source}]->(source_port),
-                (source)-[:{has_port}]->(source_port),
-                (arc)-[:{has_target}]->(target_port),
-                (target)-[:{has_port}]->(target_port)
-                WHERE id(source) = {source_id} AND id(target) = {target_id}
-                RETURN arc""".format(
-                    arc_label =  arc_label,
-                    has_source = STONEnum["HAS_SOURCE"].value,
-                    has_port = STONEnum["HAS_PORT"].value,
-                    has_target =  STONEnum["HAS_TARGET"].value,
-                    source_id = source_id,
-                    target_id = target_id))
-        stop = False
-        for query in queries:
-            cursor = db_graph.run(query)
-            for record in cursor:
-                if record["arc"] is not None:
-                    subgraph = subgraph | record["arc"]
-                    stop = True
-                    break
-            if stop:
-                break
-    return subgraph
 
-def _find_relationship_and_complete_subgraph(
-        r_name,
-        subgraph,
-        db_graph,
-        completed,
-        nary=False,
-        start_node=None,
-        end_node=None,
-        complete_start_node=False,
-        complete_end_node=False,
-        complete_process_modulations=False):
-
-    if not nary:
-        relationship = utils.match_one(
-            subgraph, (start_node, end_node), STONEnum[r_name].value)
-        if relationship is None:
-            relationship = db_graph.match_one(
-                    (start_node, end_node), STONEnum[r_name].value)
-        relationships = [relationship]
-    elif nary:
-        relationships = db_graph.match(
-                (start_node, end_node), STONEnum[r_name].value)
-    for relationship in relationships:
-        if relationship is not None and relationship not in completed:
-            completed.add(relationship)
-            subgraph = subgraph | relationship
-            new_end_node = relationship.end_node
-            new_start_node = relationship.start_node
-            if end_node is None:
-                subgraph = subgraph | new_end_node
-            if start_node is None:
-                subgraph = subgraph | new_start_node
-            to_complete = []
-            if complete_start_node and new_start_node not in completed:
-                to_complete.append(new_start_node)
-            if complete_end_node and new_end_node not in completed:
-                to_complete.append(new_end_node)
-            for node in to_complete:
-                subgraph = _complete_subgraph_with_node(
-                    node,
-                    subgraph,
-                    db_graph,
-                    completed,
-                    complete_process_modulations
-                )
+def complete_subgraphs_with_descendants(subgraphs, db_graph):
+    """Complete subgraphs with all nodes and relationships reachable from their nodes and returns them.
 
-    return subgraph
+    Subgraphs are completed independently, but simultaneously: each layer of
+    descendants of all subgraphs is retrieved with a single query.
+    See :func:`complete_subgraph_with_descendants`.
 
+    :param subgraphs: the subgraphs to complete
+    :type subgraphs: `list[py2neo.Subgraph]`
+    :param db_graph: the neo4j graph where to look for the completion
+    :type db_graph: `py2neo.Graph` or `py2neo.Transaction`
+    :return: the completed subgraphs, in the same order
+    :rtype: `list[py2neo.Subgraph]`
+    """
+    results = []
+    frontier = []
+    for root, subgraph in enumerate(subgraphs):
+        result = utils.SubgraphAccumulator()
+        for node in subgraph.nodes:
+            if result.node(node.identity) is None:
+                frontier.append([node.identity, root])
+            result.add_node(node)
+        result.add_subgraph(subgraph)
+        results.append(result)
+    while frontier:
+        cursor = queries.run(
+            db_graph, "match_children", {"frontier": frontier})
+        frontier = []
+        for record in cursor:
+            instrumentation.count_records(1)
+            root = record["root"]
+            child = record["child"]
+            if results[root].node(child.identity) is None:
+                results[root].add_node(child)
+                frontier.append([child.identity, root])
+            results[root].add(record["r"])
+    return [
+        Subgraph(result.nodes, result.relationships) for result in results
+    ]
 
-def _complete_subgraph_with_glyph_node(node, subgraph, db_graph, completed, complete_process_modulations):
-    completed.add(node)
 
-    # LABEL
-    subgraph = _find_relationship_and_complete_subgraph(
-        "HAS_LABEL",
-        subgraph,
-        db_graph,
-        completed,
-        nary = False,
-        start_node = node,
-        end_node = None,
-        complete_start_node = False,
-        complete_end_node = True)
-
-
-    # BBOX
-    subgraph = _find_relationship_and_complete_subgraph(
-        "HAS_BBOX",
-        subgraph,
+def _other_node(relationship, node_role):
+    if node_role == SOURCE:
+        return relationship.end_node
+    return relationship.start_node
+
+
+def shortcut_arc_parameters(relationship):
+    """Return what is needed to find the arc a shortcut relationship stands for.
+
+    The arcs of shortcut relationships are found with the
+    `match_arcs_of_shortcuts` query, that takes a list of such parameters
+    (see :func:`shortcut_arcs_of_records`).
+
+    :param relationship: the relationship
+    :type relationship: `py2neo.Relationship`
+    :return: the identity of the relationship, the identities of the source and target of the arc and the label of the arc, or `None` if the relationship is not a shortcut
+    :rtype: `dict` or `None`
+    """
+    shortcut = "_SHORTCUT"
+    r_type = type(relationship).__name__
+    if not STONEnum(r_type).name.endswith(shortcut):
+        return None
+    start_node = relationship.start_node
+    end_node = relationship.end_node
+    arc_label = STONEnum[STONEnum(r_type).name[:-len(shortcut)]].value
+    if r_type == STONEnum["CONSUMPTION_SHORTCUT"].value or \
+            r_type == STONEnum["EQUIVALENCE_ARC_SHORTCUT"].value or \
+            r_type == STONEnum["LOGIC_ARC_SHORTCUT"].value:
+        source_id = end_node.identity
+        target_id = start_node.identity
+    else:
+        source_id = start_node.identity
+        target_id = end_node.identity
+    return {
+        "identity": relationship.identity,
+        "source_id": source_id,
+        "target_id": target_id,
+        "arc_label": arc_label,
+    }
+
+
+def shortcut_arcs_of_records(records):
+    """Return the arcs found by the `match_arcs_of_shortcuts` query.
+
+    The source (resp. target) of the arc of a shortcut relationship is
+    either the source (resp. target) of the shortcut or one of its ports.
+    When several arcs are found for a same shortcut, the arc that is
+    directly linked to the source and target is preferred, then the arc
+    linked to a port of the source, then to a port of the target, then to
+    ports of both.
+
+    :param records: the records of the query
+    :return: the arcs, indexed by the identity of their shortcut relationship
+    :rtype: `dict`
+    """
+    arcs = {}
+    ports = {}
+    for record in records:
+        identity = record["identity"]
+        if identity not in ports or record["ports"] < ports[identity]:
+            ports[identity] = record["ports"]
+            arcs[identity] = record["arc"]
+    return arcs
+
+
+def _match_shortcut_arcs(db_graph, shortcuts, keys):
+    # runs the lookups of the arcs of the given shortcut keys with one query
+    if not keys:
+        return {}
+    cursor = queries.run(
         db_graph,
-        completed,
-        nary = False,
-        start_node = node,
-        end_node = None,
-        complete_start_node = False,
-        complete_end_node = False)
+        "match_arcs_of_shortcuts",
+        {"shortcuts": [shortcuts[key] for key in keys]})
+    records = list(cursor)
+    instrumentation.count_records(len(records))
+    arcs = shortcut_arcs_of_records(records)
+    return {key: arcs.get(key[1]) for key in keys}
+
+
+def _match_relationships(tx, keys):
+    # runs the lookups of the given keys with one query per kind of node,
+    # and returns the (relationship, other node) pairs found for each key
+    identities = defaultdict(list)
+    for _, identity, r_types in keys:
+        identities[r_types].append(identity)
+    results = {key: [] for key in keys}
+    for r_types, group in identities.items():
+        cursor = queries.run(
+            tx,
+            "match_relationships_of_nodes",
+            {"identities": group},
+            r_types=":" + "|".join(r_types))
+        for record in cursor:
+            instrumentation.count_records(1)
+            results[("match", record["identity"], r_types)].append(
+                (record["r"], record["other"]))
+    return results
+
+
+def _lookup_many(memo, keys, func, *args):
+    if memo is None:
+        return func(*args, list(dict.fromkeys(keys)))
+    return memo.lookup_many(
+        keys, lambda missing_keys: func(*args, missing_keys))
+
+
+def _shortcut_arcs(relationships, db_graph, memo=None):
+    # the shortcuts that are not bound to the database are not looked up
+    shortcuts = {}
+    for relationship in relationships:
+        parameters = shortcut_arc_parameters(relationship)
+        if parameters is not None and relationship.identity is not None:
+            shortcuts[("shortcut_arc", relationship.identity)] = parameters
+    arcs = _lookup_many(
+        memo, list(shortcuts), _match_shortcut_arcs, db_graph, shortcuts)
+    return [arc for arc in arcs.values() if arc is not None]
+
+
+def _glyph_node_completion_rules(node, complete_process_modulations):
+    rules = [
+        CompletionRule("HAS_LABEL", False, SOURCE, True),
+        CompletionRule("HAS_BBOX", False, SOURCE, False),
+    ]
 
     # COMPARTMENT only if node is an entity pool or an activity
     if node.has_label(STONEnum["EPN"].value) or \
             node.has_label(STONEnum["ACTIVITY"].value):
-        subgraph = _find_relationship_and_complete_subgraph(
-            "IS_IN_COMPARTMENT",
-            subgraph,
-            db_graph,
-            completed,
-            nary = False,
-            start_node = node,
-            end_node = None,
-            complete_start_node = False,
-            complete_end_node = True)
+        rules.append(
+            CompletionRule("IS_IN_COMPARTMENT", False, SOURCE, True))
 
     # PORTs only if node is a process or a logical/equivalence operator
     if node.has_label(STONEnum["STOICHIOMETRIC_PROCESS"].value) or \
             node.has_label(STONEnum["LOGICAL_OPERATOR"].value) or \
             node.has_label(STONEnum["EQUIVALENCE"].value):
-        subgraph = _find_relationship_and_complete_subgraph(
-            "HAS_PORT",
-            subgraph,
-            db_graph,
-            completed,
-            nary = True,
-            start_node = node,
-            end_node = None,
-            complete_start_node = False,
-            complete_end_node = True)
+        rules.append(CompletionRule("HAS_PORT", True, SOURCE, True))
 
     # MODULATION ARCS targetting a process, only if node is a process and complete_process_modulations is True
-    if node.has_label(STONEnum["STOICHIOMETRIC_PROCESS"].value) and complete_process_modulations:
-        subgraph = _find_relationship_and_complete_subgraph(
-            "HAS_TARGET",
-            subgraph,
-            db_graph,
-            completed,
-            nary = True,
-            start_node = None,
-            end_node = node,
-            complete_start_node = True,
-            complete_end_node = False)
+    if node.has_label(STONEnum["STOICHIOMETRIC_PROCESS"].value) and \
+            complete_process_modulations:
+        rules.append(CompletionRule("HAS_TARGET", True, TARGET, True))
 
     # AUXILLIARY UNITS
     for r_name in ["HAS_STATE_VARIABLE",
@@ -252,29 +662,11 @@ def _complete_subgraph_with_glyph_node(node, subgraph, db_graph, completed, comp
                  "HAS_TERMINAL",
                  "HAS_EXISTENCE",
                  "HAS_LOCATION"]:
-        subgraph = _find_relationship_and_complete_subgraph(
-            r_name,
-            subgraph,
-            db_graph,
-            completed,
-            nary = True,
-            start_node = node,
-            end_node = None,
-            complete_start_node = False,
-            complete_end_node = True)
+        rules.append(CompletionRule(r_name, True, SOURCE, True))
 
     # GLYPH's OWNING MAP IF NOT AUXILLIARY UNIT
     if not node.has_label(STONEnum["AUXILLIARY_UNIT"].value):
-        subgraph = _find_relationship_and_complete_subgraph(
-            "HAS_GLYPH",
-            subgraph,
-            db_graph,
-            completed,
-            nary = False,
-            start_node = None,
-            end_node = node,
-            complete_start_node = False,
-            complete_end_node = False)
+        rules.append(CompletionRule("HAS_GLYPH", False, TARGET, False))
 
     # STATE_VARIABLE, UNIT_OF_INFORMATION, SUBUNIT, OUTCOME OWNING GLYPH OR TERMINAL
     node_labels = [
@@ -286,270 +678,106 @@ def _complete_subgraph_with_glyph_node(node, subgraph, db_graph, completed, comp
         "OUTCOME",
         "TERMINAL"
     ]
-    node_label = None
     for label in node_labels:
         if node.has_label(STONEnum[label].value):
-            node_label = label
+            rules.append(
+                CompletionRule("HAS_{}".format(label), False, TARGET, True))
             break
-    if node_label is not None:
-        subgraph = _find_relationship_and_complete_subgraph(
-            "HAS_{}".format(node_label),
-            subgraph,
-            db_graph,
-            completed,
-            nary = False,
-            start_node = None,
-            end_node = node,
-            complete_start_node = True,
-            complete_end_node = False)
-    return subgraph
-
+    return rules
 
-def _complete_subgraph_with_port_node(node, subgraph, db_graph, completed, complete_process_modulations):
-    completed.add(node)
-
-    # OWNER GLYPH
-    subgraph = _find_relationship_and_complete_subgraph(
-            "HAS_PORT",
-            subgraph,
-            db_graph,
-            completed,
-            nary = False,
-            start_node = None,
-            end_node = node,
-            complete_start_node = True,
-            complete_end_node = False)
-
-    # SOURCE OF ARC, TARGET OF ARC
-    for r_name in ["HAS_SOURCE", "HAS_TARGET"]:
-        subgraph = _find_relationship_and_complete_subgraph(
-            r_name,
-            subgraph,
-            db_graph,
-            completed,
-            nary = True,
-            start_node = None,
-            end_node = node,
-            complete_start_node = True,
-            complete_end_node = False)
-    return subgraph
 
+def _port_node_completion_rules(node, complete_process_modulations):
+    return [
+        # OWNER GLYPH
+        CompletionRule("HAS_PORT", False, TARGET, True),
+        # SOURCE OF ARC, TARGET OF ARC
+        CompletionRule("HAS_SOURCE", True, TARGET, True),
+        CompletionRule("HAS_TARGET", True, TARGET, True),
+    ]
 
-def _complete_subgraph_with_bbox_node(node, subgraph, db_graph, completed, complete_process_modulations):
-    completed.add(node)
 
-    # OWNER GLYPH
-    subgraph = _find_relationship_and_complete_subgraph(
-        "HAS_BBOX",
-        subgraph,
-        db_graph,
-        completed,
-        nary = False,
-        start_node = None,
-        end_node = node,
-        complete_start_node = True,
-        complete_end_node = False)
-    return subgraph
+def _bbox_node_completion_rules(node, complete_process_modulations):
+    return [
+        # OWNER GLYPH
+        CompletionRule("HAS_BBOX", False, TARGET, True),
+    ]
 
-def _complete_subgraph_with_arc_point_node(node, subgraph, db_graph, completed, complete_process_modulations):
-    completed.add(node)
 
-    # OWNER GLYPH
+def _arc_point_node_completion_rules(node, complete_process_modulations):
+    # OWNER ARC
     if node.has_label(STONEnum["END"].value):
-        r_type = STONEnum["HAS_END"].value
+        r_name = "HAS_END"
     elif node.has_label(STONEnum["START"].value):
-        r_type = STONEnum["HAS_START"].value
+        r_name = "HAS_START"
     elif node.has_label(STONEnum["NEXT"].value):
-        r_type = STONEnum["HAS_NEXT"].value
-    subgraph = _find_relationship_and_complete_subgraph(
-        r_type,
-        subgraph,
-        db_graph,
-        completed,
-        nary = False,
-        start_node = None,
-        end_node = node,
-        complete_start_node = True,
-        complete_end_node = False)
-    return subgraph
-
+        r_name = "HAS_NEXT"
+    return [CompletionRule(r_name, False, TARGET, True)]
 
-def _complete_subgraph_with_label_node(node, subgraph, db_graph, completed, complete_process_modulations):
-    completed.add(node)
 
-    # OWNER GLYPH
-    subgraph = _find_relationship_and_complete_subgraph(
-        "HAS_LABEL",
-        subgraph,
-        db_graph,
-        completed,
-        nary = False,
-        start_node = None,
-        end_node = node,
-        complete_start_node = True,
-        complete_end_node = False)
-    return subgraph
-
-
-def _complete_subgraph_with_arc_node(node, subgraph, db_graph, completed, complete_process_modulations):
-    completed.add(node)
-
-    # PORTs
-    subgraph = _find_relationship_and_complete_subgraph(
-        "HAS_PORT",
-        subgraph,
-        db_graph,
-        completed,
-        nary = True,
-        start_node = node,
-        end_node = None,
-        complete_start_node = False,
-        complete_end_node = False)
-
-    # OUTCOMEs
-    subgraph = _find_relationship_and_complete_subgraph(
-        "HAS_OUTCOME",
-        subgraph,
-        db_graph,
-        completed,
-        nary = True,
-        start_node = node,
-        end_node = None,
-        complete_start_node = False,
-        complete_end_node = True)
-
-    # MAP
-    subgraph = _find_relationship_and_complete_subgraph(
-        "HAS_ARC",
-        subgraph,
-        db_graph,
-        completed,
-        nary = False,
-        start_node = None,
-        end_node = node,
-        complete_start_node = False,
-        complete_end_node = False)
-
-    # CARDINALITY, SOURCE, TARGET
-    for r_name in ["HAS_CARDINALITY", "HAS_SOURCE", "HAS_TARGET"]:
-        subgraph = _find_relationship_and_complete_subgraph(
-            r_name,
-            subgraph,
-            db_graph,
-            completed,
-            nary = False,
-            start_node = node,
-            end_node = None,
-            complete_start_node = False,
-            complete_end_node = True)
-
-    # START, END
-    for r_name in ["HAS_START", "HAS_END"]:
-        subgraph = _find_relationship_and_complete_subgraph(
-            r_name,
-            subgraph,
-            db_graph,
-            completed,
-            nary = False,
-            start_node = node,
-            end_node = None,
-            complete_start_node = False,
-            complete_end_node = False)
-
-    # NEXT
-    subgraph = _find_relationship_and_complete_subgraph(
-        "HAS_NEXT",
-        subgraph,
-        db_graph,
-        completed,
-        nary = True,
-        start_node = node,
-        end_node = None,
-        complete_start_node = False,
-        complete_end_node = False)
-    return subgraph
+def _label_node_completion_rules(node, complete_process_modulations):
+    return [
+        # OWNER GLYPH
+        CompletionRule("HAS_LABEL", False, TARGET, True),
+    ]
 
 
-def _complete_subgraph_with_arcgroup_node(node, subgraph, db_graph, completed, complete_process_modulations):
-    completed.add(node)
+def _arc_node_completion_rules(node, complete_process_modulations):
+    return [
+        # PORTs
+        CompletionRule("HAS_PORT", True, SOURCE, False),
+        # OUTCOMEs
+        CompletionRule("HAS_OUTCOME", True, SOURCE, True),
+        # MAP
+        CompletionRule("HAS_ARC", False, TARGET, False),
+        # CARDINALITY, SOURCE, TARGET
+        CompletionRule("HAS_CARDINALITY", False, SOURCE, True),
+        CompletionRule("HAS_SOURCE", False, SOURCE, True),
+        CompletionRule("HAS_TARGET", False, SOURCE, True),
+        # START, END
+        CompletionRule("HAS_START", False, SOURCE, False),
+        CompletionRule("HAS_END", False, SOURCE, False),
+        # NEXT
+        CompletionRule("HAS_NEXT", True, SOURCE, False),
+    ]
 
-    # ARCs
-    subgraph = _find_relationship_and_complete_subgraph(
-        "HAS_ARC",
-        subgraph,
-        db_graph,
-        completed,
-        nary = True,
-        start_node = node,
-        end_node = None,
-        complete_start_node = False,
-        complete_end_node = True)
-
-    # OWNING MAP
-    subgraph = _find_relationship_and_complete_subgraph(
-        "HAS_ARCGROUP",
-        subgraph,
-        db_graph,
-        completed,
-        nary = False,
-        start_node = None,
-        end_node = node,
-        complete_start_node = False,
-        complete_end_node = False)
-    return subgraph
 
+def _arcgroup_node_completion_rules(node, complete_process_modulations):
+    return [
+        # ARCs
+        CompletionRule("HAS_ARC", True, SOURCE, True),
+        # OWNING MAP
+        CompletionRule("HAS_ARCGROUP", False, TARGET, False),
+    ]
 
-def _complete_subgraph_with_map_node(node, subgraph, db_graph, completed, complete_process_modulations):
-    completed.add(node)
 
-    # ARCs
-    subgraph = _find_relationship_and_complete_subgraph(
-        "HAS_ARC",
-        subgraph,
-        db_graph,
-        completed,
-        nary = True,
-        start_node = node,
-        end_node = None,
-        complete_start_node = False,
-        complete_end_node = True)
-
-    # GLYPHs
-    subgraph = _find_relationship_and_complete_subgraph(
-        "HAS_GLYPH",
-        subgraph,
-        db_graph,
-        completed,
-        nary = True,
-        start_node = node,
-        end_node = None,
-        complete_start_node = False,
-        complete_end_node = True)
-
-    # ARCGROUPs
-    subgraph = _find_relationship_and_complete_subgraph(
-        "HAS_ARCGROUP",
-        subgraph,
-        db_graph,
-        completed,
-        nary = True,
-        start_node = node,
-        end_node = None,
-        complete_start_node = False,
-        complete_end_node = True)
-    return subgraph
+def _map_node_completion_rules(node, complete_process_modulations):
+    return [
+        # ARCs, GLYPHs, ARCGROUPs
+        CompletionRule("HAS_ARC", True, SOURCE, True),
+        CompletionRule("HAS_GLYPH", True, SOURCE, True),
+        CompletionRule("HAS_ARCGROUP", True, SOURCE, True),
+    ]
 
-_node_completion_functions = {
-    "GLYPH": _complete_subgraph_with_glyph_node,
-    "ARC": _complete_subgraph_with_arc_node,
-    "ARCGROUP": _complete_subgraph_with_arcgroup_node,
-    "BBOX": _complete_subgraph_with_bbox_node,
-    "MAP": _complete_subgraph_with_map_node,
-    "PORT": _complete_subgraph_with_port_node,
-    "LABEL": _complete_subgraph_with_label_node,
-    "NEXT": _complete_subgraph_with_arc_point_node,
-    "END": _complete_subgraph_with_arc_point_node,
-    "START": _complete_subgraph_with_arc_point_node
+_node_completion_rules = {
+    "GLYPH": _glyph_node_completion_rules,
+    "ARC": _arc_node_completion_rules,
+    "ARCGROUP": _arcgroup_node_completion_rules,
+    "BBOX": _bbox_node_completion_rules,
+    "MAP": _map_node_completion_rules,
+    "PORT": _port_node_completion_rules,
+    "LABEL": _label_node_completion_rules,
+    "NEXT": _arc_point_node_completion_rules,
+    "END": _arc_point_node_completion_rules,
+    "START": _arc_point_node_completion_rules
 }
 
+# The functions returning the completion rules of a node, indexed by the
+# label that determines them
+_label_completion_rules = {
+    STONEnum[name].value: rules_function
+    for name, rules_function in _node_completion_rules.items()
+}
 
+# The completion rule sets, indexed by label set and
+# complete_process_modulations option (see node_completion_rule_set)
+_rule_sets = {}
@@ -16,6 +16,8 @@ def map_to_subgraph(
     map_id=None,
     make_shortcuts=True,
     make_sbml_annotations=True,
+    make_fingerprint=True,
+    make_map_membership=False,
     verbose=False,
 ):
     """Convert an SBGN map to a subgraph and return it.
@@ -31,6 +33,14 @@ def map_to_subgraph(
             SBML annotations inside extensions will be added as nodes and \
             relationships. Defaults to `True`.
     :type make_sbml_annotations: `bool`, optional
+    :param make_fingerprint: if set to `True`, the fingerprint of the map \
+            (see :func:`stonpy.utils.map_fingerprint`) is added to the Map \
+            node, unless it cannot be computed. Defaults to `True`.
+    :type make_fingerprint: `bool`, optional
+    :param make_map_membership: if set to `True`, the ID of the map is \
+            added to all nodes of the subgraph (see \
+            :meth:`stonpy.core.STON.query_to_map`). Defaults to `False`.
+    :type make_map_membership: `bool`, optional
     :param verbose: if set to `True`, prints operations to stdout. \
             Defaults to `True`.
     :type verbose: `bool`, optional
@@ -49,6 +59,10 @@ def map_to_subgraph(
     map_node.add_label(STONEnum["MAP"].value)
     map_node[STONEnum["LANGUAGE"].value] = language
     map_node[STONEnum["MAP_ID"].value] = map_id
+    if make_fingerprint:
+        fingerprint = utils.map_fingerprint_or_none(sbgn_map)
+        if fingerprint is not None:
+            map_node[STONEnum["FINGERPRINT"].value] = fingerprint
     if sbgn_map.get_extension() is not None:
         map_node[STONEnum["EXTENSION"].value] = str(sbgn_map.get_extension())
         if make_sbml_annotations and _extension_has_sbml_annotation(
@@ -186,6 +200,9 @@ def map_to_subgraph(
         )
         dids[arcgroup.get_id()] = arcgroup_node
     subgraph = Subgraph(nodes, relationships)
+    if make_map_membership and map_id is not None:
+        for node in subgraph.nodes:
+            node[STONEnum["MAP_MEMBERSHIP"].value] = map_id
     return subgraph
 
 
@@ -1,19 +1,139 @@
 """The main module for stonpy.
 The STON class is the interface with the Neo4j database.
+The AsyncSTON class is its asynchronous counterpart, for asyncio applications.
 """
 
+import asyncio
+import contextlib
+import functools
 import os.path
 import time
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
 
 import libsbgnpy.libsbgn as libsbgn
 
-from py2neo import Graph, Subgraph
+from py2neo import Graph, Node, Relationship, Subgraph
+from py2neo.client import Connection
+from py2neo.cypher import Cursor
+
+try:
+    from neo4j import AsyncGraphDatabase
+    import neo4j.graph
+except ImportError:
+    AsyncGraphDatabase = None
 
 import stonpy.utils as utils
 import stonpy.conversion as conversion
 import stonpy.completion as completion
+import stonpy.batch as batch
+import stonpy.queries as queries
+import stonpy.cache as cache
+import stonpy.instrumentation as instrumentation
 from stonpy.model import STONEnum
 
+DEFAULT_MAPS_PER_QUERY = 100
+DEFAULT_MAX_CONCURRENCY = 32
+DEFAULT_FETCH_SIZE = 1000
+
+
+def _map_glyph_node(sbgn_map):
+    # we get one node in rel with the Map node, used to find the maps that
+    # may be equal to the given map
+    subgraph = conversion.map_to_subgraph(sbgn_map, make_fingerprint=False)
+    for relationship in subgraph.relationships:
+        if (
+            relationship.start_node.has_label(STONEnum["MAP"].value)
+            and type(relationship).__name__ == STONEnum["HAS_GLYPH"].value
+        ):
+            return relationship.end_node
+    return None
+
+
+def _in_phase(iterable, report, name):
+    # accounts the time spent producing each item to the given phase
+    iterator = iter(iterable)
+    while True:
+        with report.phase(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def _write_map(sbgn_map, sbgn_file, report=None):
+    with instrumentation.phase(report, "serialization"):
+        utils.map_to_sbgn_file(sbgn_map, sbgn_file)
+
+
+def _distinct_subgraphs(subgraphs, map_ids=None):
+    digests = set([])
+    for subgraph in subgraphs:
+        if map_ids is not None:
+            subgraph = utils.restrict_subgraph_to_maps(subgraph, map_ids)
+        if subgraph is None:
+            continue
+        digest = utils.subgraph_digest(subgraph)
+        if digest not in digests:
+            digests.add(digest)
+            yield subgraph
+
+
+def _next_result(futures, ordered):
+    if ordered:
+        future = futures.popleft()
+    else:
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        future = done.pop()
+        futures.remove(future)
+    return future.result()
+
+
+def _merge_records(records):
+    merged = utils.SubgraphAccumulator()
+    for record in records:
+        merged.add_subgraph(record.to_subgraph())
+    return merged.to_subgraph()
+
+
+def _load_map(sbgn_map):
+    if isinstance(sbgn_map, str) and os.path.isfile(sbgn_map):
+        return utils.sbgn_file_to_map(sbgn_map)
+    if not isinstance(sbgn_map, libsbgn.map):
+        raise ValueError("map must be a valid file or libsbgn.map object")
+    return sbgn_map
+
+
+def map_to_rows(sbgn_map, map_id, verbose=False, make_map_membership=False):
+    """Convert an SBGN map to rows that can be written with :meth:`STON.create_map_rows`.
+
+    The map is converted as by :meth:`STON.create_map`.
+    The rows only contain built-in types, so that maps can be converted in other processes (see :func:`stonpy.batch.subgraph_to_rows`).
+
+    :param sbgn_map: the SBGN map, either a path to an SBGN-ML file or an SBGN map object
+    :type sbgn_map: `str` or `libsbgnpy.libsbgn.map <https://libsbgn-python.readthedocs.io/en/latest/libsbgnpy.html#libsbgnpy.libsbgn.map>`_
+    :param map_id: the ID of the SBGN map
+    :type map_id: `str`
+    :param make_map_membership: if set to `True`, the ID of the map is stored on all its nodes, default is `False`
+    :type make_map_membership: `bool`, optional
+    :return: the node rows and the relationship rows of the map
+    :rtype: (`dict[tuple[str], list[dict]]`, `dict[str, list[dict]]`)
+    """
+    subgraph = conversion.map_to_subgraph(
+        _load_map(sbgn_map),
+        map_id,
+        make_map_membership=make_map_membership,
+        verbose=verbose,
+    )
+    node_rows, relationship_rows, _ = batch.subgraph_to_rows(subgraph)
+    return node_rows, relationship_rows
+
 
 class STON(object):
     """
@@ -22,6 +142,9 @@ class STON(object):
     :ivar uri: the URI of the running Neo4j database
     :ivar user: the username
     :ivar password: the password
+    :ivar cache_size: the maximum number of maps held in the cache of retrieved maps (see :attr:`map_cache`), default is `0` (no cache)
+    :ivar cache_ttl: the time (in seconds) after which a cached map expires, default is `None` (no expiration)
+    :ivar graph: the graph used instead of connecting to the Neo4j database, e.g. a :class:`stonpy.memory.MemoryGraph`, default is `None` (the Neo4j database is used)
 
     Here is an example:
 
@@ -34,16 +157,33 @@ class STON(object):
         PASSWORD = "my_password"
 
         ston = stonpy.STON(URI, USER, PASSWORD)
+
+        # or, with an in-memory graph instead of a database
+        from stonpy.memory import MemoryGraph
+
+        ston = stonpy.STON(graph=MemoryGraph())
     """
 
-    def __init__(self, uri, user, password):
-        self._graph = Graph(uri=uri, user=user, password=password)
+    def __init__(
+        self,
+        uri=None,
+        user=None,
+        password=None,
+        cache_size=0,
+        cache_ttl=None,
+        graph=None,
+    ):
+        if graph is None:
+            graph = Graph(uri=uri, user=user, password=password)
+        self._graph = graph
+        self._map_cache = cache.MapCache(cache_size, cache_ttl)
+        self._instrumentations = []
 
     @property
     def graph(self):
         """
         The handle to the graph in the database.
-        The graph is of type `py2neo.Graph <https://py2neo.org/2021.1/workflow.html#graphservice-objects>`_.
+        The graph is of type `py2neo.Graph <https://py2neo.org/2021.1/workflow.html#graphservice-objects>`_, or of the type of the `graph` given when creating the STON object (e.g. :class:`stonpy.memory.MemoryGraph`).
 
         The `graph` handle can be used to delete all data from the database, for example:
 
@@ -53,6 +193,121 @@ class STON(object):
         """
         return self._graph
 
+    @property
+    def map_cache(self):
+        """
+        The cache of the maps retrieved by :meth:`get_map` and :meth:`get_maps`, of type :class:`stonpy.cache.MapCache`.
+
+        The cache is enabled when the STON object is created with a positive `cache_size`.
+        It is invalidated by :meth:`create_map` and :meth:`delete_map`, but not by other writes to the database (e.g. through the :attr:`graph` handle or other clients): in this case, it should be cleared, or created with a `cache_ttl`.
+        Cached maps are shared between calls, and should not be modified in place.
+
+        Here is an example:
+
+        .. code-block:: python
+
+            ston = stonpy.STON(URI, USER, PASSWORD, cache_size=100)
+            ston.get_map("id1")
+            ston.get_map("id1") # retrieved from the cache
+            print(ston.map_cache.as_dict()) # {"size": 1, "maxsize": 100, "hits": 1, "misses": 1, "evictions": 0}
+
+            ston.graph.delete_all()
+            ston.map_cache.clear()
+        """
+        return self._map_cache
+
+    @property
+    def query_statistics(self):
+        """
+        The counters of the internal queries run by stonpy, of type :class:`stonpy.queries.QueryStatistics`.
+
+        Internal queries are parameterized, so that their texts, and hence their plans, can be reused by Neo4j.
+        The counters give the number of distinct query texts sent by this process, and the number and time of the runs of each template, for example:
+
+        .. code-block:: python
+
+            ston.query_statistics.reset()
+            ston.get_map("id1")
+            print(ston.query_statistics.as_dict())
+        """
+        return queries.statistics
+
+    def ensure_indexes(self):
+        """Create the indexes of stonpy's data model in the database, if they do not exist yet, and wait for them to be online.
+
+        Range indexes are created for the properties used by the lookups of stonpy (e.g. the ID of maps, or the ID, class and label of glyphs), and text indexes for the properties typically searched in user queries (e.g. the label of glyphs).
+        No uniqueness constraint is created, since the same ID may be used by several maps, and glyph IDs are only unique within a map.
+        See :data:`stonpy.queries.INDEXES` for the list of indexes.
+
+        :return: the names of the indexes
+        :rtype: `list[str]`
+
+        Here is an example:
+
+        .. code-block:: python
+
+            ston.ensure_indexes()
+            print(ston.index_usage()["match_map"]) # ["NodeIndexSeek"]
+        """
+        names = []
+        for name, query in queries.get_index_queries():
+            self.graph.run(query)
+            names.append(name)
+        queries.run(self.graph, "await_indexes")
+        return names
+
+    def index_usage(self):
+        """Explain the internal queries of stonpy and return the index operators of their plans.
+
+        :return: the index operators of the plan of each internal query, indexed by query name; the value is `None` if the query could not be explained (e.g. if it uses APOC and APOC is not installed)
+        :rtype: `dict[str, list[str]]`
+        """
+        return queries.index_usage(self.graph)
+
+    @contextlib.contextmanager
+    def instrument(self, callback=None):
+        """Return a context manager that instruments the calls made in its block.
+
+        The calls to :meth:`get_map`, :meth:`get_map_to_sbgn_file`, :meth:`query_to_map` and :meth:`query_to_sbgn_file` made in the block are reported, with the time spent in each of their phases (running the user query, retrieval, completion, conversion, moving to the top left, serialization), and the number of database round trips and of records fetched in each phase (see :mod:`stonpy.instrumentation`).
+        The report of a call is added to the :class:`stonpy.instrumentation.Instrumentation` object returned by the context manager when the call finishes, i.e. when its results have been consumed for :meth:`query_to_map`, and is passed to `callback` if it is set.
+
+        :param callback: the function called with the report of each call, of type :class:`stonpy.instrumentation.CallReport`, default is `None`
+        :type callback: `callable`, optional
+        :return: the context manager
+        :rtype: `contextlib.AbstractContextManager[stonpy.instrumentation.Instrumentation]`
+
+        Here is an example:
+
+        .. code-block:: python
+
+            with ston.instrument() as instrumentation:
+                sbgn_maps = list(ston.query_to_map("MATCH (g:Glyph) RETURN g"))
+            for report in instrumentation.reports:
+                print(report.as_dict())
+
+            # or, to log all calls
+            with ston.instrument(lambda report: logger.info(report.as_dict())):
+                serve_forever()
+        """
+        collector = instrumentation.Instrumentation(callback)
+        self._instrumentations.append(collector)
+        try:
+            yield collector
+        finally:
+            self._instrumentations.remove(collector)
+
+    def _start_report(self, name):
+        if not self._instrumentations:
+            return None
+        return instrumentation.CallReport(name)
+
+    def _end_report(self, report):
+        if report is None:
+            return
+        report.finish()
+        for collector in list(self._instrumentations):
+            collector.add(report)
+
     def has_map(self, map_id=None, sbgn_map=None):
         """Check whether the database contains a given SBGN map
 
@@ -60,6 +315,9 @@ class STON(object):
         If only an SBGN map is provided, checks whether the database contains this map.
         If both a map ID and an SBGN map are provided, checks whether the database contains this map with this ID.
 
+        Maps are compared using their fingerprint (see :func:`stonpy.utils.map_fingerprint`), which is stored on the Map node when the map is created, so that checking whether the database contains a given map only requires an index lookup (see :meth:`ensure_indexes`).
+        Maps without a fingerprint (created before fingerprints were introduced, or whose fingerprint could not be computed) are retrieved and compared structurally.
+
         :param map_id: the ID of the SBGN map, default is `None`
         :type map_id: `str`, optional
         :param sbgn_map: the SBGN map, either a path to an SBGN-ML file or an SBGN map object, default is `None`
@@ -85,10 +343,7 @@ class STON(object):
                 return False
             else:
                 tx = self.graph.begin()
-                query = 'MATCH (m:{} {{{}: "{}"}}) RETURN m'.format(
-                    STONEnum["MAP"].value, STONEnum["ID"].value, map_id
-                )
-                res = tx.evaluate(query)
+                res = queries.evaluate(tx, "match_map", {"map_id": map_id})
                 tx.commit()
                 if res is None:
                     return False
@@ -98,52 +353,75 @@ class STON(object):
             if isinstance(sbgn_map, str):
                 if os.path.isfile(sbgn_map):
                     sbgn_map = utils.sbgn_file_to_map(sbgn_map)
+            fingerprint = utils.map_fingerprint_or_none(sbgn_map)
+            parameters = {"map_id": map_id}
+            if fingerprint is not None and queries.evaluate(
+                self.graph,
+                "count_maps_by_fingerprint",
+                dict(parameters, fingerprint=fingerprint),
+            ):
+                return True
+            # maps created before fingerprints were introduced, or whose
+            # fingerprint could not be computed, can only be compared after
+            # being retrieved
+            if not queries.evaluate(
+                self.graph, "count_maps_without_fingerprint", parameters
+            ):
+                return False
             if map_id is not None:
-                query = 'MATCH (m:{} {{{}: "{}"}}) RETURN m'.format(
-                    STONEnum["MAP"].value, STONEnum["ID"].value, map_id
+                maps_to_test = list(
+                    self.query_to_map(
+                        queries.get_query("match_map"),
+                        parameters={"map_id": map_id},
+                        complete=True,
+                    )
                 )
-                maps_to_test = list(self.query_to_map(query, complete=True))
             else:
                 maps_to_test = []
-                subgraph = conversion.map_to_subgraph(sbgn_map)
-                # we get the Map node and one node in rel with the Map node
-                node = None
-                for relationship in subgraph.relationships:
-                    if (
-                        relationship.start_node.has_label(STONEnum["MAP"].value)
-                        and type(relationship).__name__
-                        == STONEnum["HAS_GLYPH"].value
-                    ):
-                        node = relationship.end_node
-                        break
+                node = _map_glyph_node(sbgn_map)
                 if node is not None:  # i.e. the map is not empty
-                    query = "MATCH (m:{})-[{}]->{} RETURN id(m)".format(
-                        STONEnum["MAP"].value,
-                        STONEnum["HAS_GLYPH"].value,
-                        utils.node_to_cypher(node),
+                    cursor = queries.run(
+                        self.graph,
+                        "match_maps_by_glyph",
+                        {"properties": dict(node)},
+                        labels=batch._labels_to_cypher(node.labels),
                     )
-                    cursor = self.graph.run(query)
                     for record in cursor:
-                        neo_id = record["id(m)"]
-                        query = "MATCH (m:{}) WHERE id(m) = {} \
-                            RETURN m".format(
-                            STONEnum["MAP"].value, neo_id
-                        )
                         maps_to_test += list(
-                            self.query_to_map(query, complete=True)
+                            self.query_to_map(
+                                queries.get_query("match_map_by_identity"),
+                                parameters={"identity": record["identity"]},
+                                complete=True,
+                            )
                         )
             for sbgn_map2 in maps_to_test:
                 if utils.are_maps_equal(sbgn_map, sbgn_map2[0]):
                     return True
             return False
 
-    def create_map(self, sbgn_map, map_id, verbose=False):
+    def create_map(
+        self,
+        sbgn_map,
+        map_id,
+        verbose=False,
+        bulk=False,
+        batch_size=batch.DEFAULT_BATCH_SIZE,
+        make_map_membership=False,
+    ):
         """Add an SBGN map to the database (with the CREATE instruction).
 
+        When `bulk` is set to `True`, the nodes and relationships of the map are written with batched `UNWIND` queries (see :doc:`/stonpy.batch`), which is significantly faster for large maps.
+
         :param sbgn_map: the SBGN map, either a path to an SBGN-ML file or an SBGN map object
         :type sbgn_map: `str` or `libsbgnpy.libsbgn.map <https://libsbgn-python.readthedocs.io/en/latest/libsbgnpy.html#libsbgnpy.libsbgn.map>`_
         :param map_id: the ID of the SBGN map
         :type map_id: `str`, optional
+        :param bulk: if set to `True`, the map is written using batched `UNWIND` queries, default is `False`
+        :type bulk: `bool`, optional
+        :param batch_size: the maximum number of rows per query when `bulk` is set to `True`
+        :type batch_size: `int`, optional
+        :param make_map_membership: if set to `True`, the ID of the map is stored on all its nodes, so that queries can be restricted to the map (see :meth:`query_to_map`), default is `False`
+        :type make_map_membership: `bool`, optional
 
         Here is an example:
 
@@ -157,22 +435,65 @@ class STON(object):
             assert ston.has_map("id1") is True
 
         """
-        if os.path.isfile(sbgn_map):
-            sbgn_map = utils.sbgn_file_to_map(sbgn_map)
-        elif not isinstance(sbgn_map, libsbgn.map):
-            raise ValueError("map must be a valid file or libsbgn.map object")
-        subgraph = conversion.map_to_subgraph(sbgn_map, map_id, verbose=verbose)
+        if bulk:
+            node_rows, relationship_rows = map_to_rows(
+                sbgn_map,
+                map_id,
+                verbose=verbose,
+                make_map_membership=make_map_membership,
+            )
+            self.create_map_rows(
+                map_id, node_rows, relationship_rows, batch_size=batch_size
+            )
+            return
+        subgraph = conversion.map_to_subgraph(
+            _load_map(sbgn_map),
+            map_id,
+            make_map_membership=make_map_membership,
+            verbose=verbose,
+        )
         tx = self.graph.begin()
         tx.create(subgraph)
         tx.commit()
+        self.map_cache.invalidate(map_id)
+
+    def create_map_rows(
+        self,
+        map_id,
+        node_rows,
+        relationship_rows,
+        batch_size=batch.DEFAULT_BATCH_SIZE,
+    ):
+        """Add an SBGN map given as rows to the database.
+
+        The rows are obtained with :func:`map_to_rows`, possibly in another process, and are written with batched `UNWIND` queries in a single transaction, as by :meth:`create_map` with `bulk` set to `True`.
+
+        :param map_id: the ID of the SBGN map
+        :type map_id: `str`
+        :param node_rows: the node rows of the map
+        :type node_rows: `dict[tuple[str], list[dict]]`
+        :param relationship_rows: the relationship rows of the map
+        :type relationship_rows: `dict[str, list[dict]]`
+        :param batch_size: the maximum number of rows per query
+        :type batch_size: `int`, optional
+        """
+        tx = self.graph.begin()
+        batch.create_rows(
+            node_rows, relationship_rows, tx, batch_size=batch_size
+        )
+        tx.commit()
+        self.map_cache.invalidate(map_id)
 
-    def delete_map(self, map_id):
+    def delete_map(self, map_id, batch_size=batch.DEFAULT_BATCH_SIZE):
         """Delete an SBGN map from the database.
 
         Deletes all maps with this ID from the database.
+        The nodes of the maps are first collected layer by layer from their Map nodes, and are then deleted in batches, each batch in its own transaction, so that the time and memory needed to delete a map are linear in its size.
 
         :param map_id: the ID of the SBGN map
         :type map_id: `str`
+        :param batch_size: the maximum number of nodes deleted in a single transaction
+        :type batch_size: `int`, optional
 
         Here is an example:
 
@@ -187,26 +508,46 @@ class STON(object):
             assert ston.has_map("id1") is False
 
         """
-        tx = self.graph.begin()
-        query = "MATCH p=(m:{} {{id: '{}'}})-[*]->() \
-                FOREACH(n IN nodes(p) | DETACH DELETE n)".format(
-            STONEnum["MAP"].value, map_id
+        identities = self._map_node_identities(map_id)
+        for i in range(0, len(identities), batch_size):
+            queries.run(
+                self.graph,
+                "delete_nodes",
+                {"identities": identities[i : i + batch_size]},
+            )
+        self.map_cache.invalidate(map_id)
+
+    def _map_node_identities(self, map_id):
+        cursor = queries.run(
+            self.graph, "match_map_identities", {"map_id": map_id}
         )
-        cursor = tx.run(query)
-        tx.commit()
+        frontier = [record["identity"] for record in cursor]
+        visited = set(frontier)
+        while frontier:
+            cursor = queries.run(
+                self.graph, "match_child_identities", {"identities": frontier}
+            )
+            frontier = []
+            for record in cursor:
+                if record["identity"] not in visited:
+                    visited.add(record["identity"])
+                    frontier.append(record["identity"])
+        return list(visited)
 
-    def get_map(self, map_id):
+    def get_map(self, map_id, use_apoc=True):
         """Retrieve an SBGN map with given ID from the database and returns it.
 
         If no map is retrieved, returns None.
         If multiple maps are retrieved, only the first one is returned.
 
-
-        Note: This method is significantly faster when the Neo4j APOC core
-        Library optional dependency is installed.
+        The map is retrieved with a single query when the Neo4j APOC core Library optional dependency is installed.
+        Otherwise, it is retrieved layer by layer from its Map node, with one query per layer (see :func:`stonpy.completion.complete_subgraph_with_descendants`).
+        When the cache is enabled (see :attr:`map_cache`), the map is first looked up in the cache.
 
         :param map_id: the ID of the SBGN map to retrieve
         :type map_id: `str`
+        :param use_apoc: if set to `True`, APOC is used to retrieve the map when it is installed, default is `True`
+        :type use_apoc: `bool`, optional
         :return: the SBGN map or `None`
         :rtype: `libsbgnpy.libsbgn.map <https://libsbgn-python.readthedocs.io/en/latest/libsbgnpy.html#libsbgnpy.libsbgn.map>`_ or `None`
 
@@ -221,42 +562,162 @@ class STON(object):
             print(sbgn_map)
 
         """
+        report = self._start_report("get_map")
         try:
-            query = 'MATCH (m:{} {{id: "{}"}}) \
-                CALL apoc.path.subgraphAll(m, {{relationshipFilter: ">"}}) \
-                YIELD nodes, relationships \
-                RETURN m, nodes, relationships'.format(
-                STONEnum["MAP"].value, map_id
-            )
-            tx = self.graph.begin()
-            cursor = tx.run(query)
-            tx.commit()
-            for record in cursor:
+            return self._get_cached_map(map_id, use_apoc, report)
+        finally:
+            self._end_report(report)
+
+    def _get_cached_map(self, map_id, use_apoc=True, report=None):
+        sbgn_map = self.map_cache.get(map_id)
+        if sbgn_map is None:
+            generation = self.map_cache.generation(map_id)
+            sbgn_map = self._get_map(map_id, use_apoc, report)
+            if sbgn_map is not None:
+                self.map_cache.put(map_id, sbgn_map, generation)
+        return sbgn_map
+
+    def _get_map(self, map_id, use_apoc, report=None):
+        if use_apoc:
+            try:
+                with instrumentation.phase(report, "retrieval"):
+                    tx = self.graph.begin()
+                    cursor = queries.run(
+                        tx, "get_map_apoc", {"map_id": map_id}
+                    )
+                    tx.commit()
+                    record = next(iter(cursor), None)
+                if record is None:
+                    return None
                 subgraph = Subgraph(
                     nodes=[record["m"]] + record["nodes"],
                     relationships=record["relationships"],
                 )
-                sbgn_maps = conversion.subgraph_to_map(subgraph)
-                for sbgn_map in sbgn_maps:
-                    return sbgn_map
-        except:
-            query = 'MATCH (m:{} {{id: "{}"}}) RETURN m'.format(
-                STONEnum["MAP"].value, map_id
-            )
-            tx = self.graph.begin()
-            cursor = tx.run(query)
-            tx.commit()
-            for record in cursor:
-                subgraph = record.to_subgraph()
-                if subgraph is not None:
-                    subgraph = completion.complete_subgraph(
-                        subgraph, self.graph, complete_process_modulations=True
-                    )
+                with instrumentation.phase(report, "conversion"):
                     sbgn_maps = conversion.subgraph_to_map(subgraph)
                     for sbgn_map in sbgn_maps:
                         return sbgn_map
+                return None
+            except:
+                pass
+        with instrumentation.phase(report, "retrieval"):
+            tx = self.graph.begin(readonly=True)
+            cursor = queries.run(tx, "match_map", {"map_id": map_id})
+            subgraph = None
+            for record in cursor:
+                subgraph = completion.complete_subgraph_with_descendants(
+                    record.to_subgraph(), tx
+                )
+                break
+            tx.commit()
+        with instrumentation.phase(report, "conversion"):
+            sbgn_maps = conversion.subgraph_to_map(subgraph)
+            for sbgn_map in sbgn_maps:
+                return sbgn_map
         return None
 
+    def get_maps(
+        self,
+        map_ids,
+        workers=1,
+        maps_per_query=DEFAULT_MAPS_PER_QUERY,
+        use_apoc=True,
+    ):
+        """Retrieve the SBGN maps with given IDs from the database and yield them as tuples of the form (map, map ID).
+
+        Maps are retrieved by groups of `maps_per_query` maps, each group
+        being retrieved with a single query when the Neo4j APOC core Library
+        optional dependency is installed, and layer by layer otherwise (see
+        :func:`stonpy.completion.complete_subgraphs_with_descendants`).
+        Groups are retrieved and converted to libsbgn maps concurrently by
+        `workers` threads, and maps are yielded as soon as their group is
+        converted, hence not necessarily in the order of `map_ids`.
+
+        IDs that do not match any map are ignored.
+        If multiple maps have the same ID, only one of them is yielded.
+        When the cache is enabled (see :attr:`map_cache`), cached maps are yielded first, and only the other maps are retrieved from the database.
+
+        :param map_ids: the IDs of the SBGN maps to retrieve
+        :type map_ids: `list[str]`
+        :param workers: the number of groups of maps retrieved and converted concurrently, default is `1`
+        :type workers: `int`, optional
+        :param maps_per_query: the maximum number of maps retrieved by a single query, default is `DEFAULT_MAPS_PER_QUERY`
+        :type maps_per_query: `int`, optional
+        :param use_apoc: if set to `True`, APOC is used to retrieve the maps when it is installed, default is `True`
+        :type use_apoc: `bool`, optional
+        :return: a generator of tuples of the form (map, map ID)
+        :rtype: `Iterator[tuple[libsbgnpy.libsbgn.map, str]]`
+
+        Here is an example:
+
+        .. code-block:: python
+
+            for sbgn_map, map_id in ston.get_maps(["id1", "id2"], workers=4):
+                print(map_id, sbgn_map)
+
+        """
+        map_ids = list(dict.fromkeys(map_ids))
+        if self.map_cache.enabled:
+            missing_map_ids = []
+            for map_id in map_ids:
+                sbgn_map = self.map_cache.get(map_id)
+                if sbgn_map is None:
+                    missing_map_ids.append(map_id)
+                else:
+                    yield sbgn_map
+            map_ids = missing_map_ids
+        groups = [
+            map_ids[i : i + maps_per_query]
+            for i in range(0, len(map_ids), maps_per_query)
+        ]
+        if workers <= 1:
+            for group in groups:
+                yield from self._get_maps(group, use_apoc)
+            return
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(self._get_maps, group, use_apoc)
+                for group in groups
+            ]
+            for future in as_completed(futures):
+                yield from future.result()
+
+    def _get_maps(self, map_ids, use_apoc):
+        generations = {
+            map_id: self.map_cache.generation(map_id) for map_id in map_ids
+        }
+        subgraphs = None
+        if use_apoc:
+            try:
+                cursor = queries.run(
+                    self.graph, "get_maps_apoc", {"map_ids": map_ids}
+                )
+                subgraphs = [
+                    Subgraph(
+                        nodes=[record["m"]] + record["nodes"],
+                        relationships=record["relationships"],
+                    )
+                    for record in cursor
+                ]
+            except:
+                subgraphs = None
+        if subgraphs is None:
+            tx = self.graph.begin(readonly=True)
+            cursor = queries.run(tx, "match_maps", {"map_ids": map_ids})
+            subgraphs = completion.complete_subgraphs_with_descendants(
+                [record.to_subgraph() for record in cursor], tx
+            )
+            tx.commit()
+        sbgn_maps = {}
+        for subgraph in subgraphs:
+            for sbgn_map, map_id in conversion.subgraph_to_map(subgraph):
+                if map_id not in sbgn_maps:
+                    sbgn_maps[map_id] = (sbgn_map, map_id)
+                    self.map_cache.put(
+                        map_id, sbgn_maps[map_id], generations.get(map_id)
+                    )
+        return list(sbgn_maps.values())
+
     def get_map_to_sbgn_file(self, map_id, sbgn_file):
         """Retrieve a map with given ID from the database and write it to the given SBGN-ML file.
 
@@ -281,9 +742,13 @@ class STON(object):
                 print("".join(f.readlines()[:10]))
 
         """
-        sbgn_map = self.get_map(map_id)
-        if sbgn_map is not None:
-            utils.map_to_sbgn_file(sbgn_map[0], sbgn_file)
+        report = self._start_report("get_map_to_sbgn_file")
+        try:
+            sbgn_map = self._get_cached_map(map_id, report=report)
+            if sbgn_map is not None:
+                _write_map(sbgn_map[0], sbgn_file, report)
+        finally:
+            self._end_report(report)
 
     def query_to_map(
         self,
@@ -292,14 +757,29 @@ class STON(object):
         merge_records=False,
         to_top_left=False,
         complete_process_modulations=False,
+        parameters=None,
+        map_ids=None,
+        fetch_size=DEFAULT_FETCH_SIZE,
+        workers=1,
+        ordered=True,
+        memo=None,
+        budget=None,
     ):
         """Run a cypher query against the database and return the resulting SBGN maps.
 
         By default, each record resulting from the query is transformed to zero or more SBGN maps, one for each Map node it contains.
         The resulting SBGN maps are then returned one by one. Only distinct SBGN maps are returned.
+        Records are streamed from the database by batches of `fetch_size` records, and each record is transformed as soon as it is received, so that the first maps are returned before the query has been fully consumed, and that records are not all held in memory.
+        Records that are identical to an already transformed record are skipped; only a compact digest of each transformed record is kept for that purpose (see :func:`stonpy.utils.subgraph_digest`).
         When `merge_records` is set to `True`, records are merged before being transformed to SBGN maps.
         When `complete` is set to `True`, records are completed before being transformed; a node or a relationship of a record is always completed by all other nodes and relationships that are ultimately necessary to form a valid map from it (see :ref:`completion` for more details).
         Hence if `complete` is set to `True`, at least one valid SBGN map will be returned as long as at least one record contains a node or a relationship.
+        When `workers` is greater than 1, records are completed and transformed concurrently by `workers` threads, each running its queries on its own connection of the connection pool of :attr:`graph`; the resulting maps are returned in the order of the records if `ordered` is set to `True`, and as soon as they are ready otherwise.
+        The lookups run to complete the records are memoized (see :class:`stonpy.completion.CompletionMemo`), so that the neighbourhood of a node shared by several records is only retrieved once. By default, a new memo is used for each call; a memo may also be passed with `memo` to be shared by several calls, as long as the maps of the database are not modified.
+        When `budget` is set, the completion of each record is limited in number of nodes, round trips and time (see :class:`stonpy.completion.CompletionBudget`): the completion of a record that reaches one of these limits is truncated, the record is transformed to possibly incomplete SBGN maps, and the truncation is reported in the `truncations` attribute of the budget.
+        When `map_ids` is set, the results are restricted to the maps with these IDs, which must have been created with `make_map_membership` set to `True` (see :meth:`create_map`): the IDs are passed to the query as the `$map_ids` parameter, and nodes of the records that do not belong to one of these maps are discarded before completion.
+        The query is not rewritten: a query that does not use `$map_ids` itself still matches all the maps of the database, and its records are only filtered afterwards, so that it is no faster than without `map_ids`.
+        To be scoped, the query must restrict its matches with the `$map_ids` parameter itself, e.g. `MATCH (g:Glyph) WHERE g.mapId IN $map_ids`, which is backed by an index (see :meth:`ensure_indexes`).
 
         :param query: the cypher query
         :type query: `str`
@@ -311,6 +791,20 @@ class STON(object):
         :type to_top_left: bool, optional
         :param complete_process_modulations: option to complete processes with the modulations targetting it, default is `False`
         :type complete_process_modulations: `bool`
+        :param parameters: the parameters of the cypher query, default is `None`
+        :type parameters: `dict`, optional
+        :param map_ids: the IDs of the maps the query is restricted to, default is `None`
+        :type map_ids: `list[str]`, optional
+        :param fetch_size: the number of records fetched from the database at a time, default is `DEFAULT_FETCH_SIZE`
+        :type fetch_size: `int`, optional
+        :param workers: the number of records completed and transformed concurrently, default is `1`
+        :type workers: `int`, optional
+        :param ordered: if set to `True`, the maps are returned in the order of the records when `workers` is greater than 1, default is `True`
+        :type ordered: `bool`, optional
+        :param memo: the completion memo, default is `None` (a new memo is used)
+        :type memo: `stonpy.completion.CompletionMemo`, optional
+        :param budget: the limits of the completion of each record, default is `None` (no limit)
+        :type budget: `stonpy.completion.CompletionBudget`, optional
         :return: the resulting SBGN maps, under the form of a generator. Each returned element is a tuple of the form (map, map_id).
         :rtype: `Iterator[(`libsbgnpy.libsbgn.map <https://libsbgn-python.readthedocs.io/en/latest/libsbgnpy.html#libsbgnpy.libsbgn.map>`_, str)]`
 
@@ -351,29 +845,158 @@ class STON(object):
                 print(sbgn_map) # (<id>, <sbgn_map>)
 
         """
-        tx = self.graph.begin()
-        cursor = tx.run(query)
-        tx.commit()
-        subgraphs = set([])
+        report = self._start_report("query_to_map")
+        try:
+            yield from self._query_to_map(
+                query,
+                complete=complete,
+                merge_records=merge_records,
+                to_top_left=to_top_left,
+                complete_process_modulations=complete_process_modulations,
+                parameters=parameters,
+                map_ids=map_ids,
+                fetch_size=fetch_size,
+                workers=workers,
+                ordered=ordered,
+                memo=memo,
+                budget=budget,
+                report=report,
+            )
+        finally:
+            self._end_report(report)
+
+    def _query_to_map(
+        self,
+        query,
+        complete=True,
+        merge_records=False,
+        to_top_left=False,
+        complete_process_modulations=False,
+        parameters=None,
+        map_ids=None,
+        fetch_size=DEFAULT_FETCH_SIZE,
+        workers=1,
+        ordered=True,
+        memo=None,
+        budget=None,
+        report=None,
+    ):
+        if map_ids is not None:
+            map_ids = list(map_ids)
+            parameters = dict(parameters or {}, map_ids=map_ids)
+        records = self._stream(query, parameters, fetch_size)
+        if report is not None:
+            records = _in_phase(records, report, "query")
         if merge_records:
-            subgraphs.add(cursor.to_subgraph())
+            subgraphs = [_merge_records(records)]
         else:
-            for record in cursor:
-                subgraphs.add(record.to_subgraph())
-        i = 0
-        if complete:
+            subgraphs = (record.to_subgraph() for record in records)
+        subgraphs = _distinct_subgraphs(subgraphs, map_ids)
+        if memo is None:
+            memo = completion.CompletionMemo()
+        if workers <= 1:
             for subgraph in subgraphs:
-                if subgraph is not None:
-                    subgraph = completion.complete_subgraph(
-                        subgraph,
-                        self.graph,
-                        complete_process_modulations=complete_process_modulations,
+                yield from self._complete_subgraph_to_maps(
+                    subgraph,
+                    complete,
+                    complete_process_modulations,
+                    to_top_left,
+                    memo,
+                    budget,
+                    report,
+                )
+            return
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # at most 2 * workers records are held at a time, so that
+            # records are still streamed
+            futures = deque()
+            try:
+                for subgraph in subgraphs:
+                    futures.append(
+                        executor.submit(
+                            self._complete_subgraph_to_maps,
+                            subgraph,
+                            complete,
+                            complete_process_modulations,
+                            to_top_left,
+                            memo,
+                            budget,
+                            report,
+                        )
                     )
-                    sbgn_maps = conversion.subgraph_to_map(subgraph)
-                    for sbgn_map in sbgn_maps:
-                        if to_top_left:
-                            utils.map_to_top_left(sbgn_map[0])
-                        yield sbgn_map
+                    if len(futures) >= 2 * workers:
+                        yield from _next_result(futures, ordered)
+                while futures:
+                    yield from _next_result(futures, ordered)
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def _complete_subgraph_to_maps(
+        self,
+        subgraph,
+        complete,
+        complete_process_modulations,
+        to_top_left,
+        memo=None,
+        budget=None,
+        report=None,
+    ):
+        if complete:
+            with instrumentation.phase(report, "completion"):
+                subgraph = completion.complete_subgraph(
+                    subgraph,
+                    self.graph,
+                    complete_process_modulations=complete_process_modulations,
+                    memo=memo,
+                    budget=budget,
+                )
+        with instrumentation.phase(report, "conversion"):
+            sbgn_maps = list(conversion.subgraph_to_map(subgraph))
+        if to_top_left:
+            with instrumentation.phase(report, "to_top_left"):
+                for sbgn_map in sbgn_maps:
+                    utils.map_to_top_left(sbgn_map[0])
+        return sbgn_maps
+
+    def _stream(self, query, parameters=None, fetch_size=DEFAULT_FETCH_SIZE):
+        # runs the query in a read transaction and yields its records,
+        # pulling them from the server fetch_size records at a time;
+        # py2neo's Transaction.run always pulls the whole result, so the
+        # connector is driven directly, which is why py2neo is pinned to
+        # its final release (2021.2.4)
+        if not isinstance(self.graph, Graph):
+            # other graphs (e.g. memory graphs) return all records at once
+            records = self.graph.run(query, parameters)
+            instrumentation.count_round_trip(len(records))
+            yield from records
+            return
+        connector = self.graph.service.connector
+        tx = connector.begin(self.graph.name, readonly=True)
+        try:
+            result = connector.run(tx, query, parameters)
+            try:
+                connector.pull(result, fetch_size)
+            except IndexError:
+                # Bolt 3 does not support pulling part of a result
+                connector.pull(result)
+                fetch_size = None
+            cursor = Cursor(
+                result, Connection.default_hydrant(connector.profile, self.graph)
+            )
+            instrumentation.count_round_trip()
+            while True:
+                for record in cursor:
+                    instrumentation.count_records(1)
+                    yield record
+                if fetch_size is None or not result.has_more_records():
+                    break
+                connector.pull(result, fetch_size)
+                instrumentation.count_round_trip()
+        except BaseException:
+            connector.rollback(tx)
+            raise
+        connector.commit(tx)
 
     def query_to_sbgn_file(
         self,
@@ -383,6 +1006,8 @@ class STON(object):
         merge_records=True,
         to_top_left=False,
         complete_process_modulations=False,
+        parameters=None,
+        map_ids=None,
     ):
         """Run a cypher query against the database and write the resulting SBGN maps to one or more SBGN-ML files.
 
@@ -404,6 +1029,10 @@ class STON(object):
         :type to_top_left: `bool`, optional
         :param complete_process_modulations: option to complete processes with the modulations targetting it, default is `False`
         :type complete_process_modulations: `bool`
+        :param parameters: the parameters of the cypher query, default is `None`
+        :type parameters: `dict`, optional
+        :param map_ids: the IDs of the maps the query is restricted to (see :meth:`query_to_map`), default is `None`
+        :type map_ids: `list[str]`, optional
         :return: the resulting SBGN-ML file names
         :rtype: `list[str]`
 
@@ -444,13 +1073,43 @@ class STON(object):
             print(sbgn_files) # ["result.sbgn"]
 
         """
+        report = self._start_report("query_to_sbgn_file")
+        try:
+            return self._query_to_sbgn_file(
+                query,
+                sbgn_file,
+                complete=complete,
+                merge_records=merge_records,
+                to_top_left=to_top_left,
+                complete_process_modulations=complete_process_modulations,
+                parameters=parameters,
+                map_ids=map_ids,
+                report=report,
+            )
+        finally:
+            self._end_report(report)
 
-        sbgn_maps = self.query_to_map(
+    def _query_to_sbgn_file(
+        self,
+        query,
+        sbgn_file,
+        complete=True,
+        merge_records=True,
+        to_top_left=False,
+        complete_process_modulations=False,
+        parameters=None,
+        map_ids=None,
+        report=None,
+    ):
+        sbgn_maps = self._query_to_map(
             query=query,
+            parameters=parameters,
+            map_ids=map_ids,
             complete=complete,
             merge_records=merge_records,
             to_top_left=to_top_left,
             complete_process_modulations=complete_process_modulations,
+            report=report,
         )
         sbgn_files = []
         try:
@@ -464,7 +1123,7 @@ class STON(object):
                 sbgn_map2 = next(sbgn_maps)
             except StopIteration:
                 sbgn_files.append(sbgn_file)
-                utils.map_to_sbgn_file(sbgn_map1[0], sbgn_file)
+                _write_map(sbgn_map1[0], sbgn_file, report)
             except:
                 raise
             else:
@@ -479,10 +1138,498 @@ class STON(object):
                 sbgn_file2 = f"{root}_2.{ext}"
                 sbgn_files.append(sbgn_file1)
                 sbgn_files.append(sbgn_file2)
-                utils.map_to_sbgn_file(sbgn_map1[0], sbgn_file1)
-                utils.map_to_sbgn_file(sbgn_map2[0], sbgn_file2)
+                _write_map(sbgn_map1[0], sbgn_file1, report)
+                _write_map(sbgn_map2[0], sbgn_file2, report)
                 for i, sbgn_map in enumerate(sbgn_maps):
                     sbgn_filen = f"{root}_{i + 3}.{ext}"
                     sbgn_files.append(sbgn_filen)
-                    utils.map_to_sbgn_file(sbgn_map[0], sbgn_filen)
+                    _write_map(sbgn_map[0], sbgn_filen, report)
         return sbgn_files
+
+
+async def _run_in_thread(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, functools.partial(func, *args, **kwargs)
+    )
+
+
+def _subgraph_to_maps(subgraph, to_top_left=False):
+    sbgn_maps = list(conversion.subgraph_to_map(subgraph))
+    if to_top_left:
+        for sbgn_map in sbgn_maps:
+            utils.map_to_top_left(sbgn_map[0])
+    return sbgn_maps
+
+
+class _Entities(object):
+    # converts the entities returned by the Neo4j driver to py2neo entities,
+    # so that the rest of stonpy can be used on them; a given database entity
+    # is always converted to the same py2neo entity, whose identity is the
+    # element ID of the database entity (the legacy integer identities are
+    # deprecated in the driver)
+
+    def __init__(self):
+        self._nodes = {}
+        self._relationships = {}
+
+    def node(self, entity):
+        node = self._nodes.get(entity.element_id)
+        if node is None:
+            node = Node(*entity.labels, **dict(entity))
+            node.identity = entity.element_id
+            self._nodes[entity.element_id] = node
+        elif not node.labels and entity.labels:
+            # the node was first seen as the end of a relationship, without
+            # its labels and properties
+            node.update_labels(entity.labels)
+            node.update(dict(entity))
+        return node
+
+    def relationship(self, entity):
+        relationship = self._relationships.get(entity.element_id)
+        if relationship is None:
+            relationship = Relationship.type(entity.type)(
+                self.node(entity.start_node),
+                self.node(entity.end_node),
+                **dict(entity),
+            )
+            relationship.identity = entity.element_id
+            self._relationships[entity.element_id] = relationship
+        return relationship
+
+    def record_to_subgraph(self, record):
+        nodes = set([])
+        relationships = set([])
+        for value in record.values():
+            if isinstance(value, neo4j.graph.Node):
+                nodes.add(self.node(value))
+            elif isinstance(value, neo4j.graph.Relationship):
+                relationship = self.relationship(value)
+                relationships.add(relationship)
+                nodes |= set(relationship.nodes)
+            elif isinstance(value, neo4j.graph.Path):
+                for node in value.nodes:
+                    nodes.add(self.node(node))
+                for relationship in value.relationships:
+                    relationships.add(self.relationship(relationship))
+        if not nodes:
+            return None
+        return Subgraph(nodes, relationships)
+
+
+class AsyncSTON(object):
+    """
+    Asynchronous class for storing, retrieving and querying maps from a Neo4j database
+
+    AsyncSTON is built on the asynchronous API of the official Neo4j Python driver, which is an optional dependency of stonpy (`pip install stonpy[async]`).
+    Entities are identified by their element IDs, the legacy integer identities being deprecated in the driver: AsyncSTON hence requires Neo4j 5 or later.
+    Its methods are coroutines that do not block the event loop: queries are run asynchronously, and the conversion of maps to and from subgraphs is run in the default executor of the loop.
+    During completion (see :ref:`completion`), the nodes of a layer are looked up with one query per kind of node, as with :class:`STON`, and these queries are run concurrently, each in its own session, with at most `max_concurrency` queries running at the same time.
+
+    :ivar uri: the URI of the running Neo4j database
+    :ivar user: the username
+    :ivar password: the password
+    :ivar database: the name of the database, default is `None` (i.e. the default database)
+    :ivar max_concurrency: the maximum number of queries run concurrently, default is `DEFAULT_MAX_CONCURRENCY`
+
+    Here is an example:
+
+    .. code-block:: python
+
+        import asyncio
+
+        import stonpy
+
+        URI = "my_uri"
+        USER = "my_user"
+        PASSWORD = "my_password"
+
+        async def main():
+            async with stonpy.AsyncSTON(URI, USER, PASSWORD) as ston:
+                await ston.create_map("insulin.sbgn", "id1")
+                sbgn_map = await ston.get_map("id1")
+                async for sbgn_map in ston.query_to_map("MATCH (g:Glyph) RETURN g"):
+                    print(sbgn_map)
+
+        asyncio.run(main())
+    """
+
+    def __init__(
+        self,
+        uri,
+        user,
+        password,
+        database=None,
+        max_concurrency=DEFAULT_MAX_CONCURRENCY,
+    ):
+        if AsyncGraphDatabase is None:
+            raise ImportError(
+                "AsyncSTON requires the neo4j package (pip install stonpy[async])"
+            )
+        self._driver = AsyncGraphDatabase.driver(uri, auth=(user, password))
+        self._database = database
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    @property
+    def driver(self):
+        """
+        The asynchronous Neo4j driver, of type `neo4j.AsyncDriver <https://neo4j.com/docs/api/python-driver/current/async_api.html#neo4j.AsyncDriver>`_.
+        """
+        return self._driver
+
+    async def close(self):
+        """Close the driver and all its connections."""
+        await self._driver.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def _session(self):
+        return self._driver.session(database=self._database)
+
+    async def _run(self, name, parameters=None, **structure):
+        async with self._semaphore, self._session() as session:
+            return await queries.run_async(
+                session, name, parameters, **structure
+            )
+
+    async def has_map(self, map_id=None, sbgn_map=None):
+        """Check whether the database contains a given SBGN map
+
+        See :meth:`STON.has_map`.
+
+        :param map_id: the ID of the SBGN map, default is `None`
+        :type map_id: `str`, optional
+        :param sbgn_map: the SBGN map, either a path to an SBGN-ML file or an SBGN map object, default is `None`
+        :type sbgn_map: `str` or `libsbgnpy.libsbgn.map <https://libsbgn-python.readthedocs.io/en/latest/libsbgnpy.html#libsbgnpy.libsbgn.map>`_
+        :return: `True` if the database contains the SBGN map, `False` otherwise
+        :rtype: `bool`
+        """
+        if sbgn_map is None:
+            if map_id is None:
+                return False
+            records = await self._run("match_map", {"map_id": map_id})
+            return len(records) > 0
+        if isinstance(sbgn_map, str):
+            if os.path.isfile(sbgn_map):
+                sbgn_map = await _run_in_thread(
+                    utils.sbgn_file_to_map, sbgn_map
+                )
+        fingerprint = utils.map_fingerprint_or_none(sbgn_map)
+        parameters = {"map_id": map_id}
+        if fingerprint is not None:
+            records = await self._run(
+                "count_maps_by_fingerprint",
+                dict(parameters, fingerprint=fingerprint),
+            )
+            if records[0][0]:
+                return True
+        # maps created before fingerprints were introduced, or whose
+        # fingerprint could not be computed, can only be compared after
+        # being retrieved
+        records = await self._run("count_maps_without_fingerprint", parameters)
+        if not records[0][0]:
+            return False
+        maps_to_test = []
+        if map_id is not None:
+            async for sbgn_map2 in self.query_to_map(
+                queries.get_query("match_map"), parameters={"map_id": map_id}
+            ):
+                maps_to_test.append(sbgn_map2)
+        else:
+            node = await _run_in_thread(_map_glyph_node, sbgn_map)
+            if node is not None:  # i.e. the map is not empty
+                records = await self._run(
+                    "match_maps_by_glyph_by_element_id",
+                    {"properties": dict(node)},
+                    labels=batch._labels_to_cypher(node.labels),
+                )
+                for record in records:
+                    async for sbgn_map2 in self.query_to_map(
+                        queries.get_query(
+                            "match_map_by_identity_by_element_id"
+                        ),
+                        parameters={"identity": record["identity"]},
+                    ):
+                        maps_to_test.append(sbgn_map2)
+        for sbgn_map2 in maps_to_test:
+            if utils.are_maps_equal(sbgn_map, sbgn_map2[0]):
+                return True
+        return False
+
+    async def create_map(
+        self,
+        sbgn_map,
+        map_id,
+        verbose=False,
+        batch_size=batch.DEFAULT_BATCH_SIZE,
+        make_map_membership=False,
+    ):
+        """Add an SBGN map to the database.
+
+        The map is always written with batched `UNWIND` queries (see :doc:`/stonpy.batch`), in a single transaction.
+        See :meth:`STON.create_map`.
+
+        :param sbgn_map: the SBGN map, either a path to an SBGN-ML file or an SBGN map object
+        :type sbgn_map: `str` or `libsbgnpy.libsbgn.map <https://libsbgn-python.readthedocs.io/en/latest/libsbgnpy.html#libsbgnpy.libsbgn.map>`_
+        :param map_id: the ID of the SBGN map
+        :type map_id: `str`, optional
+        :param batch_size: the maximum number of rows per query
+        :type batch_size: `int`, optional
+        :param make_map_membership: if set to `True`, the ID of the map is stored on all its nodes, default is `False`
+        :type make_map_membership: `bool`, optional
+        """
+        node_rows, relationship_rows = await _run_in_thread(
+            map_to_rows,
+            sbgn_map,
+            map_id,
+            verbose=verbose,
+            make_map_membership=make_map_membership,
+        )
+
+        async def create_rows(tx):
+            await batch.create_rows_async(
+                node_rows, relationship_rows, tx, batch_size=batch_size
+            )
+
+        async with self._semaphore, self._session() as session:
+            await session.execute_write(create_rows)
+
+    async def delete_map(self, map_id, batch_size=batch.DEFAULT_BATCH_SIZE):
+        """Delete an SBGN map from the database.
+
+        See :meth:`STON.delete_map`.
+
+        :param map_id: the ID of the SBGN map
+        :type map_id: `str`
+        :param batch_size: the maximum number of nodes deleted in a single transaction
+        :type batch_size: `int`, optional
+        """
+        identities = await self._map_node_identities(map_id)
+        for i in range(0, len(identities), batch_size):
+            await self._run(
+                "delete_nodes_by_element_id",
+                {"identities": identities[i : i + batch_size]},
+            )
+
+    async def _map_node_identities(self, map_id):
+        records = await self._run(
+            "match_map_identities_by_element_id", {"map_id": map_id}
+        )
+        frontier = [record["identity"] for record in records]
+        visited = set(frontier)
+        while frontier:
+            records = await self._run(
+                "match_child_identities_by_element_id",
+                {"identities": frontier},
+            )
+            frontier = []
+            for record in records:
+                if record["identity"] not in visited:
+                    visited.add(record["identity"])
+                    frontier.append(record["identity"])
+        return list(visited)
+
+    async def get_map(self, map_id, use_apoc=True):
+        """Retrieve an SBGN map with given ID from the database and returns it.
+
+        See :meth:`STON.get_map`.
+
+        :param map_id: the ID of the SBGN map to retrieve
+        :type map_id: `str`
+        :param use_apoc: if set to `True`, APOC is used to retrieve the map when it is installed, default is `True`
+        :type use_apoc: `bool`, optional
+        :return: the SBGN map or `None`
+        :rtype: `libsbgnpy.libsbgn.map <https://libsbgn-python.readthedocs.io/en/latest/libsbgnpy.html#libsbgnpy.libsbgn.map>`_ or `None`
+        """
+        entities = _Entities()
+        subgraph = None
+        if use_apoc:
+            try:
+                records = await self._run("get_map_apoc", {"map_id": map_id})
+            except Exception:
+                records = None
+            if records is not None:
+                if not records:
+                    return None
+                record = records[0]
+                subgraph = Subgraph(
+                    nodes=[entities.node(record["m"])]
+                    + [entities.node(node) for node in record["nodes"]],
+                    relationships=[
+                        entities.relationship(relationship)
+                        for relationship in record["relationships"]
+                    ],
+                )
+        if subgraph is None:
+
+            async def match_map(tx):
+                records = await queries.run_async(
+                    tx, "match_map", {"map_id": map_id}
+                )
+                if not records:
+                    return None
+                return await _complete_subgraph_with_descendants(
+                    Subgraph([entities.node(records[0]["m"])]), tx, entities
+                )
+
+            async with self._semaphore, self._session() as session:
+                subgraph = await session.execute_read(match_map)
+            if subgraph is None:
+                return None
+        sbgn_maps = await _run_in_thread(_subgraph_to_maps, subgraph)
+        for sbgn_map in sbgn_maps:
+            return sbgn_map
+        return None
+
+    async def query_to_map(
+        self,
+        query,
+        complete=True,
+        merge_records=False,
+        to_top_left=False,
+        complete_process_modulations=False,
+        parameters=None,
+        map_ids=None,
+    ):
+        """Run a cypher query against the database and yield the resulting SBGN maps.
+
+        This method is an asynchronous generator, to be used with `async for`.
+        See :meth:`STON.query_to_map`.
+
+        :param query: the cypher query
+        :type query: `str`
+        :param complete: if set to `True`, records are completed before being transformed to SBGN maps, default is `True`
+        :type complete: `bool`, optional
+        :param merge_records: if set to `True`, records are merged before being transformed to SBGN maps, default is `False`
+        :type merge_records: `bool`, optional
+        :param to_top_left: if set to `True`, the resulting maps are moved to the top left corner, default is `False`
+        :type to_top_left: `bool`, optional
+        :param complete_process_modulations: option to complete processes with the modulations targetting it, default is `False`
+        :type complete_process_modulations: `bool`, optional
+        :param parameters: the parameters of the query, default is `None`
+        :type parameters: `dict`, optional
+        :param map_ids: the IDs of the maps the results are restricted to (see :meth:`STON.query_to_map`; the query must use the `$map_ids` parameter to be scoped), default is `None`
+        :type map_ids: `list[str]`, optional
+        :return: an asynchronous generator of tuples of the form (map, map ID)
+        :rtype: `AsyncIterator[tuple[libsbgnpy.libsbgn.map, str]]`
+        """
+        if map_ids is not None:
+            map_ids = list(map_ids)
+            parameters = dict(parameters or {}, map_ids=map_ids)
+        entities = _Entities()
+        digests = set([])
+        async for subgraph in self._stream_subgraphs(
+            query, parameters, entities, merge_records
+        ):
+            if map_ids is not None:
+                subgraph = utils.restrict_subgraph_to_maps(subgraph, map_ids)
+            if subgraph is None:
+                continue
+            digest = utils.subgraph_digest(subgraph)
+            if digest in digests:
+                continue
+            digests.add(digest)
+            if complete:
+                subgraph = await self._complete_subgraph(
+                    subgraph, entities, complete_process_modulations
+                )
+            sbgn_maps = await _run_in_thread(
+                _subgraph_to_maps, subgraph, to_top_left
+            )
+            for sbgn_map in sbgn_maps:
+                yield sbgn_map
+
+    async def _stream_subgraphs(
+        self, query, parameters, entities, merge_records=False
+    ):
+        # records are converted to subgraphs as they are received, so that
+        # each one is completed and transformed before the next one is
+        # fetched; the query only holds the semaphore until it is started,
+        # as the completion of its records runs queries in other sessions
+        async with self._session() as session:
+            async with self._semaphore:
+                result = await session.run(query, parameters)
+            if not merge_records:
+                async for record in result:
+                    yield entities.record_to_subgraph(record)
+                return
+            merged = utils.SubgraphAccumulator()
+            async for record in result:
+                merged.add_subgraph(entities.record_to_subgraph(record))
+        yield merged.to_subgraph()
+
+    async def _complete_subgraph(
+        self, subgraph, entities, complete_process_modulations
+    ):
+        # same completion as completion.complete_subgraph, the queues of
+        # lookups of a layer being run concurrently
+        arcs = await self._match_shortcut_arcs(
+            subgraph.relationships, entities
+        )
+        worklist = completion.CompletionWorklist(
+            subgraph, arcs, complete_process_modulations
+        )
+        while worklist:
+            queues = worklist.next_lookups()
+            results = await asyncio.gather(
+                *[
+                    self._match_relationships(identities, r_types, entities)
+                    for r_types, identities in queues.items()
+                ]
+            )
+            found = {}
+            for result in results:
+                found.update(result)
+            worklist.add_results(found)
+        return worklist.result.to_subgraph()
+
+    async def _match_shortcut_arcs(self, relationships, entities):
+        shortcuts = []
+        for relationship in relationships:
+            parameters = completion.shortcut_arc_parameters(relationship)
+            if parameters is not None:
+                shortcuts.append(parameters)
+        if not shortcuts:
+            return []
+        records = await self._run(
+            "match_arcs_of_shortcuts_by_element_id", {"shortcuts": shortcuts}
+        )
+        arcs = completion.shortcut_arcs_of_records(records)
+        return [entities.node(arc) for arc in arcs.values()]
+
+    async def _match_relationships(self, identities, r_types, entities):
+        records = await self._run(
+            "match_relationships_of_nodes_by_element_id",
+            {"identities": identities},
+            r_types=":" + "|".join(r_types),
+        )
+        results = {(identity, r_types): [] for identity in identities}
+        for record in records:
+            other_node = entities.node(record["other"])
+            results[(record["identity"], r_types)].append(
+                (entities.relationship(record["r"]), other_node)
+            )
+        return results
+
+
+async def _complete_subgraph_with_descendants(subgraph, tx, entities):
+    # asynchronous counterpart of
+    # completion.complete_subgraph_with_descendants
+    result = utils.SubgraphAccumulator(subgraph)
+    frontier = [[node.identity, 0] for node in result.nodes]
+    while frontier:
+        records = await queries.run_async(
+            tx, "match_children_by_element_id", {"frontier": frontier}
+        )
+        frontier = []
+        for record in records:
+            child = entities.node(record["child"])
+            if result.node(child.identity) is None:
+                frontier.append([child.identity, 0])
+            result.add(entities.relationship(record["r"]))
+    return result.to_subgraph()
@@ -0,0 +1,160 @@
+"""The module for instrumenting the calls to stonpy.
+
+An instrumented call (see :meth:`stonpy.core.STON.instrument`) produces a
+:class:`CallReport`, with the time spent in each phase of the call, and the
+number of database round trips and of records fetched in each phase.
+
+The phases are the following:
+
+- `query`: running the user query and fetching its records
+- `retrieval`: retrieving a map by its ID
+- `completion`: completing the records (see :ref:`completion`)
+- `conversion`: converting subgraphs to SBGN maps
+- `to_top_left`: moving the maps to the top left of their canvas
+- `serialization`: writing the maps to SBGN-ML files
+
+When records are completed concurrently, the times of the `completion`,
+`conversion` and `to_top_left` phases are summed over all workers.
+"""
+
+import contextlib
+import contextvars
+import threading
+import time
+from collections import Counter, defaultdict
+
+# the report and the phase that database round trips and records are
+# counted in
+_current_phase = contextvars.ContextVar("current_phase", default=None)
+
+
+class CallReport(object):
+    """The report of an instrumented call.
+
+    :ivar name: the name of the call (e.g. `"query_to_map"`)
+    :ivar total: the total time (in seconds) of the call, from its start to the end of the consumption of its results
+    :ivar times: the time (in seconds) spent in each phase
+    :ivar round_trips: the number of database round trips, by phase
+    :ivar records: the number of records fetched from the database, by phase
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.total = 0.0
+        self.times = defaultdict(float)
+        self.round_trips = Counter()
+        self.records = Counter()
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Return a context manager that accounts the time spent in its block, and the round trips and records counted in its block, to the given phase.
+
+        :param name: the name of the phase
+        :type name: `str`
+        """
+        token = _current_phase.set((self, name))
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            _current_phase.reset(token)
+            with self._lock:
+                self.times[name] += duration
+
+    def count(self, phase, round_trips=0, records=0):
+        """Count round trips and records in a phase.
+
+        :param phase: the name of the phase
+        :type phase: `str`
+        :param round_trips: the number of round trips, default is `0`
+        :type round_trips: `int`, optional
+        :param records: the number of records, default is `0`
+        :type records: `int`, optional
+        """
+        with self._lock:
+            self.round_trips[phase] += round_trips
+            self.records[phase] += records
+
+    def finish(self):
+        """Set the total time of the call."""
+        self.total = time.perf_counter() - self._start
+
+    def as_dict(self):
+        """Return the report as a dictionary.
+
+        :rtype: `dict`
+        """
+        with self._lock:
+            return {
+                "name": self.name,
+                "total": self.total,
+                "times": dict(self.times),
+                "round_trips": dict(self.round_trips),
+                "records": dict(self.records),
+            }
+
+
+class Instrumentation(object):
+    """Collector of the reports of instrumented calls.
+
+    :ivar reports: the reports of the calls, in the order they finished
+    :ivar callback: the function called with the report of each call when it finishes, or `None`
+    """
+
+    def __init__(self, callback=None):
+        self.reports = []
+        self.callback = callback
+        self._lock = threading.Lock()
+
+    def add(self, report):
+        """Add the report of a finished call.
+
+        :param report: the report
+        :type report: `CallReport`
+        """
+        with self._lock:
+            self.reports.append(report)
+        if self.callback is not None:
+            self.callback(report)
+
+
+def phase(report, name):
+    """Return a context manager accounting its block to a phase of a report.
+
+    See :meth:`CallReport.phase`.
+
+    :param report: the report, or `None` if the call is not instrumented
+    :type report: `CallReport` or `None`
+    :param name: the name of the phase
+    :type name: `str`
+    """
+    if report is None:
+        return contextlib.nullcontext()
+    return report.phase(name)
+
+
+def count_round_trip(records=0):
+    """Count a database round trip, and the records it fetched, in the current phase, if any.
+
+    :param records: the number of records, default is `0`
+    :type records: `int`, optional
+    """
+    current_phase = _current_phase.get()
+    if current_phase is not None:
+        report, name = current_phase
+        report.count(name, round_trips=1, records=records)
+
+
+def count_records(records):
+    """Count records fetched from the database in the current phase, if any.
+
+    :param records: the number of records
+    :type records: `int`
+    """
+    current_phase = _current_phase.get()
+    if current_phase is not None:
+        report, name = current_phase
+        report.count(name, records=records)
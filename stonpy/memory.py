@@ -0,0 +1,645 @@
+"""The module for storing maps in memory instead of in a Neo4j database.
+
+A :class:`MemoryGraph` holds nodes and relationships in memory, indexed by
+identity, and relationships additionally by node, direction and type, so that
+the relationships of a given type of a node are found with two dictionary
+lookups.
+It can be used in place of a `py2neo.Graph` by :class:`stonpy.core.STON` and
+by :func:`stonpy.completion.complete_subgraph`, e.g. to test code using stonpy
+or to analyse collections of maps offline, without a running database.
+
+A memory graph only runs the internal queries of stonpy (see
+:mod:`stonpy.queries`): it cannot run arbitrary Cypher queries.
+Other queries can be given a Python implementation with
+:meth:`MemoryGraph.register_query`; nodes can also be found with
+:meth:`MemoryGraph.match_nodes`, and completed with
+:func:`stonpy.completion.complete_subgraph`.
+
+Here is an example:
+
+.. code-block:: python
+
+    import stonpy
+    import stonpy.completion as completion
+    import stonpy.conversion as conversion
+    from stonpy.memory import MemoryGraph
+    from py2neo import Subgraph
+
+    ston = stonpy.STON(graph=MemoryGraph())
+    ston.create_map("insulin.sbgn", "id1")
+    assert ston.has_map("id1") is True
+
+    processes = ston.graph.match_nodes("StoichiometricProcess")
+    subgraph = completion.complete_subgraph(Subgraph(processes), ston.graph)
+    for sbgn_map, map_id in conversion.subgraph_to_map(subgraph):
+        print(map_id, sbgn_map)
+
+    # or, with a query
+    query = "MATCH (p:StoichiometricProcess) RETURN p"
+    ston.graph.register_query(
+        query,
+        lambda graph, parameters: (
+            ["p"],
+            [[p] for p in graph.match_nodes("StoichiometricProcess")],
+        ),
+    )
+    for sbgn_map, map_id in ston.query_to_map(query):
+        print(map_id, sbgn_map)
+"""
+
+import threading
+from collections import defaultdict
+
+from py2neo import Node, Relationship
+from py2neo.cypher import Record
+
+import stonpy.queries as queries
+from stonpy.model import STONEnum
+
+_MAP = STONEnum["MAP"].value
+_ID = STONEnum["ID"].value
+_FINGERPRINT = STONEnum["FINGERPRINT"].value
+_HAS_GLYPH = STONEnum["HAS_GLYPH"].value
+_HAS_SOURCE = STONEnum["HAS_SOURCE"].value
+_HAS_TARGET = STONEnum["HAS_TARGET"].value
+_HAS_PORT = STONEnum["HAS_PORT"].value
+
+
+def _unescape_name(name):
+    if name.startswith("`") and name.endswith("`"):
+        return name[1:-1].replace("``", "`")
+    return name
+
+
+def _cypher_to_labels(labels):
+    # inverse of the _labels_to_cypher function of the batch module;
+    # labels are assumed not to contain colons
+    return [_unescape_name(label) for label in labels.split(":") if label]
+
+
+class MemoryTransaction(object):
+    """Transaction of a :class:`MemoryGraph`.
+
+    Writes are applied to the graph immediately: committing a transaction
+    has no effect, and rolling it back does not undo its writes.
+
+    :ivar graph: the graph of the transaction
+    """
+
+    def __init__(self, graph, readonly=False):
+        self.graph = graph
+        self.readonly = readonly
+
+    def run(self, cypher, parameters=None, **kwparameters):
+        """Run a query, see :meth:`MemoryGraph.run`."""
+        return self.graph.run(cypher, parameters, **kwparameters)
+
+    def evaluate(self, cypher, parameters=None, **kwparameters):
+        """Run a query and return the first value of its first record, see :meth:`MemoryGraph.evaluate`."""
+        return self.graph.evaluate(cypher, parameters, **kwparameters)
+
+    def create(self, subgraph):
+        """Create a subgraph, see :meth:`MemoryGraph.create`."""
+        self.graph.create(subgraph)
+
+    def match(self, nodes=None, r_type=None, limit=None):
+        """Match relationships, see :meth:`MemoryGraph.match`."""
+        return self.graph.match(nodes, r_type, limit)
+
+    def match_one(self, nodes=None, r_type=None):
+        """Match one relationship, see :meth:`MemoryGraph.match_one`."""
+        return self.graph.match_one(nodes, r_type)
+
+    def commit(self):
+        """Commit the transaction (no effect)."""
+
+    def rollback(self):
+        """Roll back the transaction (writes are not undone)."""
+
+
+class MemoryGraph(object):
+    """In-memory graph, with the subset of the interface of `py2neo.Graph` used by stonpy.
+
+    Nodes and relationships are `py2neo.Node` and `py2neo.Relationship`
+    objects bound to the memory graph, i.e. whose `graph` is the memory graph
+    and whose `identity` is an integer unique in the memory graph.
+    Matching a node or a relationship always returns the object that was
+    created in the graph, which should hence not be modified in place.
+    A memory graph is thread-safe.
+
+    :ivar name: the name of the graph, always `None`
+    """
+
+    def __init__(self):
+        self.name = None
+        self._lock = threading.RLock()
+        self._next_identity = 0
+        self._nodes = {}
+        self._relationships = {}
+        # label -> node identities
+        self._labels = defaultdict(dict)
+        # node identity -> relationship type -> relationships
+        self._outgoing = defaultdict(lambda: defaultdict(list))
+        self._incoming = defaultdict(lambda: defaultdict(list))
+        self._queries = {}
+
+    @property
+    def service(self):
+        # used by py2neo to hash bound nodes
+        return self
+
+    @property
+    def node_count(self):
+        """The number of nodes of the graph"""
+        return len(self._nodes)
+
+    @property
+    def relationship_count(self):
+        """The number of relationships of the graph"""
+        return len(self._relationships)
+
+    def _new_identity(self):
+        identity = self._next_identity
+        self._next_identity += 1
+        return identity
+
+    def _add_node(self, node):
+        node.graph = self
+        node.identity = self._new_identity()
+        self._nodes[node.identity] = node
+        for label in node.labels:
+            self._labels[label][node.identity] = None
+        return node
+
+    def _add_relationship(self, relationship):
+        relationship.graph = self
+        relationship.identity = self._new_identity()
+        self._relationships[relationship.identity] = relationship
+        r_type = type(relationship).__name__
+        self._outgoing[relationship.start_node.identity][r_type].append(
+            relationship
+        )
+        self._incoming[relationship.end_node.identity][r_type].append(
+            relationship
+        )
+        return relationship
+
+    def _delete_relationship(self, relationship):
+        del self._relationships[relationship.identity]
+        r_type = type(relationship).__name__
+        self._outgoing[relationship.start_node.identity][r_type].remove(
+            relationship
+        )
+        self._incoming[relationship.end_node.identity][r_type].remove(
+            relationship
+        )
+
+    def _delete_node(self, identity):
+        node = self._nodes.pop(identity, None)
+        if node is None:
+            return
+        for index in [self._outgoing, self._incoming]:
+            for relationships in list(index.get(identity, {}).values()):
+                for relationship in list(relationships):
+                    self._delete_relationship(relationship)
+        self._outgoing.pop(identity, None)
+        self._incoming.pop(identity, None)
+        for label in node.labels:
+            self._labels[label].pop(identity, None)
+
+    def create(self, subgraph):
+        """Create the nodes and relationships of a subgraph that are not yet bound to the graph, and bind them to it.
+
+        :param subgraph: the subgraph to create
+        :type subgraph: `py2neo.Subgraph`
+        """
+        if subgraph is None:
+            return
+        # entities are listed before being bound, since binding changes
+        # their hash
+        nodes = list(subgraph.nodes)
+        relationships = list(subgraph.relationships)
+        with self._lock:
+            for node in nodes:
+                if node.graph is not self or node.identity is None:
+                    self._add_node(node)
+            for relationship in relationships:
+                if (
+                    relationship.graph is not self
+                    or relationship.identity is None
+                ):
+                    self._add_relationship(relationship)
+
+    def delete_all(self):
+        """Delete all nodes and relationships of the graph."""
+        with self._lock:
+            self._nodes.clear()
+            self._relationships.clear()
+            self._labels.clear()
+            self._outgoing.clear()
+            self._incoming.clear()
+
+    def begin(self, readonly=False):
+        """Begin a transaction.
+
+        :param readonly: whether the transaction is read-only, default is `False`
+        :type readonly: `bool`, optional
+        :rtype: `MemoryTransaction`
+        """
+        return MemoryTransaction(self, readonly)
+
+    def get_node(self, identity):
+        """Return the node with the given identity.
+
+        :param identity: the identity of the node
+        :type identity: `int`
+        :return: the node, or `None` if there is no node with this identity
+        :rtype: `py2neo.Node` or `None`
+        """
+        return self._nodes.get(identity)
+
+    def match_nodes(self, *labels, **properties):
+        """Return the nodes with the given labels and properties.
+
+        :param labels: the labels of the nodes
+        :param properties: the properties of the nodes
+        :return: the nodes
+        :rtype: `list[py2neo.Node]`
+        """
+        with self._lock:
+            if labels:
+                identities = [
+                    identity
+                    for identity in self._labels.get(labels[0], {})
+                    if all(
+                        identity in self._labels.get(label, {})
+                        for label in labels[1:]
+                    )
+                ]
+                nodes = [self._nodes[identity] for identity in identities]
+            else:
+                nodes = list(self._nodes.values())
+        return [
+            node
+            for node in nodes
+            if all(node.get(key) == value for key, value in properties.items())
+        ]
+
+    def _relationships_of(self, index, identity, r_type):
+        relationships_by_type = index.get(identity)
+        if relationships_by_type is None:
+            return []
+        if r_type is None:
+            return [
+                relationship
+                for relationships in relationships_by_type.values()
+                for relationship in relationships
+            ]
+        return list(relationships_by_type.get(r_type, []))
+
+    def match(self, nodes=None, r_type=None, limit=None):
+        """Return the relationships with the given start and end nodes and type.
+
+        :param nodes: the start node and the end node of the relationships, either of which may be `None` to match any node, default is `None` (any nodes)
+        :type nodes: `tuple[py2neo.Node]`, optional
+        :param r_type: the type of the relationships, default is `None` (any type)
+        :type r_type: `str`, optional
+        :param limit: the maximum number of relationships returned, default is `None` (no limit)
+        :type limit: `int`, optional
+        :return: the relationships
+        :rtype: `list[py2neo.Relationship]`
+        """
+        if nodes is None:
+            start_node, end_node = None, None
+        else:
+            start_node, end_node = nodes
+        with self._lock:
+            if start_node is not None:
+                relationships = [
+                    relationship
+                    for relationship in self._relationships_of(
+                        self._outgoing, start_node.identity, r_type
+                    )
+                    if end_node is None or relationship.end_node == end_node
+                ]
+            elif end_node is not None:
+                relationships = self._relationships_of(
+                    self._incoming, end_node.identity, r_type
+                )
+            else:
+                relationships = [
+                    relationship
+                    for relationship in self._relationships.values()
+                    if r_type is None or type(relationship).__name__ == r_type
+                ]
+        if limit is not None:
+            relationships = relationships[:limit]
+        return relationships
+
+    def match_one(self, nodes=None, r_type=None):
+        """Return one relationship with the given start and end nodes and type.
+
+        See :meth:`match`.
+
+        :return: the relationship, or `None` if there is none
+        :rtype: `py2neo.Relationship` or `None`
+        """
+        relationships = self.match(nodes, r_type, limit=1)
+        if relationships:
+            return relationships[0]
+        return None
+
+    def register_query(self, cypher, func):
+        """Register the implementation of a query, so that it can be run against the graph.
+
+        :param cypher: the text of the query
+        :type cypher: `str`
+        :param func: the function running the query, called with the graph and the parameters of the query, and returning the keys and the rows (lists of values) of the records
+        :type func: `callable`
+        """
+        self._queries[cypher] = func
+
+    def run(self, cypher, parameters=None, **kwparameters):
+        """Run a query and return its records.
+
+        The query must be the text of a query registered in
+        :data:`stonpy.queries.QUERIES`, as returned by
+        :func:`stonpy.queries.get_query`, one of the queries that create
+        the indexes of the data model (which have no effect), or a query
+        registered with :meth:`register_query`.
+
+        :param cypher: the text of the query
+        :type cypher: `str`
+        :param parameters: the parameters of the query, default is `None`
+        :type parameters: `dict`, optional
+        :return: the records
+        :rtype: `list[py2neo.cypher.Record]`
+        """
+        parameters = dict(parameters or {}, **kwparameters)
+        name_and_structure = queries.get_query_name(cypher)
+        with self._lock:
+            if name_and_structure is not None:
+                name, structure = name_and_structure
+                keys, rows = _QUERY_FUNCTIONS[name](
+                    self, parameters, **structure
+                )
+            elif cypher in self._queries:
+                keys, rows = self._queries[cypher](self, parameters)
+            elif cypher in _index_queries():
+                return []
+            else:
+                raise ValueError(
+                    "query not registered in the MemoryGraph: {}".format(
+                        cypher
+                    )
+                )
+        return [Record(keys, row) for row in rows]
+
+    def evaluate(self, cypher, parameters=None, **kwparameters):
+        """Run a query and return the first value of its first record.
+
+        See :meth:`run`.
+
+        :return: the value, or `None` if there is no record
+        """
+        records = self.run(cypher, parameters, **kwparameters)
+        if not records:
+            return None
+        return records[0][0]
+
+
+def _index_queries():
+    return set([query for _, query in queries.get_index_queries()])
+
+
+def _maps(graph, map_id):
+    return [
+        graph._nodes[identity]
+        for identity in graph._labels.get(_MAP, {})
+        if graph._nodes[identity].get(_ID) == map_id
+    ]
+
+
+def _children(graph, identity):
+    return graph._relationships_of(graph._outgoing, identity, None)
+
+
+def _descendants(graph, node):
+    nodes = {node.identity: node}
+    relationships = []
+    frontier = [node]
+    while frontier:
+        next_frontier = []
+        for node in frontier:
+            for relationship in _children(graph, node.identity):
+                relationships.append(relationship)
+                child = relationship.end_node
+                if child.identity not in nodes:
+                    nodes[child.identity] = child
+                    next_frontier.append(child)
+        frontier = next_frontier
+    return list(nodes.values()), relationships
+
+
+def _match_map(graph, parameters):
+    return ["m"], [[m] for m in _maps(graph, parameters["map_id"])]
+
+
+def _match_map_by_identity(graph, parameters):
+    node = graph._nodes.get(parameters["identity"])
+    if node is None or not node.has_label(_MAP):
+        return ["m"], []
+    return ["m"], [[node]]
+
+
+def _count_maps_by_fingerprint(graph, parameters):
+    count = 0
+    for identity in graph._labels.get(_MAP, {}):
+        m = graph._nodes[identity]
+        if m.get(_FINGERPRINT) == parameters["fingerprint"] and (
+            parameters["map_id"] is None or m.get(_ID) == parameters["map_id"]
+        ):
+            count += 1
+    return ["count(m)"], [[count]]
+
+
+def _count_maps_without_fingerprint(graph, parameters):
+    count = 0
+    for identity in graph._labels.get(_MAP, {}):
+        m = graph._nodes[identity]
+        if m.get(_FINGERPRINT) is None and (
+            parameters["map_id"] is None or m.get(_ID) == parameters["map_id"]
+        ):
+            count += 1
+    return ["count(m)"], [[count]]
+
+
+def _match_maps(graph, parameters):
+    return ["m"], [
+        [m] for map_id in parameters["map_ids"] for m in _maps(graph, map_id)
+    ]
+
+
+def _match_children(graph, parameters):
+    rows = []
+    for identity, root in parameters["frontier"]:
+        for relationship in _children(graph, identity):
+            rows.append([root, relationship, relationship.end_node])
+    return ["root", "r", "child"], rows
+
+
+def _match_relationships_of_nodes(graph, parameters, r_types):
+    r_types = [_unescape_name(r_type) for r_type in r_types[1:].split("|")]
+    rows = []
+    for identity in parameters["identities"]:
+        for r_type in r_types:
+            for relationship in graph._relationships_of(
+                graph._outgoing, identity, r_type
+            ):
+                rows.append([identity, relationship, relationship.end_node])
+            for relationship in graph._relationships_of(
+                graph._incoming, identity, r_type
+            ):
+                rows.append([identity, relationship, relationship.start_node])
+    return ["identity", "r", "other"], rows
+
+
+def _match_maps_by_glyph(graph, parameters, labels):
+    labels = _cypher_to_labels(labels)
+    properties = parameters["properties"]
+    identities = {}
+    for identity in graph._labels.get(_MAP, {}):
+        for relationship in graph._relationships_of(
+            graph._outgoing, identity, _HAS_GLYPH
+        ):
+            n = relationship.end_node
+            if all(n.has_label(label) for label in labels) and all(
+                n.get(key) == value for key, value in properties.items()
+            ):
+                identities[identity] = None
+                break
+    return ["identity"], [[identity] for identity in identities]
+
+
+def _match_map_identities(graph, parameters):
+    return ["identity"], [
+        [m.identity] for m in _maps(graph, parameters["map_id"])
+    ]
+
+
+def _match_child_identities(graph, parameters):
+    identities = {}
+    for identity in parameters["identities"]:
+        for relationship in _children(graph, identity):
+            identities[relationship.end_node.identity] = None
+    return ["identity"], [[identity] for identity in identities]
+
+
+def _delete_nodes(graph, parameters):
+    for identity in parameters["identities"]:
+        graph._delete_node(identity)
+    return [], []
+
+
+def _create_nodes(graph, parameters, labels):
+    labels = _cypher_to_labels(labels)
+    rows = []
+    for row in parameters["rows"]:
+        node = graph._add_node(Node(*labels, **row["properties"]))
+        rows.append([row["key"], node.identity])
+    return ["key", "identity"], rows
+
+
+def _create_relationships(graph, parameters, r_type):
+    r_type = _unescape_name(r_type)
+    rows = []
+    for row in parameters["rows"]:
+        relationship = graph._add_relationship(
+            Relationship(
+                graph._nodes[row["start"]],
+                r_type,
+                graph._nodes[row["end"]],
+                **row["properties"],
+            )
+        )
+        rows.append([row["key"], relationship.identity])
+    return ["key", "identity"], rows
+
+
+def _await_indexes(graph, parameters):
+    return [], []
+
+
+def _get_maps_apoc(graph, parameters):
+    rows = []
+    for map_id in parameters["map_ids"]:
+        for m in _maps(graph, map_id):
+            nodes, relationships = _descendants(graph, m)
+            rows.append([m, nodes, relationships])
+    return ["m", "nodes", "relationships"], rows
+
+
+def _get_map_apoc(graph, parameters):
+    return _get_maps_apoc(graph, {"map_ids": [parameters["map_id"]]})
+
+
+def _match_arcs_of_shortcuts(graph, parameters):
+    def ends(identity):
+        # the node itself, then its ports
+        yield identity, False
+        for relationship in graph._relationships_of(
+            graph._outgoing, identity, _HAS_PORT
+        ):
+            yield relationship.end_node.identity, True
+
+    rows = []
+    for shortcut in parameters["shortcuts"]:
+        source_id = shortcut["source_id"]
+        target_id = shortcut["target_id"]
+        if source_id not in graph._nodes or target_id not in graph._nodes:
+            continue
+        target_ends = dict(ends(target_id))
+        for source_end, source_port in ends(source_id):
+            for relationship in graph._relationships_of(
+                graph._incoming, source_end, _HAS_SOURCE
+            ):
+                arc = relationship.start_node
+                if not arc.has_label(shortcut["arc_label"]):
+                    continue
+                for target_relationship in graph._relationships_of(
+                    graph._outgoing, arc.identity, _HAS_TARGET
+                ):
+                    target_end = target_relationship.end_node.identity
+                    if target_end in target_ends:
+                        ports = int(source_port) + 2 * int(
+                            target_ends[target_end]
+                        )
+                        rows.append([shortcut["identity"], arc, ports])
+    return ["identity", "arc", "ports"], rows
+
+
+# The functions running the registered queries against a memory graph,
+# indexed by query name
+_QUERY_FUNCTIONS = {
+    "match_map": _match_map,
+    "match_map_by_identity": _match_map_by_identity,
+    "count_maps_by_fingerprint": _count_maps_by_fingerprint,
+    "count_maps_without_fingerprint": _count_maps_without_fingerprint,
+    "match_maps": _match_maps,
+    "match_children": _match_children,
+    "match_relationships_of_nodes": _match_relationships_of_nodes,
+    "match_maps_by_glyph": _match_maps_by_glyph,
+    "match_map_identities": _match_map_identities,
+    "match_child_identities": _match_child_identities,
+    "delete_nodes": _delete_nodes,
+    "create_nodes": _create_nodes,
+    "create_relationships": _create_relationships,
+    "await_indexes": _await_indexes,
+    "get_map_apoc": _get_map_apoc,
+    "get_maps_apoc": _get_maps_apoc,
+    "match_arcs_of_shortcuts": _match_arcs_of_shortcuts,
+}
+
+# a memory graph has no element IDs: its identities stand for them
+for _name in queries.ELEMENT_ID_QUERY_NAMES:
+    _QUERY_FUNCTIONS[f"{_name}_by_element_id"] = _QUERY_FUNCTIONS[_name]
@@ -165,6 +165,8 @@ class STONEnum(Enum):
     URI = "uri"
     COLLECTION_NS = "collection_ns"
     TEXT = "text"
+    FINGERPRINT = "fingerprint"
+    MAP_MEMBERSHIP = "mapId"
 
 
 class OntologyPD(Enum):
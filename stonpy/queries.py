@@ -0,0 +1,414 @@
+"""The module for the Cypher queries run internally by stonpy.
+
+All internal queries are parameterized templates registered in `QUERIES`.
+Values (map IDs, node identities, properties) are always passed as query
+parameters, so that the text of a query only depends on its template.
+Neo4j caches query plans by query text: a template is hence planned once and
+its plan is reused by all subsequent calls.
+
+Some templates have structural placeholders (labels or relationship types,
+that cannot be passed as parameters); those are filled in with the
+`structure` keyword arguments of :func:`get_query`, and only take a small
+number of values.
+"""
+
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+import stonpy.instrumentation as instrumentation
+from stonpy.model import STONEnum
+
+_MAP = STONEnum["MAP"].value
+_ID = STONEnum["ID"].value
+_HAS_GLYPH = STONEnum["HAS_GLYPH"].value
+_HAS_ARC = STONEnum["HAS_ARC"].value
+_HAS_SOURCE = STONEnum["HAS_SOURCE"].value
+_HAS_TARGET = STONEnum["HAS_TARGET"].value
+_HAS_PORT = STONEnum["HAS_PORT"].value
+_FINGERPRINT = STONEnum["FINGERPRINT"].value
+
+QUERIES = {
+    "match_map": f"""MATCH (m:{_MAP} {{{_ID}: $map_id}})
+        RETURN m""",
+    "match_map_by_identity": f"""MATCH (m:{_MAP})
+        WHERE id(m) = $identity
+        RETURN m""",
+    "count_maps_by_fingerprint": f"""MATCH (m:{_MAP} {{{_FINGERPRINT}: $fingerprint}})
+        WHERE $map_id IS NULL OR m.{_ID} = $map_id
+        RETURN count(m)""",
+    "count_maps_without_fingerprint": f"""MATCH (m:{_MAP})
+        WHERE m.{_FINGERPRINT} IS NULL
+        AND ($map_id IS NULL OR m.{_ID} = $map_id)
+        RETURN count(m)""",
+    "match_maps": f"""UNWIND $map_ids AS map_id
+        MATCH (m:{_MAP} {{{_ID}: map_id}})
+        RETURN m""",
+    "match_children": """UNWIND $frontier AS item
+        MATCH (n)-[r]->(child)
+        WHERE id(n) = item[0]
+        RETURN item[1] AS root, r, child""",
+    "match_relationships_of_nodes": """UNWIND $identities AS identity
+        MATCH (n)-[r{r_types}]-(other)
+        WHERE id(n) = identity
+        RETURN identity, r, other""",
+    "match_maps_by_glyph": f"""MATCH (m:{_MAP})-[:{_HAS_GLYPH}]->(n{{labels}})
+        WHERE n.{_ID} = $properties.{_ID}
+        AND all(key IN keys($properties) WHERE n[key] = $properties[key])
+        RETURN DISTINCT id(m) AS identity""",
+    "match_map_identities": f"""MATCH (m:{_MAP} {{{_ID}: $map_id}})
+        RETURN id(m) AS identity""",
+    "match_child_identities": """UNWIND $identities AS identity
+        MATCH (n)-->(child)
+        WHERE id(n) = identity
+        RETURN DISTINCT id(child) AS identity""",
+    "delete_nodes": """UNWIND $identities AS identity
+        MATCH (n)
+        WHERE id(n) = identity
+        DETACH DELETE n""",
+    "create_nodes": """UNWIND $rows AS row
+        CREATE (n{labels})
+        SET n = row.properties
+        RETURN row.key AS key, id(n) AS identity""",
+    "create_relationships": """UNWIND $rows AS row
+        MATCH (start) WHERE id(start) = row.start
+        MATCH (end) WHERE id(end) = row.end
+        CREATE (start)-[r:{r_type}]->(end)
+        SET r = row.properties
+        RETURN row.key AS key, id(r) AS identity""",
+    "await_indexes": """CALL db.awaitIndexes()""",
+    "get_map_apoc": f"""MATCH (m:{_MAP} {{{_ID}: $map_id}})
+        CALL apoc.path.subgraphAll(m, {{relationshipFilter: ">"}})
+        YIELD nodes, relationships
+        RETURN m, nodes, relationships""",
+    "get_maps_apoc": f"""UNWIND $map_ids AS map_id
+        MATCH (m:{_MAP} {{{_ID}: map_id}})
+        CALL apoc.path.subgraphAll(m, {{relationshipFilter: ">"}})
+        YIELD nodes, relationships
+        RETURN m, nodes, relationships""",
+    "match_arcs_of_shortcuts": f"""UNWIND $shortcuts AS shortcut
+        MATCH (source) WHERE id(source) = shortcut.source_id
+        MATCH (target) WHERE id(target) = shortcut.target_id
+        MATCH (source)-[:{_HAS_PORT}*0..1]->(source_end)<-[:{_HAS_SOURCE}]-(arc),
+        (arc)-[:{_HAS_TARGET}]->(target_end)<-[:{_HAS_PORT}*0..1]-(target)
+        WHERE shortcut.arc_label IN labels(arc)
+        RETURN shortcut.identity AS identity, arc,
+        CASE WHEN source_end = source THEN 0 ELSE 1 END
+        + CASE WHEN target_end = target THEN 0 ELSE 2 END AS ports""",
+}
+
+# The queries matching nodes by identity that are also run by
+# :class:`stonpy.core.AsyncSTON`, which identifies entities by element ID
+# (the legacy identities being deprecated in the Neo4j driver): each of them
+# has a variant named `<name>_by_element_id`, that matches nodes with
+# `elementId` instead of `id`
+ELEMENT_ID_QUERY_NAMES = [
+    "match_map_by_identity",
+    "match_maps_by_glyph",
+    "match_children",
+    "match_relationships_of_nodes",
+    "match_arcs_of_shortcuts",
+    "match_map_identities",
+    "match_child_identities",
+    "delete_nodes",
+]
+
+for _name in ELEMENT_ID_QUERY_NAMES:
+    QUERIES[f"{_name}_by_element_id"] = re.sub(
+        r"\bid\(", "elementId(", QUERIES[_name]
+    )
+
+
+# Example parameters and structural values used to explain the registered
+# queries (see :func:`explain`)
+_EXAMPLES = {
+    "match_map": ({"map_id": ""}, {}),
+    "match_map_by_identity": ({"identity": 0}, {}),
+    "count_maps_by_fingerprint": ({"fingerprint": "", "map_id": None}, {}),
+    "count_maps_without_fingerprint": ({"map_id": None}, {}),
+    "match_maps": ({"map_ids": []}, {}),
+    "match_children": ({"frontier": []}, {}),
+    "match_relationships_of_nodes": (
+        {"identities": []},
+        {"r_types": ":{}|{}".format(_HAS_GLYPH, _HAS_ARC)},
+    ),
+    "match_maps_by_glyph": (
+        {"properties": {_ID: ""}},
+        {"labels": ":{}".format(STONEnum["GLYPH"].value)},
+    ),
+    "match_map_identities": ({"map_id": ""}, {}),
+    "match_child_identities": ({"identities": []}, {}),
+    "delete_nodes": ({"identities": []}, {}),
+    "create_nodes": (
+        {"rows": []},
+        {"labels": ":{}".format(STONEnum["GLYPH"].value)},
+    ),
+    "create_relationships": ({"rows": []}, {"r_type": _HAS_GLYPH}),
+    "await_indexes": ({}, {}),
+    "get_map_apoc": ({"map_id": ""}, {}),
+    "get_maps_apoc": ({"map_ids": []}, {}),
+    "match_arcs_of_shortcuts": ({"shortcuts": []}, {}),
+}
+
+for _name in ELEMENT_ID_QUERY_NAMES:
+    _EXAMPLES[f"{_name}_by_element_id"] = _EXAMPLES[_name]
+
+# The indexes of the data model, as (index type, label, property) triples of
+# STONEnum names
+INDEXES = [
+    ("RANGE", "MAP", "ID"),
+    ("RANGE", "MAP", "FINGERPRINT"),
+    ("RANGE", "GLYPH", "MAP_MEMBERSHIP"),
+    ("RANGE", "ARC", "MAP_MEMBERSHIP"),
+    ("RANGE", "ARCGROUP", "MAP_MEMBERSHIP"),
+    ("RANGE", "GLYPH", "ID"),
+    ("RANGE", "GLYPH", "CLASS"),
+    ("RANGE", "GLYPH", "LABEL_PROP"),
+    ("TEXT", "GLYPH", "LABEL_PROP"),
+    ("RANGE", "ARC", "ID"),
+    ("RANGE", "ARC", "CLASS"),
+    ("RANGE", "ARCGROUP", "ID"),
+    ("RANGE", "PORT", "ID"),
+    ("RANGE", "RESOURCE", "URI"),
+    ("TEXT", "RESOURCE", "URI"),
+]
+
+
+def get_index_queries():
+    """Return the queries that create the indexes of the data model.
+
+    The indexes are created only if they do not exist yet.
+
+    :return: the names of the indexes and the queries that create them
+    :rtype: `list[(str, str)]`
+    """
+    index_queries = []
+    for index_type, label, prop in INDEXES:
+        name = "stonpy_{}_{}_{}".format(
+            label.lower(), prop.lower(), index_type.lower()
+        )
+        query = """CREATE {index_type} INDEX {name} IF NOT EXISTS
+            FOR (n:{label}) ON (n.{prop})""".format(
+            index_type=index_type,
+            name=name,
+            label=STONEnum[label].value,
+            prop=STONEnum[prop].value,
+        )
+        index_queries.append((name, query))
+    return index_queries
+
+
+def _plan_operators(plan):
+    operators = []
+    if plan is not None:
+        operators.append(plan["operatorType"].split("@")[0])
+        for child in plan.get("children", []):
+            operators += _plan_operators(child)
+    return operators
+
+
+def explain(graph, name):
+    """Explain a registered query and return the operators of its plan.
+
+    :param graph: the graph against which the query is explained
+    :type graph: `py2neo.Graph`
+    :param name: the name of the template
+    :type name: `str`
+    :return: the operators of the plan
+    :rtype: `list[str]`
+    """
+    parameters, structure = _EXAMPLES[name]
+    query = "EXPLAIN {}".format(get_query(name, **structure))
+    cursor = graph.run(query, parameters)
+    return _plan_operators(cursor.plan())
+
+
+def index_usage(graph):
+    """Explain all registered queries and return the index operators of their plans.
+
+    :param graph: the graph against which the queries are explained
+    :type graph: `py2neo.Graph`
+    :return: the index operators of the plan of each query, indexed by query name; the value is `None` if the query could not be explained (e.g. if it uses APOC and APOC is not installed)
+    :rtype: `dict[str, list[str]]`
+    """
+    usage = {}
+    for name in QUERIES:
+        try:
+            operators = explain(graph, name)
+        except Exception:
+            usage[name] = None
+        else:
+            usage[name] = [
+                operator for operator in operators if "Index" in operator
+            ]
+    return usage
+
+
+class QueryStatistics(object):
+    """Counters of the queries run through this module.
+
+    The runs of a query text that was already run by this process are
+    counted as repeated queries, and the others as new queries.
+    These counters only say how many distinct texts this process sends, not
+    whether Neo4j found their plans in its plan cache: the plan cache of the
+    server is shared by all its clients, and its entries may be evicted.
+
+    :ivar repeated_queries: the number of runs of a query text already run by this process
+    :ivar new_queries: the number of runs of a query text never run by this process
+    :ivar counts: the number of runs, by template name
+    :ivar times: the cumulative time (in seconds) spent running queries, by template name
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Reset all counters."""
+        with self._lock:
+            self.repeated_queries = 0
+            self.new_queries = 0
+            self.counts = Counter()
+            self.times = defaultdict(float)
+            self._seen = set([])
+
+    def record(self, name, query, duration):
+        """Record a run of a query.
+
+        :param name: the name of the template of the query
+        :type name: `str`
+        :param query: the text of the query
+        :type query: `str`
+        :param duration: the time (in seconds) spent running the query
+        :type duration: `float`
+        """
+        with self._lock:
+            if query in self._seen:
+                self.repeated_queries += 1
+            else:
+                self._seen.add(query)
+                self.new_queries += 1
+            self.counts[name] += 1
+            self.times[name] += duration
+
+    def as_dict(self):
+        """Return the counters as a dictionary.
+
+        :rtype: `dict`
+        """
+        with self._lock:
+            return {
+                "repeated_queries": self.repeated_queries,
+                "new_queries": self.new_queries,
+                "counts": dict(self.counts),
+                "times": dict(self.times),
+            }
+
+
+statistics = QueryStatistics()
+
+
+# The names and structural values of the query texts returned by
+# :func:`get_query`, indexed by text (see :func:`get_query_name`)
+_query_names = {query: (name, ()) for name, query in QUERIES.items()}
+
+
+@lru_cache(maxsize=None)
+def _format_query(name, structure):
+    query = QUERIES[name].format(**dict(structure))
+    _query_names[query] = (name, structure)
+    return query
+
+
+def get_query(name, **structure):
+    """Return the text of a registered query.
+
+    :param name: the name of the template
+    :type name: `str`
+    :param structure: the values of the structural placeholders of the template, if any
+    :return: the text of the query
+    :rtype: `str`
+    """
+    if not structure:
+        return QUERIES[name]
+    return _format_query(name, tuple(sorted(structure.items())))
+
+
+def get_query_name(query):
+    """Return the name of the template and the structural values of a query text returned by :func:`get_query`.
+
+    :param query: the text of the query
+    :type query: `str`
+    :return: the name of the template and the values of its structural placeholders, or `None` if the text is not that of a registered query
+    :rtype: (`str`, `dict`) or `None`
+    """
+    name_and_structure = _query_names.get(query)
+    if name_and_structure is None:
+        return None
+    name, structure = name_and_structure
+    return name, dict(structure)
+
+
+def run(graph, name, parameters=None, **structure):
+    """Run a registered query and return the resulting cursor.
+
+    :param graph: the graph or transaction against which the query is run
+    :type graph: `py2neo.Graph` or `py2neo.Transaction`
+    :param name: the name of the template
+    :type name: `str`
+    :param parameters: the parameters of the query, default is `None`
+    :type parameters: `dict`, optional
+    :param structure: the values of the structural placeholders of the template, if any
+    :return: the cursor
+    :rtype: `py2neo.Cursor`
+    """
+    query = get_query(name, **structure)
+    start = time.perf_counter()
+    cursor = graph.run(query, parameters)
+    statistics.record(name, query, time.perf_counter() - start)
+    instrumentation.count_round_trip()
+    return cursor
+
+
+async def run_async(tx, name, parameters=None, **structure):
+    """Run a registered query with the asynchronous Neo4j driver and return its records.
+
+    :param tx: the session or transaction in which the query is run
+    :type tx: `neo4j.AsyncSession` or `neo4j.AsyncTransaction`
+    :param name: the name of the template
+    :type name: `str`
+    :param parameters: the parameters of the query, default is `None`
+    :type parameters: `dict`, optional
+    :param structure: the values of the structural placeholders of the template, if any
+    :return: the records
+    :rtype: `list[neo4j.Record]`
+    """
+    query = get_query(name, **structure)
+    start = time.perf_counter()
+    result = await tx.run(query, parameters)
+    records = [record async for record in result]
+    statistics.record(name, query, time.perf_counter() - start)
+    instrumentation.count_round_trip(len(records))
+    return records
+
+
+def evaluate(graph, name, parameters=None, **structure):
+    """Run a registered query and return the first value of its first record.
+
+    :param graph: the graph or transaction against which the query is run
+    :type graph: `py2neo.Graph` or `py2neo.Transaction`
+    :param name: the name of the template
+    :type name: `str`
+    :param parameters: the parameters of the query, default is `None`
+    :type parameters: `dict`, optional
+    :param structure: the values of the structural placeholders of the template, if any
+    :return: the value, or `None` if there is no record
+    """
+    query = get_query(name, **structure)
+    start = time.perf_counter()
+    value = graph.evaluate(query, parameters)
+    statistics.record(name, query, time.perf_counter() - start)
+    instrumentation.count_round_trip()
+    return value
@@ -6,6 +6,16 @@ def read(file_name):
     sbgn = libsbgn.parse(file_name, silence=True)
     return cast_map(sbgn.get_map())
 
+def _orderable(value):
+    # None cannot be compared with other values: it is ordered before them,
+    # so that the canonical forms of maps with optional elements (labels,
+    # bboxes, orientations, ...) can be sorted
+    if value is None:
+        return (0,)
+    if isinstance(value, tuple):
+        return (1, tuple([_orderable(element) for element in value]))
+    return (1, value)
+
 def cast_map(old):
     dids = {}
     new = Map()
@@ -76,21 +86,29 @@ def cast_arc(old, dids):
     new.end = cast_end(old.get_end())
     for n in old.get_next():
         new.add_next(cast_next(n))
+    # ports and glyphs of arcs may be the source or target of other arcs
+    # (e.g. the outcomes and ports of interactions in ER maps)
     for p in old.get_port():
-        new.add_port(cast_port(p))
+        newp = cast_port(p)
+        new.add_port(newp)
+        dids[p.get_id()] = newp
     for g in old.get_glyph():
-        new.add_glyph(cast_glyph(g))
+        newg = cast_glyph(g, dids)
+        new.add_glyph(newg)
+        dids[g.get_id()] = newg
     return new
 
 def cast_arcgroup(old, dids):
     new = Arcgroup()
-    new.clazz = ArcgroupClass[old.get_class().name]
+    # the class of arcgroups is a string in libsbgnpy, not an enum
+    clazz = old.get_class()
+    new.clazz = ArcgroupClass(getattr(clazz, "value", clazz))
     for g in old.get_glyph():
         newg = cast_glyph(g, dids)
         new.add_glyph(newg)
         dids[g.get_id()] = newg
     for a in old.get_arc():
-        newa = cast_glyph(a, dids)
+        newa = cast_arc(a, dids)
         new.add_arc(newa)
         dids[a.get_id()] = newa
     return new
@@ -176,16 +194,16 @@ class Map(object):
     def to_tuple(self):
         return (self.__class__.__name__,
             self.language,
-            tuple([glyph.to_tuple() for glyph in sorted(self.glyphs)]),
-            tuple([arc.to_tuple() for arc in sorted(self.arcs)]),
-            tuple([arcgroup.to_tuple() for arcgroup in sorted(self.arcgroups)]))
+            tuple(sorted([glyph.to_tuple() for glyph in self.glyphs], key=_orderable)),
+            tuple(sorted([arc.to_tuple() for arc in self.arcs], key=_orderable)),
+            tuple(sorted([arcgroup.to_tuple() for arcgroup in self.arcgroups], key=_orderable)))
 
     def __eq__(self, other):
         return  isinstance(other, Map) and self.to_tuple() == other.to_tuple()
 
     def __lt__(self, other):
         if isinstance(other, Map):
-            return self.to_tuple() < other.to_tuple()
+            return _orderable(self.to_tuple()) < _orderable(other.to_tuple())
         else:
             return TypeError
 
@@ -244,8 +262,8 @@ class Glyph(object):
             self.clone.to_tuple() if self.clone is not None else None,
             self.bbox.to_tuple() if self.bbox is not None else None,
             self.orientation,
-            tuple([glyph.to_tuple() for glyph in sorted(self.glyphs)]),
-            tuple([port.to_tuple() for port in sorted(self.ports)]),
+            tuple(sorted([glyph.to_tuple() for glyph in self.glyphs], key=_orderable)),
+            tuple(sorted([port.to_tuple() for port in self.ports], key=_orderable)),
             self.compartmentRef.to_tuple() if self.compartmentRef is not None \
                     else None,
             self.compartmentOrder)
@@ -255,7 +273,7 @@ class Glyph(object):
 
     def __lt__(self, other):
         if isinstance(other, Glyph):
-            return self.to_tuple() < other.to_tuple()
+            return _orderable(self.to_tuple()) < _orderable(other.to_tuple())
         else:
             return TypeError
 
@@ -298,16 +316,16 @@ class Arc(object):
             self.clazz,
             self.source.to_tuple(), self.target.to_tuple(),
             self.start.to_tuple(), self.end.to_tuple(),
-            tuple([next.to_tuple() for next in sorted(self.nexts)]),
-            tuple([glyph.to_tuple() for glyph in sorted(self.glyphs)]),
-            tuple([port.to_tuple() for port in sorted(self.ports)]))
+            tuple(sorted([next.to_tuple() for next in self.nexts], key=_orderable)),
+            tuple(sorted([glyph.to_tuple() for glyph in self.glyphs], key=_orderable)),
+            tuple(sorted([port.to_tuple() for port in self.ports], key=_orderable)))
 
     def __eq__(self, other):
         return isinstance(other, Arc) and self.to_tuple() == other.to_tuple()
 
     def __lt__(self, other):
         if isinstance(other, Arc):
-            return self.to_tuple() < other.to_tuple()
+            return _orderable(self.to_tuple()) < _orderable(other.to_tuple())
         else:
             return TypeError
 
@@ -326,15 +344,15 @@ class Arcgroup(object):
 
     def to_tuple(self):
         return (self.__class__.__name__,
-            tuple([glyph.to_tuple() for glyph in sorted(self.glyphs)]),
-            tuple([arc.to_tuple() for arc in sorted(self.arcs)]))
+            tuple(sorted([glyph.to_tuple() for glyph in self.glyphs], key=_orderable)),
+            tuple(sorted([arc.to_tuple() for arc in self.arcs], key=_orderable)))
 
     def __eq__(self, other):
         return isinstance(other, Arcgroup) and self.to_tuple() == other.to_tuple()
 
     def __lt__(self, other):
         if isinstance(other, Arcgroup):
-            return self.to_tuple() < other.to_tuple()
+            return _orderable(self.to_tuple()) < _orderable(other.to_tuple())
         else:
             return TypeError
 
@@ -354,7 +372,7 @@ class Label(object):
 
     def __lt__(self, other):
         if isinstance(other, Label):
-            return self.to_tuple() < other.to_tuple()
+            return _orderable(self.to_tuple()) < _orderable(other.to_tuple())
         else:
             return TypeError
 
@@ -376,7 +394,7 @@ class Bbox(object):
 
     def __lt__(self, other):
         if isinstance(other, Bbox):
-            return self.to_tuple() < other.to_tuple()
+            return _orderable(self.to_tuple()) < _orderable(other.to_tuple())
         else:
             return TypeError
 
@@ -395,7 +413,7 @@ class Clone(object):
 
     def __lt__(self, other):
         if isinstance(other, Clone):
-            return self.to_tuple() < other.to_tuple()
+            return _orderable(self.to_tuple()) < _orderable(other.to_tuple())
         else:
             return TypeError
 
@@ -415,7 +433,7 @@ class Point(object):
 
     def __lt__(self, other):
         if isinstance(other, Point):
-            return self.to_tuple() < other.to_tuple()
+            return _orderable(self.to_tuple()) < _orderable(other.to_tuple())
         else:
             return TypeError
 
@@ -555,7 +573,21 @@ class ArcClass(Enum):
     def __lt__(self, other):
         return self.value < other.value
 
-class Arcgroup(Enum):
+class EntityClass(Enum):
+    """
+    Enumeration with all possible values for the entity of units of information in SBGN-ML (AF only).
+    """
+    UNSPECIFIED_ENTITY = "unspecified entity"
+    SIMPLE_CHEMICAL = "simple chemical"
+    MACROMOLECULE = "macromolecule"
+    NUCLEIC_ACID_FEATURE = "nucleic acid feature"
+    COMPLEX = "complex"
+    PERTURBATION = "perturbation"
+
+    def __lt__(self, other):
+        return self.value < other.value
+
+class ArcgroupClass(Enum):
     """
     Enumeration with all possible values for the class attribute of Arcs in SBGN-ML.
     """
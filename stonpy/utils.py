@@ -1,11 +1,13 @@
 from math import atan2, pi
 from collections import defaultdict
+import hashlib
 
 import libsbgnpy.libsbgn as libsbgn
 
-from py2neo import NodeMatcher, RelationshipMatcher
+from py2neo import NodeMatcher, RelationshipMatcher, Subgraph
 
 from stonpy.sbgn import cast_map
+from stonpy.model import STONEnum
 
 def match(subgraph, nodes=None, rtype=None):
     relationships = set([])
@@ -36,6 +38,195 @@ def match_one(subgraph, nodes=None, rtype=None):
         return relationship
     return None
 
+class SubgraphIndex(object):
+    """Index of the relationships of a growing subgraph by start node and type, and by end node and type.
+
+    It offers the same lookups as :func:`match` and :func:`match_one`, in
+    constant time instead of time linear in the size of the subgraph, and is
+    updated as relationships are added, e.g. during completion.
+
+    :param subgraph: the subgraph whose relationships are initially indexed, default is `None`
+    :type subgraph: `py2neo.Subgraph`, optional
+    """
+
+    def __init__(self, subgraph=None):
+        self._relationships = set([])
+        # node -> relationship type -> relationships
+        self._by_start = defaultdict(lambda: defaultdict(list))
+        self._by_end = defaultdict(lambda: defaultdict(list))
+        if subgraph is not None:
+            for relationship in subgraph.relationships:
+                self.add(relationship)
+
+    def __len__(self):
+        return len(self._relationships)
+
+    def __contains__(self, relationship):
+        return relationship in self._relationships
+
+    def add(self, relationship):
+        """Add a relationship to the index.
+
+        :param relationship: the relationship
+        :type relationship: `py2neo.Relationship`
+        """
+        if relationship in self._relationships:
+            return
+        self._relationships.add(relationship)
+        rtype = type(relationship).__name__
+        self._by_start[relationship.start_node][rtype].append(relationship)
+        self._by_end[relationship.end_node][rtype].append(relationship)
+
+    def match(self, nodes=None, rtype=None):
+        """Return the indexed relationships with the given start and end nodes and type.
+
+        :param nodes: the start node and the end node of the relationships, either of which may be `None` to match any node, default is `None` (any nodes)
+        :type nodes: `tuple[py2neo.Node]`, optional
+        :param rtype: the type of the relationships, default is `None` (any type)
+        :type rtype: `str`, optional
+        :return: the relationships
+        :rtype: `list[py2neo.Relationship]`
+        """
+        if nodes is None:
+            nodes = (None, None)
+        start_node = nodes[0] if len(nodes) >= 1 else None
+        end_node = nodes[1] if len(nodes) == 2 else None
+        if start_node is not None:
+            relationships = self._relationships_of(
+                self._by_start, start_node, rtype)
+            if end_node is not None:
+                relationships = [
+                    relationship for relationship in relationships
+                    if relationship.end_node == end_node]
+            return relationships
+        if end_node is not None:
+            return self._relationships_of(self._by_end, end_node, rtype)
+        return [
+            relationship for relationship in self._relationships
+            if rtype is None or type(relationship).__name__ == rtype]
+
+    def match_one(self, nodes=None, rtype=None):
+        """Return one indexed relationship with the given start and end nodes and type.
+
+        See :meth:`match`.
+
+        :return: the relationship, or `None` if there is none
+        :rtype: `py2neo.Relationship` or `None`
+        """
+        for relationship in self.match(nodes, rtype):
+            return relationship
+        return None
+
+    def _relationships_of(self, index, node, rtype):
+        relationships_by_type = index.get(node)
+        if relationships_by_type is None:
+            return []
+        if rtype is None:
+            return [
+                relationship
+                for relationships in relationships_by_type.values()
+                for relationship in relationships]
+        return list(relationships_by_type.get(rtype, []))
+
+class SubgraphAccumulator(SubgraphIndex):
+    """Mutable subgraph, to which nodes and relationships are added in place.
+
+    Building a subgraph with unions of `py2neo.Subgraph` objects copies the
+    nodes and relationships of the subgraph at each union; an accumulator is
+    instead updated in place, and is converted to a `py2neo.Subgraph` once
+    all its nodes and relationships have been added (see
+    :meth:`to_subgraph`).
+    Its relationships are indexed (see :class:`SubgraphIndex`), and its nodes
+    and relationships that are bound to the database can be retrieved by
+    identity.
+
+    :param subgraph: the subgraph whose nodes and relationships are initially added, default is `None`
+    :type subgraph: `py2neo.Subgraph`, optional
+    """
+
+    def __init__(self, subgraph=None):
+        self.nodes = set([])
+        self._nodes_by_identity = {}
+        self._relationships_by_identity = {}
+        SubgraphIndex.__init__(self)
+        if subgraph is not None:
+            self.add_subgraph(subgraph)
+
+    @property
+    def relationships(self):
+        """The set of the relationships of the accumulator"""
+        return self._relationships
+
+    def add_node(self, node):
+        """Add a node.
+
+        :param node: the node
+        :type node: `py2neo.Node`
+        """
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        if node.identity is not None:
+            self._nodes_by_identity[node.identity] = node
+
+    def add(self, relationship):
+        """Add a relationship, and its start and end nodes.
+
+        :param relationship: the relationship
+        :type relationship: `py2neo.Relationship`
+        """
+        if relationship in self._relationships:
+            return
+        SubgraphIndex.add(self, relationship)
+        if relationship.identity is not None:
+            self._relationships_by_identity[relationship.identity] = \
+                relationship
+        self.add_node(relationship.start_node)
+        self.add_node(relationship.end_node)
+
+    def add_subgraph(self, subgraph):
+        """Add the nodes and relationships of a subgraph.
+
+        :param subgraph: the subgraph, or `None`
+        :type subgraph: `py2neo.Subgraph` or `None`
+        """
+        if subgraph is None:
+            return
+        for node in subgraph.nodes:
+            self.add_node(node)
+        for relationship in subgraph.relationships:
+            self.add(relationship)
+
+    def node(self, identity):
+        """Return the node with the given identity.
+
+        :param identity: the identity of the node
+        :type identity: `int`
+        :return: the node, or `None` if the accumulator has no node with this identity
+        :rtype: `py2neo.Node` or `None`
+        """
+        return self._nodes_by_identity.get(identity)
+
+    def relationship(self, identity):
+        """Return the relationship with the given identity.
+
+        :param identity: the identity of the relationship
+        :type identity: `int`
+        :return: the relationship, or `None` if the accumulator has no relationship with this identity
+        :rtype: `py2neo.Relationship` or `None`
+        """
+        return self._relationships_by_identity.get(identity)
+
+    def to_subgraph(self):
+        """Return the subgraph formed by the nodes and relationships of the accumulator.
+
+        :return: the subgraph, or `None` if the accumulator is empty
+        :rtype: `py2neo.Subgraph` or `None`
+        """
+        if not self.nodes:
+            return None
+        return Subgraph(self.nodes, self._relationships)
+
 def subgraph_union(subgraph1, subgraph2):
     if subgraph1 is not None:
         if subgraph2 is not None:
@@ -47,6 +238,39 @@ def subgraph_union(subgraph1, subgraph2):
     else:
         return None
 
+def subgraph_digest(subgraph):
+    """Return a compact digest of a subgraph of the database.
+
+    The digest only depends on the identities of the nodes and relationships
+    of the subgraph, so that two subgraphs of the database have the same
+    digest if and only if they are equal (up to hash collisions).
+
+    :param subgraph: the subgraph, whose nodes and relationships are bound to the database
+    :type subgraph: `py2neo.Subgraph`
+    :return: the digest
+    :rtype: `bytes`
+    """
+    node_identities = sorted([node.identity for node in subgraph.nodes])
+    relationship_identities = sorted(
+        [relationship.identity for relationship in subgraph.relationships])
+    return hashlib.blake2b(
+        repr((node_identities, relationship_identities)).encode(),
+        digest_size=16).digest()
+
+def restrict_subgraph_to_maps(subgraph, map_ids):
+    if subgraph is None:
+        return None
+    map_membership = STONEnum["MAP_MEMBERSHIP"].value
+    nodes = set([
+        node for node in subgraph.nodes if node[map_membership] in map_ids])
+    relationships = set([
+        relationship for relationship in subgraph.relationships
+        if relationship.start_node in nodes and relationship.end_node in nodes
+    ])
+    if not nodes:
+        return None
+    return Subgraph(nodes, relationships)
+
 def print_subgraph(subgraph):
     if not subgraph.nodes and not subgraph.relationships:
         print("Empty subgraph")
@@ -98,12 +322,12 @@ def match_relationship(relationship, graph):
 
 def match_subgraph(subgraph, graph, exact=False):
     dmatched = {}
-    matched_subgraph = None
+    matched_subgraph = SubgraphAccumulator()
     for node in subgraph.nodes:
         matched_nodes = set([])
         for matched_node in match_node(node, graph):
             matched_nodes.add(matched_node)
-            matched_subgraph = subgraph_union(matched_subgraph, matched_node)
+            matched_subgraph.add_node(matched_node)
         if exact and not matched_nodes:
             return None
         dmatched[node] = matched_nodes
@@ -132,10 +356,10 @@ def match_subgraph(subgraph, graph, exact=False):
             for end_node in matched_end:
                 for matched_relationship in r_matcher.match((start_node, end_node), type(relationship).__name__, **dict(relationship)):
                     matched_relationships.add(matched_relationship)
-                    matched_subgraph = subgraph_union(matched_subgraph, matched_relationship)
+                    matched_subgraph.add(matched_relationship)
         if exact and not matched_relationships:
             return None
-    return matched_subgraph
+    return matched_subgraph.to_subgraph()
 
 def exists_subgraph(subgraph, graph):
     return match_subgraph(subgraph, graph, exact = True) is not None
@@ -271,6 +495,40 @@ def atan2pi(y, x):
 def are_maps_equal(map1, map2):
     return cast_map(map1) == cast_map(map2)
 
+def map_fingerprint(sbgnmap):
+    """Return the fingerprint of an SBGN map.
+
+    The fingerprint is a hash of the canonical form of the map (see
+    :func:`stonpy.sbgn.cast_map`): it does not depend on the order of the
+    elements of the map nor on their IDs, and two maps have the same
+    fingerprint if and only if they are equal w.r.t. :func:`are_maps_equal`
+    (up to hash collisions).
+
+    :param sbgnmap: the SBGN map
+    :type sbgnmap: `libsbgnpy.libsbgn.map`
+    :return: the fingerprint
+    :rtype: `str`
+    """
+    canonical_form = repr(cast_map(sbgnmap).to_tuple())
+    return hashlib.sha256(canonical_form.encode("utf-8")).hexdigest()
+
+def map_fingerprint_or_none(sbgnmap):
+    """Return the fingerprint of an SBGN map, or `None` if it cannot be computed.
+
+    Maps whose canonical form cannot be built have no fingerprint, and are
+    compared with other maps structurally (see
+    :meth:`stonpy.core.STON.has_map`).
+
+    :param sbgnmap: the SBGN map
+    :type sbgnmap: `libsbgnpy.libsbgn.map`
+    :return: the fingerprint, or `None`
+    :rtype: `str` or `None`
+    """
+    try:
+        return map_fingerprint(sbgnmap)
+    except Exception:
+        return None
+
 def decode_notes_and_extension(obj):
     obj.anytypeobjs_ = [s.decode() if isinstance(s, bytes) else s for s in obj.anytypeobjs_]
     return obj
@@ -0,0 +1,9 @@
+import pytest
+
+from stonpy.core import STON
+from stonpy.memory import MemoryGraph
+
+
+@pytest.fixture
+def ston():
+    return STON(graph=MemoryGraph())
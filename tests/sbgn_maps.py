@@ -0,0 +1,85 @@
+"""SBGN maps used by the tests."""
+
+import glob
+import os.path
+import re
+
+import pytest
+
+import libsbgnpy
+import libsbgnpy.libsbgn as libsbgn
+
+import stonpy.utils as utils
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXAMPLE_MAP = os.path.join(ROOT, "example", "insulin.sbgn")
+# the SBGN-ML test files bundled with libsbgnpy
+TEST_MAPS_DIRECTORY = os.path.join(
+    os.path.dirname(libsbgnpy.__file__), "test", "test-files"
+)
+TEST_MAPS = sorted(
+    glob.glob(
+        os.path.join(TEST_MAPS_DIRECTORY, "**", "*.sbgn"), recursive=True
+    )
+)
+# maps that stonpy could not convert before fingerprints were introduced
+UNCONVERTIBLE_TEST_MAPS = {
+    "AF/AF_Reference_Card.sbgn",
+    "ER/ER_Reference_Card.sbgn",
+    "ER/binary-no-outcome.sbgn",
+    "ER/ternary-interaction.sbgn",
+    "ER/ternary-with-cardinality.sbgn",
+    "ER/ternary-with-perturbation-and-phenotype.sbgn",
+}
+
+_LANGUAGES = {
+    "sbgn.af.": libsbgn.Language.AF,
+    "sbgn.er.": libsbgn.Language.ER,
+    "sbgn.pd.": libsbgn.Language.PD,
+}
+
+
+def map_name(path):
+    return os.path.relpath(path, TEST_MAPS_DIRECTORY).replace(os.sep, "/")
+
+
+def convertible_maps():
+    return [
+        path
+        for path in TEST_MAPS
+        if map_name(path) not in UNCONVERTIBLE_TEST_MAPS
+    ]
+
+
+def map_params(paths=None):
+    if paths is None:
+        paths = TEST_MAPS
+    params = []
+    for path in paths:
+        name = map_name(path)
+        marks = []
+        if name in UNCONVERTIBLE_TEST_MAPS:
+            marks.append(
+                pytest.mark.xfail(
+                    reason="map not supported by the conversion", strict=True
+                )
+            )
+        params.append(pytest.param(path, id=name, marks=marks))
+    return params
+
+
+def load_map(path):
+    """Load an SBGN-ML file.
+
+    SBGN-ML 0.3 files have no language attribute: their language is taken
+    from their version attribute.
+    """
+    sbgn_map = utils.sbgn_file_to_map(path)
+    if sbgn_map.language is None:
+        with open(path, encoding="utf-8-sig") as f:
+            version = re.search(r'<map[^>]*\sversion="([^"]*)"', f.read())
+        if version is not None:
+            for key, language in _LANGUAGES.items():
+                if key in version.group(1):
+                    sbgn_map.set_language(language)
+    return sbgn_map
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+import stonpy.queries as queries
+from stonpy.core import AsyncSTON
+
+pytest.importorskip("neo4j")
+
+# the children of the nodes of a map, by element ID
+_CHILDREN = {"4:map": ["4:glyph1", "4:glyph2"], "4:glyph1": ["4:glyph2"]}
+
+
+class _Result(object):
+    def __init__(self, records):
+        self._records = records
+
+    def __aiter__(self):
+        async def records():
+            for record in self._records:
+                yield record
+
+        return records()
+
+
+class _Session(object):
+    def __init__(self, calls):
+        self._calls = calls
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        pass
+
+    async def run(self, query, parameters=None):
+        name, _ = queries.get_query_name(query)
+        self._calls.append((name, parameters))
+        if name == "match_map_identities_by_element_id":
+            return _Result([{"identity": "4:map"}])
+        if name == "match_child_identities_by_element_id":
+            return _Result(
+                [
+                    {"identity": child}
+                    for identity in parameters["identities"]
+                    for child in _CHILDREN.get(identity, [])
+                ]
+            )
+        return _Result([])
+
+
+class _Driver(object):
+    def __init__(self):
+        self.calls = []
+
+    def session(self, database=None):
+        return _Session(self.calls)
+
+
+def test_delete_map_by_element_id():
+    ston = AsyncSTON("bolt://localhost:7687", "user", "password")
+    driver = _Driver()
+    ston._driver = driver
+    asyncio.run(ston.delete_map("map1", batch_size=2))
+    assert [name for name, _ in driver.calls] == [
+        "match_map_identities_by_element_id",
+        "match_child_identities_by_element_id",
+        "match_child_identities_by_element_id",
+        "delete_nodes_by_element_id",
+        "delete_nodes_by_element_id",
+    ]
+    deleted = [
+        identity
+        for name, parameters in driver.calls
+        if name == "delete_nodes_by_element_id"
+        for identity in parameters["identities"]
+    ]
+    assert sorted(deleted) == ["4:glyph1", "4:glyph2", "4:map"]
@@ -0,0 +1,153 @@
+import csv
+import os.path
+from collections import Counter
+
+import stonpy.batch as batch
+import stonpy.conversion as conversion
+import stonpy.core as core
+import stonpy.utils as utils
+from stonpy.core import STON
+from stonpy.memory import MemoryGraph
+
+from sbgn_maps import EXAMPLE_MAP, load_map
+
+
+def _subgraph():
+    return conversion.map_to_subgraph(load_map(EXAMPLE_MAP), "map1")
+
+
+def test_subgraph_to_rows():
+    subgraph = _subgraph()
+    node_rows, relationship_rows, node_identities = batch.subgraph_to_rows(
+        subgraph
+    )
+    assert node_identities == {}
+    nodes = [row for rows in node_rows.values() for row in rows]
+    relationships = [
+        row for rows in relationship_rows.values() for row in rows
+    ]
+    assert len(nodes) == len(subgraph.nodes)
+    assert len(relationships) == len(subgraph.relationships)
+    assert Counter(
+        {labels: len(rows) for labels, rows in node_rows.items()}
+    ) == Counter(
+        tuple(sorted(node.labels)) for node in subgraph.nodes
+    )
+    assert Counter(
+        {r_type: len(rows) for r_type, rows in relationship_rows.items()}
+    ) == Counter(
+        type(relationship).__name__ for relationship in subgraph.relationships
+    )
+    keys = set([row["key"] for row in nodes])
+    assert len(keys) == len(nodes)
+    for row in relationships:
+        assert row["start"] in keys
+        assert row["end"] in keys
+
+
+def test_subgraph_to_rows_of_bound_subgraph():
+    graph = MemoryGraph()
+    subgraph = _subgraph()
+    graph.create(subgraph)
+    node_rows, relationship_rows, node_identities = batch.subgraph_to_rows(
+        subgraph
+    )
+    assert node_rows == {}
+    assert relationship_rows == {}
+    assert sorted(node_identities.values()) == sorted(
+        [node.identity for node in subgraph.nodes]
+    )
+
+
+def test_create_rows():
+    ston = STON(graph=MemoryGraph())
+    sbgn_map = load_map(EXAMPLE_MAP)
+    node_rows, relationship_rows = core.map_to_rows(sbgn_map, "map1")
+    tx = ston.graph.begin()
+    batch.create_rows(node_rows, relationship_rows, tx, batch_size=3)
+    tx.commit()
+    subgraph = _subgraph()
+    assert ston.graph.node_count == len(subgraph.nodes)
+    assert ston.graph.relationship_count == len(subgraph.relationships)
+    retrieved_map, _ = ston.get_map("map1")
+    assert utils.are_maps_equal(sbgn_map, retrieved_map)
+
+
+def test_create_subgraph():
+    graph = MemoryGraph()
+    subgraph = _subgraph()
+    tx = graph.begin()
+    batch.create_subgraph(subgraph, tx, batch_size=3)
+    tx.commit()
+    assert graph.node_count == len(subgraph.nodes)
+    assert graph.relationship_count == len(subgraph.relationships)
+    for node in subgraph.nodes:
+        assert graph.get_node(node.identity) == node
+
+
+def _read_csv(path):
+    with open(path, newline="") as f:
+        return list(csv.reader(f))
+
+
+def test_import_csv_writer(tmp_path):
+    subgraphs = [_subgraph(), _subgraph()]
+    writer = batch.ImportCSVWriter(str(tmp_path))
+    for subgraph in subgraphs:
+        writer.write_subgraph(subgraph)
+    writer.close()
+    node_ids = Counter()
+    labels = Counter()
+    for header_file, data_file in writer.node_files:
+        (header,) = _read_csv(header_file)
+        assert header[0] == ":ID"
+        assert header[-1] == ":LABEL"
+        for row in _read_csv(data_file):
+            assert len(row) == len(header)
+            node_ids[row[0]] += 1
+            labels[row[-1]] += 1
+    assert len(node_ids) == sum([len(s.nodes) for s in subgraphs])
+    assert set(node_ids.values()) == {1}
+    assert all(
+        [node_id.startswith(f"{writer.run_id}-") for node_id in node_ids]
+    )
+    assert labels == Counter(
+        ";".join(sorted(node.labels))
+        for subgraph in subgraphs
+        for node in subgraph.nodes
+    )
+    n_relationships = 0
+    for header_file, data_file in writer.relationship_files:
+        (header,) = _read_csv(header_file)
+        assert header[:2] == [":START_ID", ":END_ID"]
+        assert header[-1] == ":TYPE"
+        for row in _read_csv(data_file):
+            assert row[0] in node_ids
+            assert row[1] in node_ids
+            n_relationships += 1
+    assert n_relationships == sum([len(s.relationships) for s in subgraphs])
+    command = writer.import_command()
+    for header_file, data_file in writer.node_files:
+        assert f"--nodes={header_file},{data_file}" in command
+
+
+def test_import_csv_writer_runs(tmp_path):
+    writers = [
+        batch.ImportCSVWriter(str(tmp_path), run_id=run_id)
+        for run_id in ["run1", "run2"]
+    ]
+    node_ids = []
+    for writer in writers:
+        writer.write_subgraph(_subgraph())
+        writer.close()
+        assert "--id-type=string" in writer.import_command()
+        for header_file, data_file in writer.node_files:
+            assert os.path.basename(header_file).startswith(writer.run_id)
+            node_ids += [row[0] for row in _read_csv(data_file)]
+    assert len(node_ids) == len(set(node_ids))
+    assert len(os.listdir(str(tmp_path))) == 2 * sum(
+        [
+            len(writer.node_files) + len(writer.relationship_files)
+            for writer in writers
+        ]
+    )
@@ -0,0 +1,88 @@
+import pytest
+
+import stonpy.cache as cache
+from stonpy.cache import MapCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_disabled_cache():
+    map_cache = MapCache()
+    assert not map_cache.enabled
+    map_cache.put("map1", ("map", "map1"))
+    assert map_cache.get("map1") is None
+    assert len(map_cache) == 0
+
+
+def test_lru_eviction():
+    map_cache = MapCache(maxsize=2)
+    map_cache.put("map1", ("map", "map1"))
+    map_cache.put("map2", ("map", "map2"))
+    assert map_cache.get("map1") == ("map", "map1")
+    map_cache.put("map3", ("map", "map3"))
+    assert map_cache.get("map2") is None
+    assert map_cache.get("map1") == ("map", "map1")
+    assert map_cache.get("map3") == ("map", "map3")
+    assert map_cache.as_dict() == {
+        "size": 2,
+        "maxsize": 2,
+        "hits": 3,
+        "misses": 1,
+        "evictions": 1,
+    }
+    map_cache.reset()
+    assert map_cache.as_dict()["hits"] == 0
+
+
+def test_ttl(clock):
+    map_cache = MapCache(maxsize=2, ttl=10)
+    map_cache.put("map1", ("map", "map1"))
+    clock[0] = 9.0
+    assert map_cache.get("map1") == ("map", "map1")
+    clock[0] = 10.0
+    assert map_cache.get("map1") is None
+    assert map_cache.evictions == 1
+    assert len(map_cache) == 0
+
+
+def test_invalidate():
+    map_cache = MapCache(maxsize=2)
+    map_cache.put("map1", ("map", "map1"))
+    map_cache.invalidate("map1")
+    assert map_cache.get("map1") is None
+    map_cache.invalidate("map2")
+    assert len(map_cache) == 0
+
+
+def test_generation_of_invalidated_map():
+    map_cache = MapCache(maxsize=2)
+    generation = map_cache.generation("map1")
+    map_cache.invalidate("map1")
+    # the map was read before it was invalidated, and may be stale
+    map_cache.put("map1", ("stale map", "map1"), generation)
+    assert map_cache.get("map1") is None
+    map_cache.put("map1", ("map", "map1"), map_cache.generation("map1"))
+    assert map_cache.get("map1") == ("map", "map1")
+
+
+def test_generation_of_other_map():
+    map_cache = MapCache(maxsize=2)
+    generation = map_cache.generation("map1")
+    map_cache.invalidate("map2")
+    map_cache.put("map1", ("map", "map1"), generation)
+    assert map_cache.get("map1") == ("map", "map1")
+
+
+def test_generation_after_clear():
+    map_cache = MapCache(maxsize=2)
+    map_cache.invalidate("map1")
+    generation = map_cache.generation("map1")
+    map_cache.clear()
+    map_cache.put("map1", ("stale map", "map1"), generation)
+    assert map_cache.get("map1") is None
+    assert map_cache.generation("map1") != generation
@@ -0,0 +1,68 @@
+from dataclasses import dataclass
+
+import pytest
+
+import stonpy.cli as cli
+import stonpy.core
+from stonpy.core import STON
+from stonpy.memory import MemoryGraph
+
+from sbgn_maps import EXAMPLE_MAP
+
+
+@dataclass
+class _OtherTarget(cli.Target):
+    def make(self, ston, make_map_membership=False):
+        pass
+
+
+@pytest.fixture
+def writer_ston(monkeypatch):
+    # the writers of make_targets_parallel connect to a memory graph
+    ston = STON(graph=MemoryGraph())
+    monkeypatch.setattr(
+        stonpy.core, "STON", lambda uri=None, user=None, password=None: ston
+    )
+    return ston
+
+
+def test_collect_sbgnml_targets(capsys):
+    sbgnml_target = cli.SBGNMLFileTarget(EXAMPLE_MAP, "map1")
+    other_target = _OtherTarget("other.txt", "other")
+    assert list(cli.collect_sbgnml_targets(sbgnml_target)) == [sbgnml_target]
+    assert list(cli.collect_sbgnml_targets(other_target)) == []
+    assert "skipping target" in capsys.readouterr().out
+
+
+def test_make_targets_parallel(writer_ston):
+    targets = [
+        cli.SBGNMLFileTarget(EXAMPLE_MAP, f"map{i}") for i in range(3)
+    ]
+    cli.make_targets_parallel(targets, None, None, None, workers=2)
+    for i in range(3):
+        assert writer_ston.has_map(f"map{i}")
+
+
+def test_make_targets_parallel_errors(writer_ston, monkeypatch, tmp_path):
+    create_map_rows = STON.create_map_rows
+
+    def failing_create_map_rows(self, map_id, *args, **kwargs):
+        if map_id == "unwritable":
+            raise RuntimeError("could not write map")
+        return create_map_rows(self, map_id, *args, **kwargs)
+
+    monkeypatch.setattr(STON, "create_map_rows", failing_create_map_rows)
+    missing_path = str(tmp_path / "missing.sbgn")
+    targets = [
+        cli.SBGNMLFileTarget(missing_path, "missing"),
+        cli.SBGNMLFileTarget(EXAMPLE_MAP, "unwritable"),
+        cli.SBGNMLFileTarget(EXAMPLE_MAP, "map1"),
+    ]
+    with pytest.raises(cli.TargetsError) as excinfo:
+        cli.make_targets_parallel(targets, None, None, None, workers=2)
+    errors = dict(excinfo.value.errors)
+    assert sorted(errors) == sorted([missing_path, EXAMPLE_MAP])
+    assert isinstance(errors[EXAMPLE_MAP], RuntimeError)
+    assert missing_path in str(excinfo.value)
+    assert writer_ston.has_map("map1")
+    assert not writer_ston.has_map("unwritable")
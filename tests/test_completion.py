@@ -0,0 +1,228 @@
+"""Tests of the completion.
+
+The expected completions (`data/completions.json`) were computed with the
+recursive completion of stonpy 0.2.1, and hold, for each map and each node
+of the map with an SBGN ID, the digest of the completion of the node (see
+:func:`completion_digest`), or `null` if that completion failed (e.g. for
+annotations, which it had no rule for).
+"""
+
+import hashlib
+import json
+import os.path
+
+import pytest
+
+from py2neo import Subgraph
+
+import stonpy.completion as completion
+from stonpy.completion import CompletionBudget, CompletionWorklist
+from stonpy.core import STON
+from stonpy.memory import MemoryGraph
+from stonpy.model import STONEnum
+
+from sbgn_maps import (
+    EXAMPLE_MAP,
+    TEST_MAPS_DIRECTORY,
+    convertible_maps,
+    load_map,
+    map_name,
+)
+
+COMPLETIONS_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "completions.json"
+)
+MAPS = [EXAMPLE_MAP] + convertible_maps()
+
+_ID = STONEnum["ID"].value
+_FINGERPRINT = STONEnum["FINGERPRINT"].value
+
+
+def completion_map_name(path):
+    if path == EXAMPLE_MAP:
+        return "example/insulin.sbgn"
+    return map_name(path)
+
+
+def _node_key(node):
+    # fingerprints depend on the canonical form of maps, not on the
+    # completion
+    properties = sorted(
+        [(key, value) for key, value in node.items() if key != _FINGERPRINT]
+    )
+    return repr((sorted(node.labels), properties))
+
+
+def completion_digest(subgraph):
+    """Return a digest of a subgraph that does not depend on the identities
+    of its nodes and relationships."""
+    nodes = sorted([_node_key(node) for node in subgraph.nodes])
+    relationships = sorted(
+        [
+            repr(
+                (
+                    type(relationship).__name__,
+                    _node_key(relationship.start_node),
+                    _node_key(relationship.end_node),
+                    sorted(relationship.items()),
+                )
+            )
+            for relationship in subgraph.relationships
+        ]
+    )
+    return hashlib.sha256(repr((nodes, relationships)).encode()).hexdigest()[
+        :16
+    ]
+
+
+def seed_nodes(graph):
+    """Return the nodes of a graph with an SBGN ID, by ID."""
+    return {
+        node[_ID]: node
+        for node in graph.match_nodes()
+        if node[_ID] is not None and STONEnum["MAP"].value not in node.labels
+    }
+
+
+def map_graph(path):
+    graph = MemoryGraph()
+    STON(graph=graph).create_map(load_map(path), "map1")
+    return graph
+
+
+def completions(graph, complete_subgraph):
+    """Return the digests of the completions of the seed nodes of a graph,
+    with and without the modulations of processes; the digest of a failed
+    completion is `None`."""
+    digests = {}
+    for sbgn_id, node in sorted(seed_nodes(graph).items()):
+        for complete_process_modulations in [False, True]:
+            key = sbgn_id
+            if complete_process_modulations:
+                key = f"{sbgn_id} (modulations)"
+            try:
+                subgraph = complete_subgraph(
+                    Subgraph([node]), graph, complete_process_modulations
+                )
+            except Exception:
+                digests[key] = None
+            else:
+                digests[key] = completion_digest(subgraph)
+    return digests
+
+
+# not a test, despite its name
+completion_map_name.__test__ = False
+
+
+@pytest.fixture(scope="module")
+def expected_completions():
+    with open(COMPLETIONS_FILE) as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize(
+    "path", MAPS, ids=[completion_map_name(path) for path in MAPS]
+)
+def test_complete_subgraph(path, expected_completions):
+    graph = map_graph(path)
+    expected = expected_completions[completion_map_name(path)]
+    assert completions(graph, completion.complete_subgraph) == expected
+
+
+def test_complete_subgraph_with_memo():
+    graph = map_graph(EXAMPLE_MAP)
+    memo = completion.CompletionMemo()
+    expected = completions(graph, completion.complete_subgraph)
+
+    def complete_subgraph(subgraph, graph, complete_process_modulations):
+        return completion.complete_subgraph(
+            subgraph, graph, complete_process_modulations, memo=memo
+        )
+
+    assert completions(graph, complete_subgraph) == expected
+    assert len(memo) > 0
+
+
+def test_complete_subgraph_with_descendants():
+    graph = map_graph(EXAMPLE_MAP)
+    (map_node,) = graph.match_nodes(STONEnum["MAP"].value)
+    subgraph = completion.complete_subgraph_with_descendants(
+        Subgraph([map_node]), graph
+    )
+    assert len(subgraph.nodes) == graph.node_count
+    assert len(subgraph.relationships) == graph.relationship_count
+
+
+def test_completion_worklist():
+    graph = map_graph(EXAMPLE_MAP)
+    node = seed_nodes(graph)["glyph2"]
+    worklist = CompletionWorklist(Subgraph([node]), [])
+    assert worklist
+    assert worklist.pending() == [node.identity]
+    layers = 0
+    while worklist:
+        queues = worklist.next_lookups()
+        assert not worklist.pending()
+        results = {}
+        for r_types, identities in queues.items():
+            for identity in identities:
+                looked_up = graph.get_node(identity)
+                results[(identity, r_types)] = [
+                    (relationship, relationship.end_node)
+                    if relationship.start_node == looked_up
+                    else (relationship, relationship.start_node)
+                    for relationship in graph.match((looked_up, None))
+                    + graph.match((None, looked_up))
+                    if type(relationship).__name__ in r_types
+                ]
+        worklist.add_results(results)
+        layers += 1
+    assert layers > 1
+    expected = completion.complete_subgraph(Subgraph([node]), graph)
+    assert worklist.result.nodes == set(expected.nodes)
+    assert worklist.result.relationships == set(expected.relationships)
+
+
+def test_completion_worklist_max_nodes():
+    graph = map_graph(EXAMPLE_MAP)
+    node = seed_nodes(graph)["glyph24"]
+    budget = CompletionBudget(max_nodes=5)
+    subgraph = completion.complete_subgraph(
+        Subgraph([node]), graph, budget=budget
+    )
+    assert len(subgraph.nodes) <= 5
+    (truncation,) = budget.truncations
+    assert truncation.reason == "max_nodes"
+    assert truncation.nodes == len(subgraph.nodes)
+    assert truncation.dropped > 0
+
+
+def test_completion_budget_max_round_trips():
+    graph = map_graph(EXAMPLE_MAP)
+    node = seed_nodes(graph)["glyph24"]
+    full = completion.complete_subgraph(Subgraph([node]), graph)
+    budget = CompletionBudget(max_round_trips=1)
+    subgraph = completion.complete_subgraph(
+        Subgraph([node]), graph, budget=budget
+    )
+    (truncation,) = budget.truncations
+    assert truncation.reason == "max_round_trips"
+    assert truncation.round_trips >= 1
+    assert truncation.uncompleted
+    assert set(subgraph.nodes) < set(full.nodes)
+
+
+def test_completion_budget_not_reached():
+    graph = map_graph(EXAMPLE_MAP)
+    node = seed_nodes(graph)["glyph24"]
+    budget = CompletionBudget(
+        max_nodes=graph.node_count, max_round_trips=1000, max_time=60
+    )
+    subgraph = completion.complete_subgraph(
+        Subgraph([node]), graph, budget=budget
+    )
+    assert not budget.truncations
+    assert completion_digest(subgraph) == completion_digest(
+        completion.complete_subgraph(Subgraph([node]), graph)
+    )
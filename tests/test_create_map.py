@@ -0,0 +1,65 @@
+import pytest
+
+import stonpy.batch as batch
+import stonpy.conversion as conversion
+import stonpy.core as core
+import stonpy.queries as queries
+import stonpy.utils as utils
+
+from sbgn_maps import EXAMPLE_MAP, TEST_MAPS, load_map, map_name, map_params
+
+
+def has_fingerprint(ston, sbgn_map, map_id):
+    return queries.evaluate(
+        ston.graph,
+        "count_maps_by_fingerprint",
+        {"fingerprint": utils.map_fingerprint(sbgn_map), "map_id": map_id},
+    )
+
+
+@pytest.mark.parametrize(
+    "path", TEST_MAPS, ids=[map_name(path) for path in TEST_MAPS]
+)
+def test_map_fingerprint(path):
+    # the canonical form can be built even for the maps that the conversion
+    # does not support
+    assert utils.map_fingerprint_or_none(load_map(path)) is not None
+
+
+@pytest.mark.parametrize("bulk", [False, True], ids=["create", "bulk"])
+@pytest.mark.parametrize("path", map_params())
+def test_create_map(ston, path, bulk):
+    sbgn_map = load_map(path)
+    ston.create_map(sbgn_map, "map1", bulk=bulk)
+    assert ston.has_map("map1")
+    assert has_fingerprint(ston, sbgn_map, "map1") == 1
+    assert ston.has_map(map_id="map1", sbgn_map=sbgn_map)
+    assert not ston.has_map(map_id="map2", sbgn_map=sbgn_map)
+
+
+@pytest.mark.parametrize("path", map_params())
+def test_map_to_rows(tmp_path, path):
+    sbgn_map = load_map(path)
+    node_rows, relationship_rows = core.map_to_rows(sbgn_map, "map1")
+    assert node_rows
+    writer = batch.ImportCSVWriter(str(tmp_path))
+    writer.write_subgraph(conversion.map_to_subgraph(sbgn_map, "map1"))
+    writer.close()
+
+
+def test_create_map_without_fingerprint(ston, monkeypatch):
+    def map_fingerprint(sbgnmap):
+        raise ValueError("no canonical form")
+
+    sbgn_map = load_map(EXAMPLE_MAP)
+    monkeypatch.setattr(utils, "map_fingerprint", map_fingerprint)
+    ston.create_map(sbgn_map, "map1")
+    assert (
+        queries.evaluate(
+            ston.graph, "count_maps_without_fingerprint", {"map_id": "map1"}
+        )
+        == 1
+    )
+    assert ston.has_map(sbgn_map=sbgn_map)
+    assert ston.has_map(map_id="map1", sbgn_map=sbgn_map)
+    assert not ston.has_map(map_id="map2", sbgn_map=sbgn_map)
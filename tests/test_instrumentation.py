@@ -0,0 +1,35 @@
+import stonpy.instrumentation as instrumentation
+from stonpy.instrumentation import CallReport, Instrumentation
+
+
+def test_call_report():
+    report = CallReport("query_to_map")
+    with report.phase("query"):
+        instrumentation.count_round_trip(records=3)
+        instrumentation.count_records(2)
+    with report.phase("completion"):
+        instrumentation.count_round_trip()
+        instrumentation.count_round_trip()
+    # outside of a phase, nothing is counted
+    instrumentation.count_round_trip(records=10)
+    report.finish()
+    report_dict = report.as_dict()
+    assert report_dict["name"] == "query_to_map"
+    assert report_dict["round_trips"] == {"query": 1, "completion": 2}
+    assert report_dict["records"] == {"query": 5, "completion": 0}
+    assert set(report_dict["times"]) == {"query", "completion"}
+    assert report_dict["total"] >= sum(report_dict["times"].values())
+
+
+def test_phase_without_report():
+    with instrumentation.phase(None, "query"):
+        instrumentation.count_round_trip()
+
+
+def test_instrumentation_callback():
+    reports = []
+    collector = Instrumentation(reports.append)
+    report = CallReport("get_map")
+    collector.add(report)
+    assert collector.reports == [report]
+    assert reports == [report]
@@ -0,0 +1,103 @@
+import pytest
+
+from py2neo import Node, Relationship, Subgraph
+
+import stonpy.queries as queries
+from stonpy.memory import MemoryGraph
+
+
+@pytest.fixture
+def graph():
+    graph = MemoryGraph()
+    a = Node("Glyph", "Macromolecule", id="a")
+    b = Node("Glyph", id="b")
+    c = Node("Bbox", x=1.0)
+    graph.create(
+        Subgraph(
+            [a, b, c],
+            [
+                Relationship(a, "HAS_GLYPH", b),
+                Relationship(a, "HAS_BBOX", c),
+                Relationship(b, "HAS_BBOX", c),
+            ],
+        )
+    )
+    return graph
+
+
+def _node(graph, sbgn_id):
+    (node,) = graph.match_nodes(id=sbgn_id)
+    return node
+
+
+def test_create(graph):
+    assert graph.node_count == 3
+    assert graph.relationship_count == 3
+    for node in graph.match_nodes():
+        assert node.graph is graph
+        assert graph.get_node(node.identity) is node
+    # creating bound entities again has no effect
+    graph.create(Subgraph(graph.match_nodes(), graph.match()))
+    assert graph.node_count == 3
+    assert graph.relationship_count == 3
+
+
+def test_match_nodes(graph):
+    assert len(graph.match_nodes("Glyph")) == 2
+    macromolecules = graph.match_nodes("Glyph", "Macromolecule")
+    assert [node["id"] for node in macromolecules] == ["a"]
+    assert [node["id"] for node in graph.match_nodes("Glyph", id="b")] == ["b"]
+    assert graph.match_nodes("Arc") == []
+
+
+def test_match(graph):
+    a = _node(graph, "a")
+    b = _node(graph, "b")
+    assert len(graph.match((a, None))) == 2
+    assert len(graph.match((a, None), "HAS_BBOX")) == 1
+    assert len(graph.match((None, b))) == 1
+    assert len(graph.match((a, b))) == 1
+    assert len(graph.match(r_type="HAS_BBOX")) == 2
+    assert len(graph.match(limit=1)) == 1
+    relationship = graph.match_one((a, None), "HAS_GLYPH")
+    assert relationship.end_node == b
+    assert graph.match_one((b, None), "HAS_GLYPH") is None
+
+
+def test_transaction(graph):
+    tx = graph.begin(readonly=True)
+    a = _node(graph, "a")
+    assert tx.match_one((a, None), "HAS_GLYPH") is not None
+    assert tx.evaluate(queries.get_query("match_map"), {"map_id": "x"}) is None
+    tx.commit()
+
+
+def test_delete_nodes(graph):
+    a = _node(graph, "a")
+    queries.run(graph, "delete_nodes", {"identities": [a.identity]})
+    assert graph.node_count == 2
+    assert graph.relationship_count == 1
+    assert graph.get_node(a.identity) is None
+    graph.delete_all()
+    assert graph.node_count == 0
+    assert graph.relationship_count == 0
+
+
+def test_register_query(graph):
+    query = "MATCH (g:Glyph) RETURN g.id AS id"
+    with pytest.raises(ValueError):
+        graph.run(query)
+    graph.register_query(
+        query,
+        lambda graph, parameters: (
+            ["id"],
+            [[node["id"]] for node in graph.match_nodes("Glyph")],
+        ),
+    )
+    assert sorted([record["id"] for record in graph.run(query)]) == ["a", "b"]
+    assert graph.evaluate(query) in ("a", "b")
+
+
+def test_index_queries_are_ignored(graph):
+    for _, query in queries.get_index_queries():
+        assert graph.run(query) == []
@@ -0,0 +1,44 @@
+import stonpy.queries as queries
+import stonpy.memory as memory
+from stonpy.memory import MemoryGraph
+from stonpy.queries import QueryStatistics
+
+
+def test_query_statistics():
+    statistics = QueryStatistics()
+    statistics.record("match_map", "query1", 1.0)
+    statistics.record("match_map", "query1", 2.0)
+    statistics.record("match_maps_by_glyph", "query2", 0.5)
+    assert statistics.as_dict() == {
+        "repeated_queries": 1,
+        "new_queries": 2,
+        "counts": {"match_map": 2, "match_maps_by_glyph": 1},
+        "times": {"match_map": 3.0, "match_maps_by_glyph": 0.5},
+    }
+    statistics.reset()
+    statistics.record("match_map", "query1", 1.0)
+    assert statistics.new_queries == 1
+    assert statistics.repeated_queries == 0
+
+
+def test_registered_queries():
+    assert set(queries.QUERIES) == set(queries._EXAMPLES)
+    assert set(queries.QUERIES) == set(memory._QUERY_FUNCTIONS)
+
+
+def test_get_query_name():
+    query = queries.get_query("match_maps_by_glyph", labels=":`Glyph`")
+    assert queries.get_query_name(query) == (
+        "match_maps_by_glyph",
+        {"labels": ":`Glyph`"},
+    )
+    assert queries.get_query_name("MATCH (n) RETURN n") is None
+
+
+def test_run_records_statistics():
+    queries.statistics.reset()
+    graph = MemoryGraph()
+    queries.run(graph, "match_map", {"map_id": "map1"})
+    queries.evaluate(graph, "match_map", {"map_id": "map1"})
+    assert queries.statistics.counts["match_map"] == 2
+    assert queries.statistics.repeated_queries == 1
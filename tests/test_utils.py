@@ -0,0 +1,128 @@
+from py2neo import Node, Relationship, Subgraph
+
+import stonpy.utils as utils
+from stonpy.memory import MemoryGraph
+from stonpy.model import STONEnum
+
+from sbgn_maps import EXAMPLE_MAP, load_map
+
+_MAP_MEMBERSHIP = STONEnum["MAP_MEMBERSHIP"].value
+
+
+def _subgraph():
+    a = Node("Glyph", id="a")
+    b = Node("Glyph", id="b")
+    c = Node("Bbox")
+    relationships = [
+        Relationship(a, "HAS_GLYPH", b),
+        Relationship(a, "HAS_BBOX", c),
+        Relationship(b, "HAS_BBOX", c),
+    ]
+    return a, b, c, Subgraph([a, b, c], relationships)
+
+
+def test_subgraph_index():
+    a, b, c, subgraph = _subgraph()
+    index = utils.SubgraphIndex(subgraph)
+    assert len(index) == 3
+    for relationship in subgraph.relationships:
+        assert relationship in index
+    assert len(index.match((a, None))) == 2
+    assert len(index.match((a, None), "HAS_BBOX")) == 1
+    assert len(index.match((None, c))) == 2
+    assert len(index.match((a, c))) == 1
+    assert index.match((b, a)) == []
+    assert len(index.match(rtype="HAS_BBOX")) == 2
+    assert len(index.match()) == 3
+    assert index.match_one((a, None), "HAS_GLYPH").end_node == b
+    assert index.match_one((c, None)) is None
+    d = Node("Label")
+    relationship = Relationship(b, "HAS_LABEL", d)
+    index.add(relationship)
+    index.add(relationship)
+    assert len(index) == 4
+    assert index.match((None, d)) == [relationship]
+
+
+def test_subgraph_accumulator():
+    a, b, c, subgraph = _subgraph()
+    accumulator = utils.SubgraphAccumulator()
+    assert accumulator.to_subgraph() is None
+    accumulator.add_subgraph(subgraph)
+    accumulator.add_subgraph(None)
+    d = Node("Label")
+    accumulator.add(Relationship(b, "HAS_LABEL", d))
+    e = Node("Port")
+    accumulator.add_node(e)
+    result = accumulator.to_subgraph()
+    assert set(result.nodes) == {a, b, c, d, e}
+    assert len(result.relationships) == 4
+    assert accumulator.match_one((b, None), "HAS_LABEL").end_node == d
+
+
+def test_subgraph_accumulator_identities():
+    graph = MemoryGraph()
+    a, b, c, subgraph = _subgraph()
+    graph.create(subgraph)
+    accumulator = utils.SubgraphAccumulator(subgraph)
+    assert accumulator.node(a.identity) is a
+    for relationship in subgraph.relationships:
+        assert accumulator.relationship(relationship.identity) is relationship
+    assert accumulator.node(-1) is None
+
+
+def test_subgraph_digest():
+    graph = MemoryGraph()
+    a, b, c, subgraph = _subgraph()
+    graph.create(subgraph)
+    relationships = list(subgraph.relationships)
+    assert utils.subgraph_digest(subgraph) == utils.subgraph_digest(
+        Subgraph(list(subgraph.nodes)[::-1], relationships[::-1])
+    )
+    assert utils.subgraph_digest(subgraph) != utils.subgraph_digest(
+        Subgraph(subgraph.nodes, relationships[1:])
+    )
+
+
+def test_restrict_subgraph_to_maps():
+    a = Node("Glyph", **{_MAP_MEMBERSHIP: "map1"})
+    b = Node("Glyph", **{_MAP_MEMBERSHIP: "map1"})
+    c = Node("Glyph", **{_MAP_MEMBERSHIP: "map2"})
+    ab = Relationship(a, "HAS_GLYPH", b)
+    subgraph = Subgraph([a, b, c], [ab, Relationship(a, "HAS_GLYPH", c)])
+    restricted = utils.restrict_subgraph_to_maps(subgraph, ["map1"])
+    assert set(restricted.nodes) == {a, b}
+    assert set(restricted.relationships) == {ab}
+    assert utils.restrict_subgraph_to_maps(subgraph, ["map3"]) is None
+    assert utils.restrict_subgraph_to_maps(None, ["map1"]) is None
+
+
+def test_map_fingerprint_ignores_order_and_ids(tmp_path):
+    with open(EXAMPLE_MAP, encoding="utf-8") as f:
+        text = f.read()
+    renamed_file = tmp_path / "renamed.sbgn"
+    renamed_file.write_text(text.replace('"glyph', '"node'), encoding="utf-8")
+    sbgn_map = load_map(EXAMPLE_MAP)
+    renamed_map = load_map(str(renamed_file))
+    renamed_map.glyph.reverse()
+    renamed_map.arc.reverse()
+    fingerprint = utils.map_fingerprint(sbgn_map)
+    assert utils.map_fingerprint(renamed_map) == fingerprint
+    assert utils.are_maps_equal(sbgn_map, renamed_map)
+    labeled_glyphs = [g for g in renamed_map.glyph if g.label is not None]
+    labeled_glyphs[0].label.text = "modified"
+    assert utils.map_fingerprint(renamed_map) != fingerprint
+    assert not utils.are_maps_equal(sbgn_map, renamed_map)
+
+
+def test_map_fingerprint_or_none(monkeypatch):
+    sbgn_map = load_map(EXAMPLE_MAP)
+    assert utils.map_fingerprint_or_none(sbgn_map) == utils.map_fingerprint(
+        sbgn_map
+    )
+
+    def cast_map(sbgnmap):
+        raise KeyError("glyph1")
+
+    monkeypatch.setattr(utils, "cast_map", cast_map)
+    assert utils.map_fingerprint_or_none(sbgn_map) is None